@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Payload size and encode time of a /services response, per representation.
+
+Builds a listing shaped like the gateway's (every fourth service offline)
+and times each encoding the negotiation in common.encoding can pick, against
+Flask's stock jsonify.
+
+    python -m benchmarks.bench_encoding --services 5000
+"""
+import argparse
+import gzip
+import json
+
+import brotli
+import msgpack
+from flask import Flask, jsonify
+
+from benchmarks.bench_metrics import per_call_us
+from common import encoding
+
+
+def listing(services: int):
+    rows = []
+    for i in range(services):
+        name = f"service-{i:05d}"
+        if i % 4 == 0:
+            rows.append({"service": name, "status": "offline", "timestamp": "N/A", "host": "N/A",
+                         "responseTime": None})
+        else:
+            rows.append({"service": name, "status": "online",
+                         "timestamp": f"2024-05-01 12:00:{i % 60:02d}.{i % 1000:03d}",
+                         "host": f"{name}-7d9f8c6b5-{i % 97:05x}", "responseTime": i % 40})
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = listing(args.services)
+    stock = Flask("stock")
+    fast = encoding.use_fast_json(Flask("fast"))
+    json_body = encoding.dumps(rows)
+    packed = msgpack.packb(encoding.columnar(rows), use_bin_type=True)
+
+    def jsonify_with(app):
+        with app.app_context():
+            return jsonify(rows).get_data()
+
+    cases = (
+        ("jsonify (stdlib json)", lambda: jsonify_with(stock)),
+        ("jsonify (orjson)", lambda: jsonify_with(fast)),
+        ("json + gzip", lambda: encoding.compress(encoding.dumps(rows), "gzip")),
+        ("json + br", lambda: encoding.compress(encoding.dumps(rows), "br")),
+        ("msgpack columnar", lambda: encoding.encode(rows, encoding.MSGPACK)),
+        ("msgpack columnar + gzip", lambda: encoding.compress(encoding.encode(rows, encoding.MSGPACK), "gzip")),
+        ("msgpack columnar + br", lambda: encoding.compress(encoding.encode(rows, encoding.MSGPACK), "br")),
+    )
+    assert jsonify_with(stock) == jsonify_with(fast) == json_body
+    assert encoding.rows(msgpack.unpackb(packed)) == rows
+    assert json.loads(gzip.decompress(cases[2][1]())) == rows
+    assert brotli.decompress(cases[3][1]()) == json_body
+
+    print(f"services={args.services}")
+    print(f"{'representation':<26}{'bytes':>10}{'vs json':>9}{'encode ms':>11}")
+    for name, fn in cases:
+        size = len(fn())
+        ms = per_call_us(fn, args.iterations) / 1000
+        print(f"{name:<26}{size:>10}{size / len(json_body):>9.2f}{ms:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Latency of gateway /services as the number of registered services grows.
+
+Consul and the service backends are replaced by an in-process stub session
+that sleeps for the injected delay, so only the gateway's fan-out is measured.
+The gateway runs with its own FANOUT_WORKERS (64 unless set) unless
+``--workers`` says otherwise: past that many services the probes queue, and
+latency grows by one more round of calls per extra wave of them.
+
+    python -m benchmarks.bench_gateway_fanout --delay-ms 50
+"""
+import argparse
+import importlib
+import logging
+import os
+import statistics
+import sys
+import time
+
+
+class StubResponse:
+    def __init__(self, payload):
+        self._payload = payload
+        self.status_code = 200
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        pass
+
+
+def make_stub_get(gw, names, delay):
+    catalog = {name: [] for name in names}
+
+    def stub_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return StubResponse(catalog)
+        time.sleep(delay)
+        if url.startswith(gw.HEALTH_SERVICE):
+            name = url[len(gw.HEALTH_SERVICE):].split("?")[0]
+            return StubResponse([{"Service": {"Address": name, "Port": 5000}}])
+        name = url.split("//")[1].split(":")[0]
+        return StubResponse({"service": name, "timestamp": "2024-01-01 00:00:00.000", "host": name})
+
+    return stub_get
+
+
+def load_gateway(workers: int = 0):
+    if workers:
+        os.environ["FANOUT_WORKERS"] = str(workers)
+    # Every request should fan out, not read the /services cache.
+    os.environ["SERVICES_CACHE_TTL"] = "0"
+    sys.modules.pop("gateway.app", None)
+    gw = importlib.import_module("gateway.app")
+    gw.app.logger.setLevel(logging.WARNING)
+    return gw
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", default="4,25,50,100,200", help="comma-separated service counts")
+    parser.add_argument("--delay-ms", type=float, default=50.0, help="injected delay per Consul/backend call")
+    parser.add_argument("--workers", type=int, default=0, help="FANOUT_WORKERS (default: the gateway's own)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.counts.split(",")]
+    delay = args.delay_ms / 1000.0
+    gw = load_gateway(args.workers)
+    client = gw.app.test_client()
+
+    print(f"workers={gw.FANOUT_WORKERS} delay={args.delay_ms:.0f}ms deadline={gw.SERVICES_DEADLINE}s")
+    print(f"{'services':>8} {'waves':>6} {'median ms':>10} {'max ms':>8} {'serial est. ms':>15}")
+    for n in counts:
+        names = [f"service-{i:04d}" for i in range(n)]
+        gw.SESSION.get = make_stub_get(gw, names, delay)
+        client.get("/services")  # warm the worker threads
+        samples = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            resp = client.get("/services")
+            samples.append((time.perf_counter() - t0) * 1000)
+            assert len(resp.get_json()) == n
+        # Probes beyond FANOUT_WORKERS wait for a free worker: one more round of calls per wave.
+        waves = -(-n // gw.FANOUT_WORKERS)
+        print(f"{n:>8} {waves:>6} {statistics.median(samples):>10.1f} {max(samples):>8.1f} "
+              f"{n * 2 * args.delay_ms:>15.0f}")
+    if max(counts) > gw.FANOUT_WORKERS:
+        print(f"Counts above {gw.FANOUT_WORKERS} run in several waves; size FANOUT_WORKERS to the service "
+              f"count (--workers) for a flat fan-out.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Cost of healthz /report in per-service and bulk mode against a fake Consul.
+
+The fake Consul runs in-process over real HTTP on localhost, so the numbers
+include one round trip per Consul call.
+
+    python -m benchmarks.bench_healthz_report --services 1000
+"""
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+
+from testing.fake_consul import FakeConsul
+
+
+def load_healthz(consul_url: str):
+    host, port = consul_url.rsplit("//", 1)[1].split(":")
+    os.environ.update({"CONSUL_HOST": host, "CONSUL_PORT": port})
+    sys.modules.pop("healthz.app", None)
+    return importlib.import_module("healthz.app")
+
+
+def time_report(client, runs: int):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        resp = client.get("/report")
+        samples.append((time.perf_counter() - t0) * 1000)
+        assert resp.status_code == 200
+    return samples
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=1000)
+    parser.add_argument("--unhealthy-every", type=int, default=7, help="mark every Nth service critical")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeConsul() as consul:
+        for i in range(args.services):
+            status = "critical" if i % args.unhealthy_every == 0 else "passing"
+            consul.register(f"service-{i:05d}", "127.0.0.1", 5000, status=status)
+
+        hz = load_healthz(consul.url)
+        client = hz.app.test_client()
+
+        print(f"services={args.services}")
+        print(f"{'mode':>18} {'consul calls':>13} {'median ms':>10} {'max ms':>8}")
+        reports = {}
+        for mode, ttl in (("per-service", 0.0), ("bulk", 0.0), ("bulk, cached", 60.0)):
+            hz.REPORT_MODE = mode.split(",")[0]
+            hz.REPORT_CACHE_TTL = ttl
+            hz._report_cache["at"] = None
+            client.get("/report")  # warm connections (and the cache, when enabled)
+            before = sum(consul.requests.values())
+            samples = time_report(client, args.runs)
+            calls = (sum(consul.requests.values()) - before) / args.runs
+            reports[mode] = client.get("/report").get_json()
+            print(f"{mode:>18} {calls:>13.0f} {statistics.median(samples):>10.2f} {max(samples):>8.2f}")
+
+        assert reports["per-service"] == reports["bulk"], "bulk and per-service reports differ"
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Service /info: the original jsonify handler vs. the pre-encoded one.
+
+The microbenchmark times the view function alone and a full request through
+the WSGI test client; the load test serves each handler with SERVE_MODE=prod
+in its own process and reports requests/sec.
+
+    python -m benchmarks.bench_info --iterations 100000 --concurrency 32 --duration 10
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+from datetime import datetime
+
+from benchmarks.bench_metrics import per_call_us
+from benchmarks.load_gateway import free_port
+from benchmarks.load_serving import report, wait_up
+
+
+def load_service():
+    os.environ.setdefault("SERVICE_NAME", "bench-info")
+    import service.app as svc
+    from flask import jsonify
+
+    def legacy_info():
+        return jsonify({
+            "service": svc.SERVICE_NAME,
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            "host": socket.gethostname()
+        })
+
+    return svc, legacy_info
+
+
+def serve_handler(handler: str, port: int) -> None:
+    from common import serving
+    svc, legacy_info = load_service()
+    if handler == "legacy":
+        svc.app.view_functions["info"] = legacy_info
+    # Forked after the parent imported common.serving, so the env var is too late.
+    serving.SERVE_MODE = "prod"
+    serving.serve(svc.app, "127.0.0.1", port)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--skip-load", action="store_true", help="microbenchmark only")
+    args = parser.parse_args()
+
+    svc, legacy_info = load_service()
+    client = svc.app.test_client()
+    print(f"{'handler':<10}{'view us':>10}{'request us':>12}")
+    for name, view in (("legacy", legacy_info), ("fast", svc.info)):
+        svc.app.view_functions["info"] = view
+        with svc.app.app_context():
+            view_us = per_call_us(view, args.iterations)
+        request_us = per_call_us(lambda: client.get("/info"), args.iterations // 10)
+        print(f"{name:<10}{view_us:>10.2f}{request_us:>12.1f}")
+    if args.skip_load:
+        return 0
+
+    ctx = multiprocessing.get_context("fork")
+    print(f"\nconcurrency={args.concurrency} duration={args.duration}s cpus={os.cpu_count()} "
+          f"workers={os.getenv('WEB_WORKERS', 'auto')}")
+    print(f"{'target':>18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for handler in ("legacy", "fast"):
+        port = free_port()
+        proc = ctx.Process(target=serve_handler, args=(handler, port), daemon=True)
+        proc.start()
+        try:
+            url = f"http://127.0.0.1:{port}/info"
+            wait_up(url)
+            report(f"/info {handler}", url, args.concurrency, args.duration)
+        finally:
+            proc.terminate()
+            proc.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Cost of recording a probe latency, and of reading percentiles back, with 10k instances.
+
+Fills a LatencyHistory the way the gateway's probes do (round-robin over
+``--instances`` backends, 5% failures) and reports the per-sample insert
+cost, the cost of one service's p50/p90/p99 over a window, and the memory
+the ring buffers take.
+
+    python -m benchmarks.bench_latency --instances 10000
+"""
+import argparse
+import random
+import tracemalloc
+
+from benchmarks.bench_metrics import per_call_us
+from gateway.latency import LatencyHistory
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instances", type=int, default=10_000)
+    parser.add_argument("--capacity", type=int, default=128)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    keys = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}:5000" for i in range(args.instances)]
+    samples = [(random.expovariate(1 / 20), random.random() > 0.05) for _ in range(4096)]  # nosec B311
+    tracemalloc.start()
+    history = LatencyHistory(capacity=args.capacity, max_instances=args.instances)
+    for _ in range(args.capacity):
+        for key, (ms, ok) in zip(keys, samples * (len(keys) // len(samples) + 1)):
+            history.record(key, ms, ok)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    state = {"i": 0}
+
+    def insert():
+        i = state["i"] = state["i"] + 1
+        ms, ok = samples[i & 4095]
+        history.record(keys[i % len(keys)], ms, ok)
+
+    service = keys[:3]
+    print(f"instances={args.instances} capacity={args.capacity}")
+    print(f"{'insert, per sample':<40}{per_call_us(insert, args.iterations):>9.2f} us")
+    print(f"{'p50/p90/p99 of 3 instances, full window':<40}"
+          f"{per_call_us(lambda: history.summary(service, 3600), 10_000):>9.2f} us")
+    print(f"{'ring buffers':<40}{history.stats['bytes'] / 2**20:>9.1f} MiB ({traced / 2**20:.1f} MiB in all)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Per-observation cost of common.metrics on the request hot path.
+
+    python -m benchmarks.bench_metrics --iterations 1000000
+"""
+import argparse
+import time
+
+from common import metrics
+
+
+def per_call_us(fn, iterations: int) -> float:
+    t0 = time.perf_counter_ns()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter_ns() - t0) / iterations / 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    hist = metrics.Histogram("bench_seconds", "bench", ("target",), registry=None)
+    counter = metrics.Counter("bench_total", "bench", ("target",), registry=None)
+
+    def observe():
+        hist.labels("consul_health").observe(0.0042)
+
+    def inc():
+        counter.labels("consul_health").inc()
+
+    def track():
+        with metrics.track("bench"):
+            pass
+
+    def baseline():
+        pass
+
+    base = per_call_us(baseline, args.iterations)
+    print(f"{'operation':<28}{'us/call':>10}")
+    for name, fn in (("histogram.labels().observe", observe), ("counter.labels().inc", inc),
+                     ("track() block", track)):
+        print(f"{name:<28}{per_call_us(fn, args.iterations) - base:>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Reverse proxy throughput and latency: /svc/<name>/... through the gateway vs. the upstream directly.
+
+Two stub upstreams (testing/fake_upstream.py) are registered in a fake
+Consul as one service; the gateway runs with SERVE_MODE=prod and the catalog
+watcher, so each proxied request costs an in-memory lookup, a balancer pick
+and a pooled upstream connection.
+
+    python -m benchmarks.bench_proxy --concurrency 32 --duration 10 --size 1024
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+import urllib.request
+
+from benchmarks.load_gateway import free_port, load, percentile, run_gateway
+
+
+def run_upstreams(consul_port: int, upstream_ports) -> None:
+    from testing.fake_consul import FakeConsul
+    from testing.fake_upstream import FakeUpstream
+
+    consul = FakeConsul(port=consul_port).start()
+    for n, port in enumerate(upstream_ports):
+        FakeUpstream(port=port, name=f"echo-{n}").start()
+        consul.register("service-echo", "127.0.0.1", port, service_id=f"service-echo-{n}")
+    while True:
+        time.sleep(3600)
+
+
+def wait_ok(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2) as r:  # nosec B310
+                if r.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} never answered")
+
+
+def report(label: str, url: str, concurrency: int, duration: float) -> None:
+    latencies, errors, elapsed = asyncio.run(load(url, concurrency, duration))
+    latencies.sort()
+    if not latencies:
+        print(f"{label:>10} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {errors:>7}")
+        return
+    print(f"{label:>10} {len(latencies) / elapsed:>8.0f} {percentile(latencies, 0.5) * 1000:>8.2f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {errors:>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--size", type=int, default=1024, help="response body bytes")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("fork")
+    consul_port, gateway_port = free_port(), free_port()
+    upstream_ports = [free_port(), free_port()]
+    stubs = ctx.Process(target=run_upstreams, args=(consul_port, upstream_ports), daemon=True)
+    stubs.start()
+    gateway = ctx.Process(target=run_gateway, args=("prod", gateway_port, f"http://127.0.0.1:{consul_port}"),
+                          daemon=True)
+    gateway.start()
+
+    path = f"/bytes/{args.size}"
+    print(f"size={args.size}B concurrency={args.concurrency} duration={args.duration}s cpus={os.cpu_count()}")
+    print(f"{'target':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        direct = f"http://127.0.0.1:{upstream_ports[0]}{path}"
+        proxied = f"http://127.0.0.1:{gateway_port}/svc/service-echo{path}"
+        wait_ok(direct)
+        wait_ok(proxied)
+        report("direct", direct, args.concurrency, args.duration)
+        report("proxied", proxied, args.concurrency, args.duration)
+    finally:
+        gateway.terminate()
+        stubs.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Filtered /services lookups on a synthetic catalog: index lookups vs. scanning the catalog.
+
+Builds a catalog of ``--services`` names spread over teams (a tag each), a
+few shared tags and an ``env`` meta key, indexes it the way the catalog
+watcher does, and times the selections /services makes for a page of
+``--limit`` services against the list comprehension that would do the same
+over every service.
+
+    python -m benchmarks.bench_service_query --services 100000
+"""
+import argparse
+import time
+
+from benchmarks.bench_metrics import per_call_us
+from gateway.index import ServiceIndex
+
+TEAMS = 50
+
+
+def catalog(services: int):
+    tags, meta = {}, {}
+    for i in range(services):
+        name = f"service-t{i % TEAMS:02d}-{i:06d}"
+        tags[name] = [f"team-{i % TEAMS:02d}"] + (["web"] if i % 3 == 0 else []) + (["rare"] if i % 997 == 0 else [])
+        meta[name] = {("env", "prod" if i % 4 else "dev")}
+    return tags, meta
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    tags, meta = catalog(args.services)
+    t0 = time.perf_counter()
+    index = ServiceIndex.from_catalog(tags, meta=True)
+    for name, pairs in meta.items():
+        index.set_meta(name, pairs)
+    build_ms = (time.perf_counter() - t0) * 1000
+    rows = [(name, set(tags[name]), dict(meta[name])) for name in sorted(tags)]
+    middle = sorted(tags)[args.services // 2]
+    limit = args.limit
+
+    def scan(keep):
+        return [name for name, t, m in rows if keep(name, t, m)][:limit]
+
+    cases = (
+        ("prefix (one team)", lambda: index.select("service-t07-", limit=limit),
+         lambda: scan(lambda n, t, m: n.startswith("service-t07-"))),
+        ("prefix, deep cursor", lambda: index.select("service-t07-", after="service-t07-050000", limit=limit),
+         lambda: scan(lambda n, t, m: n.startswith("service-t07-") and n > "service-t07-050000")),
+        ("tag (1/50)", lambda: index.select(tags=["team-07"], limit=limit),
+         lambda: scan(lambda n, t, m: "team-07" in t)),
+        ("tag (1/3)", lambda: index.select(tags=["web"], limit=limit),
+         lambda: scan(lambda n, t, m: "web" in t)),
+        ("rare tag, no limit", lambda: index.select(tags=["rare"]),
+         lambda: [n for n, t, m in rows if "rare" in t]),
+        ("tag + meta", lambda: index.select(tags=["team-07", "web"], meta=[("env", "prod")], limit=limit),
+         lambda: scan(lambda n, t, m: {"team-07", "web"} <= t and m.get("env") == "prod")),
+        ("cursor page", lambda: index.select(after=middle, limit=limit),
+         lambda: scan(lambda n, t, m: n > middle)),
+    )
+    for _, indexed, scanned in cases:
+        assert indexed() == scanned()
+
+    print(f"services={args.services} limit={limit} index build={build_ms:.0f}ms")
+    print(f"{'selection':<22}{'matches':>9}{'index us':>11}{'scan us':>11}")
+    for name, indexed, scanned in cases:
+        print(f"{name:<22}{len(indexed()):>9}{per_call_us(indexed, args.iterations):>11.1f}"
+              f"{per_call_us(scanned, max(1, args.iterations // 200)):>11.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
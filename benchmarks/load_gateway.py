@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Load test: requests/sec and latency of gateway /services, Flask vs ASGI.
+
+Each gateway runs in its own process against the same fake Consul and fake
+backends (another process), with the catalog watcher enabled, so a request
+costs one /info probe per registered service. The Flask gateway's /services
+cache is turned off (SERVICES_CACHE_TTL=0); gateway/asgi.py has none, so the
+two do the same work per request.
+
+    python -m benchmarks.load_gateway --services 20 --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+import aiohttp
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_stubs(consul_port: int, backend_port: int, services: int, delay: float) -> None:
+    from testing.fake_backend import FakeBackend
+    from testing.fake_consul import FakeConsul
+
+    FakeBackend(port=backend_port, delay=delay).start()
+    consul = FakeConsul(port=consul_port).start()
+    for i in range(services):
+        consul.register(f"service-{i:04d}", "127.0.0.1", backend_port)
+    while True:
+        time.sleep(3600)
+
+
+def run_gateway(impl: str, port: int, consul_url: str, cache_ttl: float = 0) -> None:
+    logging.disable(logging.WARNING)
+    if impl == "prod":
+        os.environ["SERVE_MODE"] = "prod"
+    host, consul_port = consul_url.rsplit("//", 1)[1].split(":")
+    os.environ.update({"CONSUL_HOST": host, "CONSUL_PORT": consul_port, "SERVICES_CACHE_TTL": str(cache_ttl)})
+    import flask.cli
+    import gateway.app as core
+    if impl == "flask":
+        flask.cli.show_server_banner = lambda *args: None
+        core.start_watchers()
+        core.app.run(host="127.0.0.1", port=port, threaded=True)
+    elif impl == "prod":
+        from common.serving import serve
+        serve(core.app, "127.0.0.1", port, on_worker_start=core.start_watchers)
+    else:
+        import uvicorn
+        from gateway import asgi
+        uvicorn.run(asgi.app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+
+
+async def wait_ready(url: str, services: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as client:
+        while time.monotonic() < deadline:
+            try:
+                async with client.get(url, timeout=aiohttp.ClientTimeout(total=5)) as r:
+                    data = await r.json()
+                if len(data) == services and all(d["status"] == "online" for d in data):
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} never became ready")
+
+
+async def load(url: str, concurrency: int, duration: float):
+    latencies, errors = [], 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10)) as client:
+        stop_at = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < stop_at:
+                t0 = time.perf_counter()
+                try:
+                    async with client.get(url) as r:
+                        r.raise_for_status()
+                        await r.read()
+                    latencies.append(time.perf_counter() - t0)
+                except Exception:
+                    errors += 1
+
+        t0 = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - t0
+    return latencies, errors, elapsed
+
+
+def percentile(sorted_values, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--backend-delay-ms", type=float, default=5.0)
+    parser.add_argument("--impl", default="flask,asgi")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("fork")
+    consul_port, backend_port = free_port(), free_port()
+    procs = [ctx.Process(target=run_stubs, daemon=True,
+                         args=(consul_port, backend_port, args.services, args.backend_delay_ms / 1000))]
+    procs[0].start()
+    consul_url = f"http://127.0.0.1:{consul_port}"
+
+    print(f"services={args.services} concurrency={args.concurrency} duration={args.duration}s "
+          f"backend delay={args.backend_delay_ms}ms cpus={os.cpu_count()}")
+    print(f"{'impl':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for impl in args.impl.split(","):
+            port = free_port()
+            proc = ctx.Process(target=run_gateway, args=(impl, port, consul_url), daemon=True)
+            proc.start()
+            procs.append(proc)
+            url = f"http://127.0.0.1:{port}/services"
+            asyncio.run(wait_ready(url, args.services))
+            latencies, errors, elapsed = asyncio.run(load(url, args.concurrency, args.duration))
+            proc.terminate()
+            latencies.sort()
+            if not latencies:
+                print(f"{impl:>6} {'-':>8} {'-':>8} {'-':>8} {errors:>7}")
+                continue
+            print(f"{impl:>6} {len(latencies) / elapsed:>8.0f} {statistics.median(latencies) * 1000:>8.1f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Throughput of service /info and gateway /services: dev server vs. SERVE_MODE=prod.
+
+The gateways come from load_gateway.run_gateway, so /services runs uncached and
+every request probes the backends.
+
+    python -m benchmarks.load_serving --concurrency 32 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.load_gateway import free_port, load, percentile, run_gateway, run_stubs, wait_ready
+
+
+def wait_up(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):  # nosec B310
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} never came up")
+
+
+def report(label: str, url: str, concurrency: int, duration: float) -> None:
+    latencies, errors, elapsed = asyncio.run(load(url, concurrency, duration))
+    latencies.sort()
+    if not latencies:
+        print(f"{label:>18} {'-':>8} {'-':>8} {'-':>8} {errors:>7}")
+        return
+    print(f"{label:>18} {len(latencies) / elapsed:>8.0f} {statistics.median(latencies) * 1000:>8.1f} "
+          f"{percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", type=int, default=4, help="services behind the gateway")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=0, help="WEB_WORKERS for prod mode")
+    args = parser.parse_args()
+    if args.workers:
+        os.environ["WEB_WORKERS"] = str(args.workers)
+
+    ctx = multiprocessing.get_context("fork")
+    consul_port, backend_port = free_port(), free_port()
+    stubs = ctx.Process(target=run_stubs, args=(consul_port, backend_port, args.services, 0.005), daemon=True)
+    stubs.start()
+    consul_url = f"http://127.0.0.1:{consul_port}"
+
+    print(f"concurrency={args.concurrency} duration={args.duration}s cpus={os.cpu_count()} "
+          f"workers={os.getenv('WEB_WORKERS', 'auto')}")
+    print(f"{'target':>18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        for mode in ("dev", "prod"):
+            port = free_port()
+            env = dict(os.environ, SERVE_MODE=mode, SERVICE_NAME="bench-info", SERVICE_PORT=str(port),
+                       BIND_HOST="127.0.0.1", CONSUL_HOST="127.0.0.1", CONSUL_PORT=str(consul_port))
+            proc = subprocess.Popen([sys.executable, "-m", "service.app"], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f"http://127.0.0.1:{port}/info"
+                wait_up(url)
+                report(f"/info {mode}", url, args.concurrency, args.duration)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+        for mode, impl in (("dev", "flask"), ("prod", "prod")):
+            port = free_port()
+            proc = ctx.Process(target=run_gateway, args=(impl, port, consul_url), daemon=True)
+            proc.start()
+            try:
+                url = f"http://127.0.0.1:{port}/services"
+                asyncio.run(wait_ready(url, args.services))
+                report(f"/services {mode}", url, args.concurrency, args.duration)
+            finally:
+                proc.terminate()
+                proc.join()
+    finally:
+        stubs.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
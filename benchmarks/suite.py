@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Load-test suite over the whole discovery path, offline, with JSON results.
+
+One process runs a fake Consul (catalog, health, blocking queries, register)
+and ``--backends`` fake service backends with ``--backend-delay-ms`` latency
+and a ``--failure-rate`` share of 500s; services are spread over them. Each
+scenario then starts the real app the way the images do (SERVE_MODE=prod)
+and drives it over HTTP:
+
+- ``info``: service /info
+- ``gateway``: gateway /services, one probe per service (catalog watcher on,
+  /services cache off)
+- ``gateway-cached``: the same with the /services cache at ``--cache-ttl``
+  seconds, so most requests are answered from it
+- ``healthz``: healthz /report from its Consul-fed model
+
+Every scenario reports requests/sec and p50/p95/p99 latency. ``--output``
+saves them as JSON; ``--baseline`` compares against an earlier file and exits
+1 when a scenario lost more than ``--tolerance`` of its throughput or its p99
+grew by more than that, so the suite can gate performance changes.
+
+    python -m benchmarks.suite --duration 10 --output results.json
+    python -m benchmarks.suite --duration 10 --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.load_gateway import free_port, load, percentile, run_gateway
+from benchmarks.load_serving import wait_up
+
+SCENARIOS = ("info", "gateway", "gateway-cached", "healthz")
+
+
+def run_cluster(consul_port: int, backend_ports, services: int, delay: float, failure_rate: float) -> None:
+    from testing.fake_backend import FakeBackend
+    from testing.fake_consul import FakeConsul
+
+    # Apps stopped between scenarios drop their blocking queries; keep the tracebacks out of the table.
+    sys.stderr = open(os.devnull, "w")
+    for port in backend_ports:
+        FakeBackend(port=port, delay=delay, failure_rate=failure_rate).start()
+    consul = FakeConsul(port=consul_port).start()
+    for i in range(services):
+        consul.register(f"service-{i:04d}", "127.0.0.1", backend_ports[i % len(backend_ports)])
+    while True:
+        time.sleep(3600)
+
+
+def wait_listing(url: str, count: int, timeout: float = 30.0) -> None:
+    """Wait until ``url`` answers with a JSON list of at least ``count`` entries."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=5) as r:  # nosec B310
+                if len(json.load(r)) >= count:
+                    return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} never listed {count} services")
+
+
+def start_app(module: str, port: int, consul_port: int, **env) -> subprocess.Popen:
+    env = dict(os.environ, SERVE_MODE="prod", SERVICE_PORT=str(port), SERVICE_ADDRESS="127.0.0.1",
+               BIND_HOST="127.0.0.1", CONSUL_HOST="127.0.0.1", CONSUL_PORT=str(consul_port), **env)
+    return subprocess.Popen([sys.executable, "-m", module], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def measure(url: str, concurrency: int, duration: float) -> dict:
+    latencies, errors, elapsed = asyncio.run(load(url, concurrency, duration))
+    latencies.sort()
+    result = {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / elapsed, 1)}
+    for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+        result[name] = round(percentile(latencies, q) * 1000, 3) if latencies else None
+    return result
+
+
+def run_scenario(name: str, args, consul_port: int) -> dict:
+    port = free_port()
+    if name.startswith("gateway"):
+        cache_ttl = args.cache_ttl if name == "gateway-cached" else 0
+        proc = multiprocessing.get_context("fork").Process(
+            target=run_gateway, args=("prod", port, f"http://127.0.0.1:{consul_port}", cache_ttl), daemon=True)
+        proc.start()
+        url = f"http://127.0.0.1:{port}/services"
+    elif name == "healthz":
+        proc = start_app("healthz.app", port, consul_port, SERVICE_NAME="healthz")
+        url = f"http://127.0.0.1:{port}/report"
+    else:
+        proc = start_app("service.app", port, consul_port, SERVICE_NAME="bench-info")
+        url = f"http://127.0.0.1:{port}/info"
+    try:
+        if name == "info":
+            wait_up(url)
+        else:
+            wait_listing(url, args.services)
+        return dict(measure(url, args.concurrency, args.duration), path="/" + url.split("/", 3)[3])
+    finally:
+        proc.terminate()
+        if isinstance(proc, subprocess.Popen):
+            proc.wait()
+        else:
+            proc.join()
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Regressions of ``results`` against ``baseline``, as printable lines."""
+    regressions = []
+    for name, now in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or not now["requests"]:
+            continue
+        if now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {now['rps']:.0f} req/s, was {before['rps']:.0f}")
+        if before["p99_ms"] and now["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {now['p99_ms']:.1f}ms, was {before['p99_ms']:.1f}ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " +
+                        ", ".join(SCENARIOS))
+    parser.add_argument("--services", type=int, default=20)
+    parser.add_argument("--backends", type=int, default=4)
+    parser.add_argument("--backend-delay-ms", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of backend answers that are 500s")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--cache-ttl", type=float, default=2.0, help="SERVICES_CACHE_TTL for gateway-cached")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs. the baseline")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    consul_port = free_port()
+    backend_ports = [free_port() for _ in range(args.backends)]
+    cluster = multiprocessing.get_context("fork").Process(
+        target=run_cluster, daemon=True, args=(consul_port, backend_ports, args.services,
+                                               args.backend_delay_ms / 1000, args.failure_rate))
+    cluster.start()
+
+    settings = {k: getattr(args, k) for k in ("services", "backends", "backend_delay_ms", "failure_rate",
+                                              "concurrency", "duration", "cache_ttl")}
+    results = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+               "cpus": os.cpu_count(), "settings": settings, "scenarios": {}}
+    print(" ".join(f"{k}={v}" for k, v in settings.items()) + f" cpus={os.cpu_count()}")
+    print(f"{'scenario':>14} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    try:
+        wait_up(f"http://127.0.0.1:{consul_port}/v1/catalog/services")
+        for name in scenarios:
+            r = results["scenarios"][name] = run_scenario(name, args, consul_port)
+            if not r["requests"]:
+                print(f"{name:>14} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {r['errors']:>7}")
+                continue
+            print(f"{name:>14} {r['rps']:>8.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+                  f"{r['errors']:>7}")
+    finally:
+        cluster.terminate()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
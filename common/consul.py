@@ -0,0 +1,223 @@
+"""Consul HTTP API client shared by service, gateway and healthz.
+
+One keep-alive pool per client, per-call deadlines, jittered retries of reads
+and responses decoded into small ``__slots__`` objects. Every attempt is timed
+with ``common.metrics.track`` under the caller's target name, so all three
+services report Consul latency the same way.
+
+    consul = ConsulClient("http://consul:8500", pool_size=64)
+    for entry in consul.health_service("service-a", passing=True, deadline=deadline):
+        print(entry.endpoint, entry.passing)
+"""
+import logging
+import random
+import time
+from types import MappingProxyType
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.5
+# Consul answers 429 when rate limited and 5xx while the cluster has no leader.
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+_NO_META = MappingProxyType({})
+
+
+def checks_passing(checks):
+    """Whether an instance is routable: it has checks besides serfHealth and all of them pass."""
+    service_checks = [c for c in checks if c.check_id != "serfHealth"]
+    return bool(service_checks) and all(c.status == "passing" for c in service_checks)
+
+
+class Check:
+    """One health check, as listed by /v1/health/state/<state> or inside a health entry."""
+
+    __slots__ = ("node", "check_id", "name", "status", "service_id", "service_name")
+
+    def __init__(self, node, check_id, name, status, service_id="", service_name=""):
+        self.node = node
+        self.check_id = check_id
+        self.name = name
+        self.status = status
+        self.service_id = service_id
+        self.service_name = service_name
+
+    @classmethod
+    def from_json(cls, check):
+        return cls(check.get("Node"), check.get("CheckID"), check.get("Name"), check.get("Status"),
+                   check.get("ServiceID") or "", check.get("ServiceName") or "")
+
+    def __repr__(self):
+        return f"Check({self.node!r}, {self.check_id!r}, {self.status!r})"
+
+
+class ServiceEntry:
+    """One instance from /v1/health/service/<name>: the service, its node and its checks."""
+
+    __slots__ = ("id", "name", "address", "port", "tags", "meta", "node", "checks")
+
+    def __init__(self, id, name, address, port, tags=(), meta=_NO_META, node=None, checks=()):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.port = port
+        self.tags = tags
+        self.meta = meta
+        self.node = node
+        self.checks = checks
+
+    @classmethod
+    def from_json(cls, entry):
+        svc = entry.get("Service") or {}
+        node = entry.get("Node") or {}
+        # An empty service address means "use the node's".
+        return cls(svc.get("ID"), svc.get("Service"), svc.get("Address") or node.get("Address"),
+                   svc.get("Port"), tuple(svc.get("Tags") or ()), svc.get("Meta") or _NO_META,
+                   node.get("Node"), tuple(Check.from_json(c) for c in entry.get("Checks") or ()))
+
+    @property
+    def endpoint(self):
+        """(address, port), or None when Consul can't route to the instance."""
+        return (self.address, self.port) if self.address and self.port else None
+
+    @property
+    def passing(self):
+        return checks_passing(self.checks)
+
+    def __repr__(self):
+        return f"ServiceEntry({self.name!r}, {self.id!r}, {self.endpoint!r})"
+
+
+def _transient(exc):
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUSES
+    return True
+
+
+class ConsulClient:
+    """Calls to one Consul agent over a shared keep-alive session.
+
+    ``pool_size`` should cover the calls a process makes in parallel, or
+    requests discards the extra connections instead of reusing them. Reads
+    take an optional ``deadline`` (a ``time.monotonic()`` value) that caps
+    both the socket timeout and any retries. With ``dc`` every query goes to
+    that datacenter through the agent (``?dc=``), for WAN-federated clusters.
+    ``last_success`` is the ``time.monotonic()`` of the last read that got an answer.
+    """
+
+    def __init__(self, base, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.05, pool_size=10, session=None, dc=None):
+        self.base = base.rstrip("/")
+        self.dc = dc
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.last_success = None
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        session.headers.update({"Accept": "application/json"})
+        self.session = session
+
+    def close(self):
+        """Drop the pooled connections."""
+        self.session.close()
+
+    def url(self, path):
+        if self.dc:
+            path = f"{path}{'&' if '?' in path else '?'}dc={self.dc}"
+        return f"{self.base}{path}"
+
+    def _timeout(self, deadline, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if deadline is None:
+            return timeout
+        return max(0.01, min(timeout, deadline - time.monotonic()))
+
+    def get(self, path, target, deadline=None, timeout=None, retries=None):
+        """GET ``path``, retrying connection errors, timeouts and 429/5xx answers.
+
+        Retries back off exponentially with full jitter and stop once the next
+        pause would run past ``deadline``; anything else raises at once.
+        """
+        url = self.url(path)
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                with metrics.track(target):
+                    r = self.session.get(url, timeout=self._timeout(deadline, timeout))
+                    r.raise_for_status()
+                self.last_success = time.monotonic()
+                return r
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                if attempt >= retries or not _transient(e):
+                    raise
+                pause = random.uniform(0, self.backoff * 2 ** attempt)
+                if deadline is not None and time.monotonic() + pause >= deadline:
+                    raise
+                attempt += 1
+                metrics.OUTBOUND_RETRIES.labels(target).inc()
+                log.debug("Retrying %s in %.3fs after %s", url, pause, e)
+                time.sleep(pause)
+
+    def watch(self, path, apply, stopped, wait="30s", synced=None, target="consul_watch"):
+        """Long-poll ``path`` with blocking queries until ``stopped`` is set.
+
+        ``apply(data, index)`` runs on the first answer and whenever the
+        X-Consul-Index moves; ``synced()`` after every successful poll. Failures
+        back off exponentially up to 30s (this loop does its own retrying).
+        """
+        index = 0
+        delay = 1
+        sep = "&" if "?" in path else "?"
+        timeout = float(wait.rstrip("s")) + 5
+        while not stopped.is_set():
+            try:
+                r = self.get(f"{path}{sep}index={index}&wait={wait}", target, timeout=timeout, retries=0)
+                new_index = int(r.headers.get("X-Consul-Index", 0))
+                if synced is not None:
+                    synced()
+                delay = 1
+                if index == 0 or new_index != index:
+                    apply(r.json(), new_index)
+                # Consul may reset its index (e.g. after a restart); start over when it goes
+                # backwards, and never send index=0 twice in a row or the poll would spin.
+                index = 0 if new_index < index else max(new_index, 1)
+            except Exception as e:
+                log.warning("Watch %s failed: %s", path, e)
+                stopped.wait(delay)
+                delay = min(delay * 2, 30)
+
+    def put(self, path, target, json=None, timeout=None):
+        """PUT ``path`` once and return the response; the caller decides what a status means."""
+        with metrics.track(target):
+            return self.session.put(self.url(path), json=json, timeout=self._timeout(None, timeout))
+
+    def catalog_services(self, deadline=None, target="consul_catalog"):
+        """{name: tags} for every service in the catalog."""
+        return self.get("/v1/catalog/services", target, deadline).json()
+
+    def health_service(self, name, passing=False, deadline=None, target="consul_health"):
+        path = f"/v1/health/service/{quote(name, safe='')}" + ("?passing=true" if passing else "")
+        return [ServiceEntry.from_json(e) for e in self.get(path, target, deadline).json()]
+
+    def health_state(self, state="any", deadline=None, target="consul_health_state"):
+        return [Check.from_json(c) for c in self.get(f"/v1/health/state/{state}", target, deadline).json()]
+
+    def register(self, payload):
+        return self.put("/v1/agent/service/register", "consul_register", json=payload)
+
+    def check_pass(self, check_id):
+        return self.put(f"/v1/agent/check/pass/{check_id}", "consul_heartbeat")
+
+    def maintenance(self, service_id, reason):
+        return self.put(f"/v1/agent/service/maintenance/{service_id}?enable=true&reason={reason}",
+                        "consul_maintenance")
+
+    def deregister(self, service_id):
+        return self.put(f"/v1/agent/service/deregister/{service_id}", "consul_deregister")
@@ -0,0 +1,209 @@
+"""Response encodings for the listing endpoints (gateway /services, healthz /report).
+
+Clients pick a representation with the usual headers:
+
+- ``Accept: application/msgpack`` gets the rows as MessagePack in columnar
+  form, one array per field instead of the same keys repeated per entry;
+  anything else gets JSON laid out as ``jsonify`` does (sorted keys, no
+  spaces, trailing newline), encoded with orjson when it is installed. orjson
+  writes non-ASCII text as UTF-8 rather than ``\\u`` escapes and spells some
+  floats differently (``1e20``, not ``1e+20``): the same values, but not
+  always the same bytes.
+- ``Accept-Encoding`` with ``br`` (when brotli is installed) or ``gzip``
+  compresses bodies of at least ``COMPRESS_MIN_BYTES``.
+
+orjson, msgpack and brotli are optional: without them JSON falls back to the
+standard library, MessagePack requests get JSON and only gzip is offered.
+
+    return respond(app.response_class, request, rows)
+"""
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the image
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK, "application/x-msgpack")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+VARY = "Accept, Accept-Encoding"
+# Suffixes that keep ETags distinct per representation.
+_TAGS = {(JSON, None): "", (JSON, "gzip"): "-gz", (JSON, "br"): "-br",
+         (MSGPACK, None): "-mp", (MSGPACK, "gzip"): "-mp-gz", (MSGPACK, "br"): "-mp-br"}
+
+
+def dumps(obj):
+    """Compact JSON with sorted keys and a trailing newline, laid out as Flask's jsonify writes it."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            # Types orjson has no encoder for (or non-str keys): the standard library decides.
+            pass
+    return (json.dumps(obj, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+def columnar(rows):
+    """{"count": n, "columns": {field: [value per row]}} for a list of dicts.
+
+    Fields appear in first-seen order; a row without a field has None there.
+    """
+    columns = {}
+    for i, row in enumerate(rows):
+        for key, value in row.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * i
+            column.append(value)
+        for column in columns.values():
+            if len(column) <= i:
+                column.append(None)
+    return {"count": len(rows), "columns": columns}
+
+
+def rows(table):
+    """The list of dicts columnar() was built from (missing fields come back as None)."""
+    columns = table["columns"]
+    return [{key: values[i] for key, values in columns.items()} for i in range(table["count"])]
+
+
+def _preferences(header):
+    """{token: q} from an Accept or Accept-Encoding header."""
+    prefs = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        prefs[token.strip().lower()] = q
+    return prefs
+
+
+def negotiate(accept, accept_encoding, size=None):
+    """(media type, content coding or None) for these request headers.
+
+    ``size`` is the uncompressed length when known; smaller bodies than
+    COMPRESS_MIN_BYTES are sent as they are.
+    """
+    media = JSON
+    if msgpack is not None and accept:
+        prefs = _preferences(accept)
+        packed = max(prefs.get(t, 0.0) for t in _MSGPACK_TYPES)
+        if packed > 0 and packed > max(prefs.get(JSON, 0.0), prefs.get("*/*", 0.0), prefs.get("application/*", 0.0)):
+            media = MSGPACK
+    coding = None
+    if accept_encoding and (size is None or size >= COMPRESS_MIN_BYTES):
+        prefs = _preferences(accept_encoding)
+        wildcard = prefs.get("*", 0.0)
+        offers = [(prefs.get(c, wildcard), c) for c in (("br", "gzip") if brotli is not None else ("gzip",))]
+        q, best = max(offers, key=lambda offer: offer[0])
+        coding = best if q > 0 else None
+    return media, coding
+
+
+def encode(data, media):
+    if media == MSGPACK:
+        return msgpack.packb(columnar(data), use_bin_type=True)
+    return dumps(data)
+
+
+def compress(body, coding):
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def represent(data, accept, accept_encoding, json_body=None, variants=None):
+    """(body, headers, ETag suffix) of ``data`` for one request.
+
+    MessagePack is columnar, so it is only used when ``data`` is a list of dicts.
+
+    ``json_body`` is dumps(data) if the caller already has it. Pass the same
+    ``variants`` dict for every request on the same data to encode and
+    compress each representation only once.
+    """
+    if json_body is None and variants is not None:
+        json_body = variants.get((JSON, None))
+    size = len(json_body) if json_body is not None else None
+    media, coding = negotiate(accept, accept_encoding, size)
+    if media == MSGPACK and not isinstance(data, list):
+        # Only lists of rows have a columnar form.
+        media = JSON
+    key = (media, coding)
+    body = variants.get(key) if variants is not None else None
+    if body is None:
+        if media == JSON and json_body is not None:
+            plain = json_body
+        else:
+            plain = variants.get((media, None)) if variants is not None else None
+            if plain is None:
+                plain = encode(data, media)
+        if coding is not None and size is None and len(plain) < COMPRESS_MIN_BYTES:
+            coding, key = None, (media, None)
+        body = compress(plain, coding)
+        if variants is not None:
+            variants[(media, None)] = plain
+            variants[key] = body
+    headers = {"Content-Type": media, "Vary": VARY}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return body, headers, _TAGS[key]
+
+
+def respond(response_class, request, data, json_body=None, etag=None, variants=None):
+    """A Flask response for ``data`` in the representation ``request`` asks for.
+
+    With ``etag`` (of the JSON body) the response is conditional, tagged per
+    representation.
+    """
+    body, headers, suffix = represent(data, request.headers.get("Accept"), request.headers.get("Accept-Encoding"),
+                                      json_body, variants)
+    resp = response_class(body, headers={k: v for k, v in headers.items() if k != "Content-Type"},
+                          content_type=headers["Content-Type"])
+    if etag is not None:
+        resp.set_etag(etag + suffix)
+        return resp.make_conditional(request)
+    return resp
+
+
+def use_fast_json(app):
+    """Make ``jsonify`` on ``app`` encode with orjson, when it is installed."""
+    if orjson is None:
+        return app
+    from flask.json.provider import DefaultJSONProvider
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return dumps(obj)[:-1].decode()
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
+    return app
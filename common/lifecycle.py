@@ -0,0 +1,30 @@
+"""Leaving Consul cleanly on shutdown, shared by service and healthz."""
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+# Time between failing the instance's health and removing it, so watchers drop it first.
+DRAIN_DELAY = float(os.getenv("DRAIN_DELAY", "2"))
+
+
+def drain(consul, service_id, delay=None):
+    """Take ``service_id`` out of rotation, then deregister it.
+
+    Maintenance mode turns the instance critical right away, so clients that
+    only use passing instances stop sending it traffic while it still answers.
+    After ``delay`` seconds the registration is removed. The caller keeps
+    serving until this returns and then drains in-flight requests.
+    """
+    try:
+        consul.maintenance(service_id, "draining")
+        log.info("Draining %s", service_id)
+    except Exception as e:
+        log.warning("Failed to put %s in maintenance: %s", service_id, e)
+    time.sleep(DRAIN_DELAY if delay is None else delay)
+    try:
+        r = consul.deregister(service_id)
+        log.info("Deregistered %s -> %s", service_id, r.status_code)
+    except Exception as e:
+        log.warning("Failed to deregister %s: %s", service_id, e)
@@ -0,0 +1,379 @@
+"""Small in-process metrics registry rendered in the Prometheus text format.
+
+Only what the services need: labelled counters, gauges and histograms, a
+``track`` timer for outbound calls, Flask hooks for inbound requests and a
+``/metrics`` route. Children are looked up once per label set and updated
+under their own lock, so an observation costs well under a microsecond.
+
+Metrics are per process. When several worker processes serve one port,
+``share(directory)`` in each of them makes ``/metrics`` report the whole pod:
+every process writes its values to ``<directory>/<pid>.json`` every
+METRICS_FLUSH_INTERVAL seconds, and ``render()`` sums the files. Counters and
+histograms keep the counts of workers that have exited, so they never go
+backwards; gauges only count live processes. ``common.serving`` does this for
+multi-worker gunicorn and uvicorn. Durations are taken with
+``time.perf_counter_ns``.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Where worker processes share their values, see share(); unset for a single process.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name!r} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def dump(self):
+        """{name: [[label values, state], ...]}: this process's values, as JSON, for render(processes)."""
+        return {name: metric.dump() for name, metric in list(self._metrics.items())}
+
+    def render(self, processes=None):
+        """Text exposition of every metric.
+
+        With ``processes``, a list of ``(dump(), alive)`` pairs, each metric is
+        the sum over those instead; a gauge only sums the live ones.
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            if processes is not None:
+                metric = metric.merged(dump.get(metric.name, ()) for dump, alive in processes
+                                       if alive or metric.kind != "gauge")
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from child.samples(self.name, _labels(self.labelnames, values), self.labelnames, values)
+
+    def dump(self):
+        return [[list(values), child.dump()] for values, child in list(self._children.items())]
+
+    def merged(self, dumps):
+        """An unregistered copy of this metric holding the sum of ``dumps``."""
+        copy = object.__new__(type(self))
+        copy.__dict__.update(self.__dict__, _children={}, _lock=threading.Lock())
+        for dump in dumps:
+            for values, state in dump:
+                copy.labels(*values).merge(state)
+        return copy
+
+    def reset(self):
+        for child in list(self._children.values()):
+            child.reset()
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def dump(self):
+        return self.value
+
+    def merge(self, state):
+        self.inc(state)
+
+    def reset(self):
+        self.value = 0
+
+    def samples(self, name, labels, labelnames, values):
+        yield f"{name}{labels} {_num(self.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _Value()
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.bounds, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+    def dump(self):
+        with self.lock:
+            return [list(self.counts), self.sum]
+
+    def merge(self, state):
+        counts, total = state
+        with self.lock:
+            self.counts = [a + b for a, b in zip(self.counts, counts)]
+            self.sum += total
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * len(self.counts)
+            self.sum = 0.0
+
+    def samples(self, name, labels, labelnames, values):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="%s"' % _num(bound)
+            yield f"{name}_bucket{_labels(labelnames, values, le)} {cumulative}"
+        yield f"{name}_sum{labels} {_num(total)}"
+        yield f"{name}_count{labels} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+
+INBOUND_LATENCY = Histogram("http_request_duration_seconds", "Inbound request latency by route.",
+                            ("route", "method"))
+INBOUND_ERRORS = Counter("http_request_errors_total", "Inbound requests that failed with a 5xx or an exception.",
+                         ("route", "method"))
+INBOUND_IN_FLIGHT = Gauge("http_requests_in_flight", "Inbound requests being handled.")
+OUTBOUND_LATENCY = Histogram("outbound_request_duration_seconds", "Outbound call latency by target.", ("target",))
+OUTBOUND_ERRORS = Counter("outbound_request_errors_total", "Outbound calls that raised.", ("target",))
+OUTBOUND_IN_FLIGHT = Gauge("outbound_requests_in_flight", "Outbound calls in progress.", ("target",))
+OUTBOUND_RETRIES = Counter("outbound_request_retries_total", "Outbound calls retried after a transient failure.",
+                           ("target",))
+
+
+_outbound_children = {}
+
+
+def _outbound(target):
+    children = _outbound_children.get(target)
+    if children is None:
+        children = _outbound_children[target] = (
+            OUTBOUND_IN_FLIGHT.labels(target), OUTBOUND_LATENCY.labels(target), OUTBOUND_ERRORS.labels(target))
+    return children
+
+
+class track:
+    """Time an outbound call to ``target``; an exception inside the block counts as an error.
+
+        with track("consul_catalog"):
+            r = SESSION.get(url, timeout=TIMEOUT)
+            r.raise_for_status()
+    """
+
+    __slots__ = ("children", "t0")
+
+    def __init__(self, target):
+        self.children = _outbound(target)
+
+    def __enter__(self):
+        self.children[0].inc()
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = (time.perf_counter_ns() - self.t0) / 1e9
+        inflight, latency, errors = self.children
+        inflight.dec()
+        latency.observe(elapsed)
+        if exc_type is not None:
+            errors.inc()
+        return False
+
+
+_shared = None
+
+
+def share(directory, interval=None):
+    """Report this process's metrics through ``directory``, and render every process's from there.
+
+    Call it once in each worker process. Values inherited from a parent
+    process (a gunicorn worker is forked from its arbiter) are reset first, as
+    the parent reports them itself if it shares too.
+    """
+    global _shared
+    for metric in list(REGISTRY._metrics.values()):
+        metric.reset()
+    _shared = directory
+    os.makedirs(directory, exist_ok=True)
+    interval = METRICS_FLUSH_INTERVAL if interval is None else interval
+    atexit.register(_flush)
+    threading.Thread(target=_flush_every, args=(interval,), name="metrics-flush", daemon=True).start()
+
+
+def _flush_every(interval):
+    while True:
+        time.sleep(interval)
+        _flush()
+
+
+def _flush():
+    pid = os.getpid()
+    path = os.path.join(_shared, f"{pid}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(REGISTRY.dump(), f)
+    os.replace(tmp, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _shared_processes():
+    _flush()
+    processes = []
+    for path in glob.glob(os.path.join(_shared, "*.json")):
+        try:
+            with open(path) as f:
+                dump = json.load(f)
+        except (OSError, ValueError):
+            continue
+        processes.append((dump, _alive(int(os.path.basename(path)[:-len(".json")]))))
+    return processes
+
+
+def render():
+    if _shared is None:
+        return REGISTRY.render()
+    return REGISTRY.render(_shared_processes())
+
+
+if METRICS_DIR:
+    # uvicorn starts its workers as fresh interpreters, which find the directory here.
+    share(METRICS_DIR)
+
+
+def instrument_flask(app, registry=REGISTRY):
+    """Record inbound latency, errors and in-flight requests for ``app`` and serve ``/metrics``."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_t0 = time.perf_counter_ns()
+        INBOUND_IN_FLIGHT.labels().inc()
+
+    def _record(status_error):
+        t0 = g.pop("metrics_t0", None)
+        if t0 is None:
+            return
+        INBOUND_IN_FLIGHT.labels().dec()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        INBOUND_LATENCY.labels(route, request.method).observe((time.perf_counter_ns() - t0) / 1e9)
+        if status_error:
+            INBOUND_ERRORS.labels(route, request.method).inc()
+
+    @app.after_request
+    def _stop_timer(response):
+        _record(response.status_code >= 500)
+        return response
+
+    @app.teardown_request
+    def _stop_timer_on_error(exc):
+        # after_request does not run when a view raises.
+        _record(True)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return app.response_class(render() if registry is REGISTRY else registry.render(), content_type=CONTENT_TYPE)
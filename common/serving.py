@@ -0,0 +1,212 @@
+"""Server bootstrap shared by service, gateway and healthz.
+
+SERVE_MODE picks how an app is served:
+
+- ``dev`` (default): Flask's development server, as before.
+- ``prod``: gunicorn with threaded (gthread) workers; WEB_WORKERS defaults to
+  what the app asks for, else 2 * CPUs + 1 (CPUs as the container's cgroup
+  quota allows), and WEB_THREADS likewise to the app's count, else 4.
+- ``asgi``: uvicorn workers for an ASGI entry point, when the app has one.
+
+With more than one worker, the workers share their metrics through
+METRICS_DIR (a fresh temporary directory unless set), so ``/metrics`` on any
+of them reports the whole pod.
+"""
+import glob
+import logging
+import math
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+SERVE_MODE = os.getenv("SERVE_MODE", "dev")
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "0"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "0"))
+# How long in-flight requests get to finish after SIGTERM.
+DRAIN_TIMEOUT = int(os.getenv("DRAIN_TIMEOUT", "10"))
+
+
+def cpu_limit(root="/sys/fs/cgroup"):
+    """CPUs this process can use: its affinity mask, capped by a cgroup CPU quota if there is one.
+
+    ``os.cpu_count()`` reports the host's CPUs inside a container.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" without a limit.
+        with open(os.path.join(root, "cpu.max")) as f:
+            limit, period = f.read().split()
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means no limit.
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                limit = int(f.read())
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+def worker_count(default=None):
+    """WEB_WORKERS, else ``default``, else 2 * CPUs + 1."""
+    return WEB_WORKERS or default or 2 * cpu_limit() + 1
+
+
+def thread_count(default=None):
+    """WEB_THREADS, else ``default``, else 4."""
+    return WEB_THREADS or default or 4
+
+
+def serve(app, host, port, on_start=None, on_worker_start=None, asgi_app=None, on_drain=None, workers=None,
+          threads=None):
+    """Serve ``app`` until shutdown.
+
+    ``on_start`` runs once per pod, in the process that supervises the workers,
+    so one-off work such as Consul registration is not repeated per worker.
+    Whatever it leaves running must not be shared with request handlers, since
+    workers are forked from that process: a keep-alive connection it opens on a
+    session the workers also use ends up shared by all of them.
+    ``on_worker_start`` runs in every process that handles requests.
+    ``on_drain`` runs once in that same supervising process when SIGTERM
+    arrives, while requests are still served, e.g. to leave Consul. The server
+    then stops accepting connections and gives in-flight requests up to
+    DRAIN_TIMEOUT seconds before exiting. Not supported in ``asgi`` mode.
+    ``asgi_app`` is an import string used in ``asgi`` mode; ASGI apps start their
+    own per-worker work from their lifespan handler.
+    ``workers`` and ``threads`` are the app's own defaults for WEB_WORKERS and
+    WEB_THREADS, for apps whose in-memory state should not be split across
+    processes.
+    """
+    mode = SERVE_MODE
+    if mode == "asgi" and asgi_app is None:
+        log.warning("No ASGI entry point; serving with gunicorn instead")
+        mode = "prod"
+
+    if on_start:
+        on_start()
+
+    if mode == "prod":
+        workers = worker_count(workers)
+        if workers > 1:
+            on_worker_start = _sharing_metrics(_metrics_dir(), on_worker_start)
+        _gunicorn(app, host, port, workers, thread_count(threads), on_worker_start, on_drain)
+    elif mode == "asgi":
+        import uvicorn
+        workers = worker_count(workers)
+        if workers > 1:
+            # uvicorn's workers are new interpreters; common.metrics shares on import when this is set.
+            os.environ["METRICS_DIR"] = _metrics_dir()
+        uvicorn.run(asgi_app, host=host, port=port, workers=workers, log_level="info")
+    else:
+        if on_worker_start:
+            on_worker_start()
+        if on_drain:
+            signal.signal(signal.SIGTERM, _dev_server_sigterm(on_drain))
+        app.run(host=host, port=port)
+
+
+def _metrics_dir():
+    """METRICS_DIR emptied of a previous run's values, or a new temporary directory."""
+    path = os.getenv("METRICS_DIR") or tempfile.mkdtemp(prefix="metrics-")
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.json")):
+        os.remove(stale)
+    return path
+
+
+def _sharing_metrics(path, on_worker_start):
+    def start():
+        from common import metrics
+        metrics.share(path)
+        if on_worker_start:
+            on_worker_start()
+    return start
+
+
+def _dev_server_sigterm(on_drain):
+    """SIGTERM handler for the dev server, whose main thread accepts every connection.
+
+    Draining runs on its own thread, like gunicorn's arbiter does it beside the
+    workers, so requests keep being answered during ``on_drain`` (DRAIN_DELAY);
+    once it is done the process signals itself again and exits on the main thread.
+    """
+    drained = threading.Event()
+    draining = []
+
+    def drain():
+        _drain_dev_server(on_drain)
+        drained.set()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def handler(signum, frame):
+        if drained.is_set():
+            sys.exit(0)
+        if not draining:
+            draining.append(threading.Thread(target=drain, name="drain", daemon=True))
+            draining[0].start()
+
+    return handler
+
+
+def _drain_dev_server(on_drain):
+    on_drain()
+    # Then let the dev server's request threads finish.
+    from common.metrics import INBOUND_IN_FLIGHT
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while INBOUND_IN_FLIGHT.labels().value > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _gunicorn(app, host, port, workers, threads, on_worker_start, on_drain=None):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("accesslog", None)
+            if on_worker_start:
+                self.cfg.set("post_fork", lambda server, worker: on_worker_start())
+            self.cfg.set("graceful_timeout", DRAIN_TIMEOUT)
+            if on_drain:
+                self.cfg.set("on_starting", lambda server: _drain_before_stop(server, on_drain))
+
+        def load(self):
+            return app
+
+    log.info("Serving on %s:%s with %d workers x %d threads", host, port, workers, threads)
+    Server().run()
+
+
+def _drain_before_stop(arbiter, on_drain):
+    """Run ``on_drain`` when the arbiter starts a graceful stop, before it closes the listeners."""
+    stop = arbiter.stop
+    drained = []
+
+    def draining_stop(graceful=True):
+        # SIGINT stops hard first (graceful=False) and skips draining.
+        if not drained:
+            drained.append(True)
+            if graceful:
+                on_drain()
+        stop(graceful)
+
+    arbiter.stop = draining_stop
@@ -0,0 +1,248 @@
+"""Last-known-good discovery state on disk, for warm starts and Consul outages.
+
+A snapshot file maps string keys (service names) to small JSON values and
+carries a JSON ``meta`` dict. Layout, little-endian:
+
+    header   magic "SDSNAP", format version (u16), entry count (u32),
+             meta length (u32), data length (u64), created (f64 unix time),
+             CRC-32 of everything after the header (u32)
+    meta     JSON
+    offsets  count + 1 u64 offsets into data, entries sorted by key
+    data     per entry: key length (u16), UTF-8 key, JSON value
+
+Files are written to a temporary name in the same directory, fsynced and
+moved into place with ``os.replace``, so readers see the old file or the new
+one, never half of one. Reading maps the file and decodes an entry only when
+it is asked for, so opening a 50k-service snapshot costs a header check.
+
+    write(path, {"service-a": [["10.0.0.5", 5000]]}, meta={"kind": "gateway"})
+    with SnapshotFile(path) as snap:
+        snap.get("service-a")
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections.abc import Mapping
+
+from common.encoding import dumps
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SDSNAP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<6sHIIQdI")
+OFFSET = struct.Struct("<Q")
+KEY_LENGTH = struct.Struct("<H")
+
+
+class SnapshotError(Exception):
+    """The file is not a snapshot this code can read (wrong magic or version, truncated, corrupt)."""
+
+
+def encode(entries, meta=None, created=None):
+    """The bytes of a snapshot of ``entries`` ({key: JSON-serialisable value})."""
+    meta_bytes = dumps(meta or {})
+    offsets, records, size = [], [], 0
+    for key in sorted(entries):
+        raw_key = key.encode()
+        record = KEY_LENGTH.pack(len(raw_key)) + raw_key + dumps(entries[key])
+        offsets.append(size)
+        records.append(record)
+        size += len(record)
+    offsets.append(size)
+    body = meta_bytes + b"".join(OFFSET.pack(o) for o in offsets) + b"".join(records)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(records), len(meta_bytes), size,
+                         time.time() if created is None else created, zlib.crc32(body))
+    return header + body
+
+
+def write(path, entries, meta=None):
+    """Atomically replace ``path`` with a snapshot of ``entries``."""
+    data = encode(entries, meta)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    try:
+        # Make the rename itself durable.
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    return len(data)
+
+
+class SnapshotFile(Mapping):
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Behaves as a Mapping of key -> value; values are decoded from JSON (then
+    passed through ``decode``) on each lookup. ``verify`` checks the CRC,
+    which reads the whole file once.
+    """
+
+    def __init__(self, path, decode=None, verify=True):
+        self.path = path
+        self.decode = decode
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise SnapshotError(f"{path}: empty file") from None
+        try:
+            self._open(verify)
+        except Exception:
+            self._map.close()
+            raise
+
+    def _open(self, verify):
+        if len(self._map) < HEADER.size:
+            raise SnapshotError(f"{self.path}: truncated header")
+        magic, version, count, meta_len, data_len, created, crc = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise SnapshotError(f"{self.path}: not a snapshot")
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f"{self.path}: format version {version}, expected {FORMAT_VERSION}")
+        self._offsets_at = HEADER.size + meta_len
+        self._data_at = self._offsets_at + (count + 1) * OFFSET.size
+        if len(self._map) != self._data_at + data_len:
+            raise SnapshotError(f"{self.path}: truncated ({len(self._map)} bytes)")
+        if verify and zlib.crc32(memoryview(self._map)[HEADER.size:]) != crc:
+            raise SnapshotError(f"{self.path}: checksum mismatch")
+        self.created = created
+        self.meta = json.loads(self._map[HEADER.size:self._offsets_at])
+        self._count = count
+        self._keys = None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _offset(self, i):
+        return self._data_at + OFFSET.unpack_from(self._map, self._offsets_at + i * OFFSET.size)[0]
+
+    def _key(self, i):
+        at = self._offset(i)
+        (length,) = KEY_LENGTH.unpack_from(self._map, at)
+        return self._map[at + KEY_LENGTH.size:at + KEY_LENGTH.size + length].decode()
+
+    def _value(self, i):
+        at = self._offset(i)
+        (length,) = KEY_LENGTH.unpack_from(self._map, at)
+        value = json.loads(self._map[at + KEY_LENGTH.size + length:self._offset(i + 1)])
+        return value if self.decode is None else self.decode(value)
+
+    def keys(self):
+        """All keys, sorted; read once and kept."""
+        if self._keys is None:
+            self._keys = [self._key(i) for i in range(self._count)]
+        return self._keys
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        keys = self.keys()
+        i = bisect.bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            raise KeyError(key)
+        return self._value(i)
+
+    @property
+    def age(self):
+        return max(0.0, time.time() - self.created)
+
+
+class SnapshotStore:
+    """Keeps one process's snapshot at ``path`` up to date without blocking callers.
+
+    ``save`` hands the latest entries to a writer thread and returns; writes
+    happen at most every ``min_interval`` seconds and only the newest state
+    is written. ``kind`` is stored in the meta so a gateway never loads a
+    healthz file by mistake.
+    """
+
+    def __init__(self, path, kind, min_interval=5.0):
+        self.path = path
+        self.kind = kind
+        self.min_interval = min_interval
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._pending = None
+        self._written_at = None
+        self._writer = None
+
+    def load(self, decode=None):
+        """The SnapshotFile at ``path``, or None if there is none or it can't be used."""
+        try:
+            snap = SnapshotFile(self.path, decode=decode)
+        except FileNotFoundError:
+            return None
+        except (OSError, SnapshotError, ValueError) as e:
+            log.warning("Ignoring snapshot %s: %s", self.path, e)
+            return None
+        if snap.meta.get("kind") != self.kind:
+            log.warning("Ignoring snapshot %s: kind %r, expected %r", self.path, snap.meta.get("kind"), self.kind)
+            snap.close()
+            return None
+        log.info("Loaded snapshot %s: %d entries, %.0fs old", self.path, len(snap), snap.age)
+        return snap
+
+    def save(self, entries, **meta):
+        with self._lock:
+            self._pending = (entries, dict(meta, kind=self.kind))
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_pending, name="snapshot-writer", daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        """Wait for the pending write, if any (tests and shutdown)."""
+        writer = self._writer
+        if writer is not None:
+            writer.join()
+
+    def _write_pending(self):
+        while True:
+            if self._written_at is not None:
+                wait = self._written_at + self.min_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._writer = None
+                    return
+            try:
+                write(self.path, *pending)
+                self.writes += 1
+            except OSError as e:
+                log.warning("Failed to write snapshot %s: %s", self.path, e)
+            self._written_at = time.monotonic()
@@ -7,20 +7,37 @@ function App() {
   const [now, setNow] = useState(Date.now())
 
   useEffect(() => {
+    const normalize = (item, fetchedAt) => {
+      const baseTime = item.timestamp && item.timestamp !== 'N/A'
+        ? new Date(item.timestamp).getTime()
+        : null
+      return { ...item, baseTimestamp: baseTime, fetchedAt }
+    }
+
     const fetchServices = async () => {
       try {
         const res = await axios.get('/api/services', { timeout: 1500 })
         const fetchedAt = Date.now()
-        const normalized = res.data.map(item => {
-          const baseTime = item.timestamp && item.timestamp !== 'N/A'
-            ? new Date(item.timestamp).getTime()
-            : null
-          return { ...item, baseTimestamp: baseTime, fetchedAt }
-        })
-        setServices(normalized)
+        setServices(res.data.map(item => normalize(item, fetchedAt)))
       } catch {}
     }
 
+    // The same service can be listed once per datacenter.
+    const sameRow = (a, b) => a.service === b.service && (a.datacenter ?? null) === (b.datacenter ?? null)
+
+    const applyDiff = ({ changed = [], removed = [] }) => {
+      const fetchedAt = Date.now()
+      setServices(prev => {
+        const next = prev.filter(svc => !removed.some(row => sameRow(svc, row)))
+        for (const item of changed) {
+          const idx = next.findIndex(svc => sameRow(svc, item))
+          if (idx === -1) next.push(normalize(item, fetchedAt))
+          else next[idx] = normalize(item, fetchedAt)
+        }
+        return next
+      })
+    }
+
     const fetchHealthz = async () => {
       try {
         const res = await axios.get('/api/healthz', { timeout: 1500 })
@@ -30,12 +47,35 @@ function App() {
       }
     }
 
-    fetchServices()
+    // Service status is pushed by the gateway; poll only where EventSource is unavailable.
+    let source = null
+    if (typeof EventSource !== 'undefined') {
+      source = new EventSource('/api/services/stream')
+      source.addEventListener('snapshot', e => {
+        const fetchedAt = Date.now()
+        setServices(JSON.parse(e.data).map(item => normalize(item, fetchedAt)))
+      })
+      source.addEventListener('diff', e => applyDiff(JSON.parse(e.data)))
+      // A gateway with no stream slot left answers 503, which closes the source for good: poll instead.
+      source.addEventListener('error', () => {
+        if (source && source.readyState === 2) {
+          source = null
+          fetchServices()
+        }
+      })
+    } else {
+      fetchServices()
+    }
+
     fetchHealthz()
-    const fetchInterval = setInterval(() => { fetchServices(); fetchHealthz(); }, 3000)
+    const fetchInterval = setInterval(() => { if (!source) fetchServices(); fetchHealthz(); }, 3000)
     const clockInterval = setInterval(() => setNow(Date.now()), 100)
 
-    return () => { clearInterval(fetchInterval); clearInterval(clockInterval) }
+    return () => {
+      if (source) source.close()
+      clearInterval(fetchInterval)
+      clearInterval(clockInterval)
+    }
   }, [])
 
   const formatTimestamp = (base, fetched) => {
@@ -1,4 +1,4 @@
-import { render, screen } from '@testing-library/react'
+import { act, render, screen } from '@testing-library/react'
 import React from 'react'
 vi.mock('axios', () => ({
   default: { get: vi.fn() }
@@ -12,8 +12,33 @@ async function loadApp() {
 
 afterEach(() => {
   vi.clearAllMocks()
+  vi.unstubAllGlobals()
 })
 
+class FakeEventSource {
+  static instances = []
+
+  constructor(url) {
+    this.url = url
+    this.listeners = {}
+    this.closed = false
+    this.readyState = 0
+    FakeEventSource.instances.push(this)
+  }
+
+  addEventListener(type, fn) {
+    this.listeners[type] = fn
+  }
+
+  emit(type, payload) {
+    this.listeners[type]({ data: JSON.stringify(payload) })
+  }
+
+  close() {
+    this.closed = true
+  }
+}
+
 test('renders services and health list when API calls succeed', async () => {
   axios.get.mockImplementation((url) => {
     if (url === '/api/services') {
@@ -58,3 +83,90 @@ test('shows empty lists when APIs fail', async () => {
   expect(screen.queryAllByRole('listitem').length).toBe(0)
   expect(axios.get).toHaveBeenCalled()
 })
+
+test('subscribes to the service stream and applies diffs', async () => {
+  FakeEventSource.instances = []
+  vi.stubGlobal('EventSource', FakeEventSource)
+  axios.get.mockImplementation((url) => {
+    if (url === '/api/healthz') return Promise.resolve({ data: [] })
+    throw new Error(`Unexpected URL: ${url}`)
+  })
+
+  const App = await loadApp()
+  const { unmount } = render(<App />)
+
+  const source = FakeEventSource.instances[0]
+  expect(source.url).toBe('/api/services/stream')
+
+  act(() => source.emit('snapshot', [
+    { service: 'service-a', status: 'online', timestamp: '2024-01-01 00:00:00.000', host: 'h1', responseTime: 12 },
+    { service: 'service-b', status: 'offline', timestamp: 'N/A', host: 'N/A', responseTime: null },
+  ]))
+  expect(await screen.findByText(/12 ms/)).toBeInTheDocument()
+  expect(screen.getByRole('heading', { level: 2, name: /service-b/i })).toBeInTheDocument()
+
+  act(() => source.emit('diff', {
+    changed: [{ service: 'service-a', status: 'online', timestamp: '2024-01-01 00:00:03.000', host: 'h2', responseTime: 40 }],
+    removed: [{ service: 'service-b' }],
+  }))
+  expect(await screen.findByText(/40 ms/)).toBeInTheDocument()
+  expect(screen.queryByRole('heading', { level: 2, name: /service-b/i })).not.toBeInTheDocument()
+  expect(axios.get).not.toHaveBeenCalledWith('/api/services', expect.anything())
+
+  unmount()
+  expect(source.closed).toBe(true)
+})
+
+test('keeps one row per datacenter when diffs name the same service', async () => {
+  FakeEventSource.instances = []
+  vi.stubGlobal('EventSource', FakeEventSource)
+  axios.get.mockImplementation((url) => {
+    if (url === '/api/healthz') return Promise.resolve({ data: [] })
+    throw new Error(`Unexpected URL: ${url}`)
+  })
+
+  const App = await loadApp()
+  render(<App />)
+
+  const source = FakeEventSource.instances[0]
+  act(() => source.emit('snapshot', [
+    { service: 'service-a', datacenter: 'east', status: 'online', timestamp: 'N/A', host: 'east-1', responseTime: 11 },
+    { service: 'service-a', datacenter: 'west', status: 'online', timestamp: 'N/A', host: 'west-1', responseTime: 22 },
+  ]))
+  expect(await screen.findByText(/22 ms/)).toBeInTheDocument()
+
+  act(() => source.emit('diff', {
+    changed: [{ service: 'service-a', datacenter: 'west', status: 'online', timestamp: 'N/A', host: 'west-2', responseTime: 33 }],
+    removed: [],
+  }))
+  expect(await screen.findByText(/33 ms/)).toBeInTheDocument()
+  expect(screen.getByText(/11 ms/)).toBeInTheDocument()
+  expect(screen.getAllByRole('heading', { level: 2, name: /service-a/i })).toHaveLength(2)
+
+  act(() => source.emit('diff', { changed: [], removed: [{ service: 'service-a', datacenter: 'east' }] }))
+  expect(screen.queryByText(/11 ms/)).not.toBeInTheDocument()
+  expect(screen.getByText(/33 ms/)).toBeInTheDocument()
+})
+
+test('falls back to polling when the stream is refused', async () => {
+  FakeEventSource.instances = []
+  vi.stubGlobal('EventSource', FakeEventSource)
+  axios.get.mockImplementation((url) => {
+    if (url === '/api/services') {
+      return Promise.resolve({
+        data: [{ service: 'service-a', status: 'online', timestamp: '2024-01-01 00:00:00.000', host: 'h1', responseTime: 7 }]
+      })
+    }
+    if (url === '/api/healthz') return Promise.resolve({ data: [] })
+    throw new Error(`Unexpected URL: ${url}`)
+  })
+
+  const App = await loadApp()
+  render(<App />)
+
+  const source = FakeEventSource.instances[0]
+  source.readyState = 2
+  act(() => source.listeners.error({}))
+  expect(await screen.findByText(/7 ms/)).toBeInTheDocument()
+  expect(axios.get).toHaveBeenCalledWith('/api/services', expect.anything())
+})
@@ -1,26 +1,142 @@
-from flask import Flask, jsonify
-import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from common import encoding
+from common.consul import ConsulClient
+from common.metrics import instrument_flask, track
+from common.serving import serve, thread_count, worker_count
+from common.snapshot import SnapshotStore
+from flask import Flask, jsonify, request
+from gateway.balancer import make_balancer
+from gateway.breaker import CircuitBreaker
+from gateway.cache import ResponseCache
+from gateway.index import FilterUnavailable, ServiceIndex, ServiceQuery
+from gateway.latency import LatencyHistory
+from gateway.proxy import IDEMPOTENT, ReverseProxy, is_timeout
+from gateway.scheduler import ProbeScheduler
+from gateway.stream import KEEPALIVE, QueueSubscriber, ServiceStream
+from gateway.watcher import CatalogWatcher, Snapshot, endpoints
 import logging
+import queue
+import threading
 import time
 import os
 
 app = Flask(__name__)
+instrument_flask(app)
+encoding.use_fast_json(app)
 logging.basicConfig(level=logging.INFO)
 
-CONSUL_BASE = "http://consul:8500"
-CATALOG_SERVICES = f"{CONSUL_BASE}/v1/catalog/services"
-HEALTH_SERVICE = f"{CONSUL_BASE}/v1/health/service/"
+CONSUL_HOST = os.getenv("CONSUL_HOST", "consul")
+CONSUL_PORT = int(os.getenv("CONSUL_PORT", "8500"))
+CONSUL_BASE = f"http://{CONSUL_HOST}:{CONSUL_PORT}"
+HEALTHZ_REPORT = "http://healthz:6000/report"
 BIND_HOST = os.getenv("BIND_HOST", "0.0.0.0") # nosec B104
 
-SESSION = requests.Session()
-SESSION.headers.update({"Accept": "application/json"})
 TIMEOUT = 2.5
+# Catalog services whose name starts with this are listed; empty lists every one.
+SERVICE_PREFIX = os.getenv("SERVICE_PREFIX", "service-")
+# Upper bound on concurrent Consul/backend probes and on the whole /services call.
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "64"))
+SERVICES_DEADLINE = float(os.getenv("SERVICES_DEADLINE", "4.0"))
 
-def get_registered_service_names(prefix="service-"):
+# Size the keep-alive pool to the fan-out so parallel probes don't discard connections.
+# Backend probes go through the same session as the Consul calls.
+CONSUL = ConsulClient(CONSUL_BASE, timeout=TIMEOUT, pool_size=FANOUT_WORKERS)
+SESSION = CONSUL.session
+CATALOG_SERVICES = CONSUL.url("/v1/catalog/services")
+HEALTH_SERVICE = CONSUL.url("/v1/health/service/")
+EXECUTOR = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="probe")
+
+# Where backend addresses come from: "http" asks /v1/health/service (or the watcher's long-polls),
+# "dns" looks up <name>.service.consul SRV records on Consul's DNS port and caches them per TTL.
+DISCOVERY_BACKEND = os.getenv("DISCOVERY_BACKEND", "http")
+RESOLVER = None
+if DISCOVERY_BACKEND == "dns":
+    # dnspython is only needed, and only imported, with DNS discovery.
+    from gateway.resolver import SrvResolver
+    RESOLVER = SrvResolver(
+        os.getenv("CONSUL_DNS_HOST", CONSUL_HOST), int(os.getenv("CONSUL_DNS_PORT", "8600")),
+        timeout=float(os.getenv("DNS_TIMEOUT", "1.0")),
+        min_ttl=float(os.getenv("DNS_MIN_TTL", "1.0")),
+        negative_ttl=float(os.getenv("DNS_NEGATIVE_TTL", "5.0")),
+        host_ttl=float(os.getenv("CONSUL_DNS_HOST_TTL", "30")),
+        max_entries=int(os.getenv("DNS_CACHE_MAX", "10000")),
+    )
+
+# Last-known-good local catalog on disk; empty disables it. The watcher writes it (at most every
+# SNAPSHOT_INTERVAL seconds), startup loads it, and /services serves it with "stale": true until
+# Consul answers. Entries from a watcher that has not synced for READY_MAX_SYNC_AGE are marked
+# stale too, with or without a saved catalog.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_STORE = (SnapshotStore(SNAPSHOT_PATH, "gateway", min_interval=float(os.getenv("SNAPSHOT_INTERVAL", "5")))
+                  if SNAPSHOT_PATH else None)
+
+def load_last_good():
+    """The saved catalog as a Snapshot whose instances are read from the mapped file on demand."""
+    saved = SNAPSHOT_STORE.load(decode=lambda instances: tuple(map(tuple, instances))) if SNAPSHOT_STORE else None
+    return Snapshot(saved.meta.get("version", 0), tuple(saved.keys()), saved) if saved else None
+
+def save_snapshot(snap):
+    # Only complete snapshots: one taken mid-startup would replace a good file with a partial one.
+    if SNAPSHOT_STORE is not None and all(name in snap.instances for name in snap.names):
+        SNAPSHOT_STORE.save({name: snap.instances[name] for name in snap.names}, version=snap.version)
+
+LAST_GOOD = load_last_good()
+# Names only: tags and meta aren't saved, so stale listings can't be filtered on them.
+LAST_GOOD_INDEX = ServiceIndex(LAST_GOOD.names, tags=False, meta=False) if LAST_GOOD else None
+
+# Background long-poll of the catalog; /services falls back to direct Consul calls until it syncs.
+# With DNS discovery it only tracks names; instances come from the resolver.
+CATALOG_WATCH = os.getenv("CATALOG_WATCH", "1") == "1"
+CATALOG_WATCH_WAIT = os.getenv("CATALOG_WATCH_WAIT", "30s")
+WATCHER = CatalogWatcher(CONSUL_BASE, prefix=SERVICE_PREFIX, wait=CATALOG_WATCH_WAIT, health=RESOLVER is None,
+                         on_publish=save_snapshot)
+
+# Several Consul clusters merged into one /services, comma-separated: "name=http://host:8500" for
+# a cluster's own agent, or "name" for the local agent's ?dc=name (WAN federation). Empty: only
+# CONSUL_HOST, and entries carry no datacenter field. Each DC gets DC_DEADLINE to answer.
+CONSUL_DATACENTERS = os.getenv("CONSUL_DATACENTERS", "")
+DC_DEADLINE = float(os.getenv("DC_DEADLINE", "2.0"))
+
+def parse_datacenters(spec):
+    """{name: ConsulClient} for CONSUL_DATACENTERS, in the order given."""
+    dcs = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, base = item.partition("=")
+        dcs[name] = ConsulClient(base or CONSUL_BASE, timeout=TIMEOUT, session=SESSION,
+                                 dc=None if base else name)
+    return dcs
+
+DATACENTERS = parse_datacenters(CONSUL_DATACENTERS)
+# Long-polls hold their connections, so each DC's watcher gets a pool of its own (two polls, 16 reads).
+WATCHERS = {name: CatalogWatcher(ConsulClient(client.base, pool_size=18, dc=client.dc), prefix=SERVICE_PREFIX,
+                                 wait=CATALOG_WATCH_WAIT)
+            for name, client in DATACENTERS.items()}
+DC_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, len(DATACENTERS)), thread_name_prefix="dc")
+
+# Backends that keep failing are reported offline without a call until a trial probe succeeds.
+BREAKER = CircuitBreaker(threshold=int(os.getenv("BREAKER_THRESHOLD", "3")),
+                         reset_timeout=float(os.getenv("BREAKER_RESET", "10.0")))
+
+# How to pick which passing instance to probe, and whether to probe all of them instead.
+BALANCER = make_balancer(os.getenv("PROBE_STRATEGY", "round-robin"))
+PROBE_ALL_INSTANCES = os.getenv("PROBE_ALL_INSTANCES", "0") == "1"
+# Separate pool so per-instance probes never wait behind the per-service ones that submit them.
+INSTANCE_EXECUTOR = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="probe-instance")
+
+# The last LATENCY_SAMPLES probes of each instance (at most LATENCY_MAX_INSTANCES of them), served as
+# percentiles over each of LATENCY_WINDOWS seconds at /services/<name>/latency. LATENCY_P99=1 also
+# adds the service's p99 over the first window to /services. The history is per process: with
+# several workers each one only knows the probes it made itself (the gateway runs one by default).
+LATENCY = LatencyHistory(capacity=int(os.getenv("LATENCY_SAMPLES", "128")),
+                         max_instances=int(os.getenv("LATENCY_MAX_INSTANCES", "10000")))
+LATENCY_WINDOWS = [int(w) for w in os.getenv("LATENCY_WINDOWS", "60,300,900").split(",") if w.strip()]
+LATENCY_P99 = os.getenv("LATENCY_P99", "0") == "1"
+
+def get_registered_service_names(prefix=None, consul=None, deadline=None):
+    if prefix is None:
+        prefix = SERVICE_PREFIX
     try:
-        r = SESSION.get(CATALOG_SERVICES, timeout=TIMEOUT)
-        r.raise_for_status()
-        all_services = r.json()
+        all_services = (consul or CONSUL).catalog_services(deadline=deadline)
         names = [name for name in all_services.keys() if name.startswith(prefix)]
         app.logger.info("Discovered services: %s", names)
         return names
@@ -28,48 +144,551 @@ def get_registered_service_names(prefix="service-"):
         app.logger.error("Failed to load catalog services: %s", e)
         return []
 
-@app.route("/services", methods=["GET"])
-def list_services():
-    names = get_registered_service_names()
-    results = []
-    for name in names:
+def offline(name):
+    return {"service": name, "status": "offline",
+            "timestamp": "N/A", "host": "N/A", "responseTime": None}
+
+def remaining(deadline):
+    return max(0.01, min(TIMEOUT, deadline - time.monotonic()))
+
+def lookup_instances(name, deadline, consul=None):
+    # DNS only covers the local datacenter; federated ones stay on their HTTP API.
+    if RESOLVER is not None and consul is None:
+        return RESOLVER.resolve(name)
+    return endpoints((consul or CONSUL).health_service(name, passing=True, deadline=deadline))
+
+def known_name(snap, name):
+    """Whether the gateway answers for ``name``: it starts with SERVICE_PREFIX, like /services, or the
+    watcher tracks it. Lookups of other names would only fill caches with whatever clients ask for."""
+    return name.startswith(SERVICE_PREFIX) or bool(snap and name in snap.names)
+
+def known_instances(snap, name):
+    """Instances of ``name`` without calling Consul's HTTP API: the snapshot's, or the resolver's."""
+    instances = snap.instances.get(name)
+    if instances is None and RESOLVER is not None:
         try:
-            r = SESSION.get(f"{HEALTH_SERVICE}{name}?passing=true", timeout=TIMEOUT)
-            r.raise_for_status()
-            data = r.json()
-            if not data:
-                results.append({"service": name, "status": "offline",
-                                "timestamp": "N/A", "host": "N/A", "responseTime": None})
-                continue
-            entry = data[0]
-            svc = entry.get("Service", {})
-            address = svc.get("Address") or entry.get("Node", {}).get("Address")
-            port = svc.get("Port")
-            if not address or not port:
-                results.append({"service": name, "status": "offline",
-                                "timestamp": "N/A", "host": "N/A", "responseTime": None})
-                continue
+            instances = RESOLVER.resolve(name)
+        except Exception as e:
+            app.logger.warning("DNS lookup of %s failed: %s", name, e)
+    return instances or ()
+
+def backend_of(instance):
+    address, port = instance
+    return f"{address}:{port}"
+
+def probe_instance(instance, deadline):
+    """GET /info from one instance, recording the outcome; raises on failure."""
+    backend = backend_of(instance)
+    BALANCER.begin(instance)
+    try:
+        with track("backend_info"):
             t0 = time.perf_counter()
-            info = SESSION.get(f"http://{address}:{port}/info", timeout=TIMEOUT)
+            info = SESSION.get(f"http://{backend}/info", timeout=remaining(deadline))
             t1 = time.perf_counter()
             info.raise_for_status()
-            svc_data = info.json()
-            svc_data["status"] = "online"
-            svc_data["responseTime"] = int((t1 - t0) * 1000)
-            results.append(svc_data)
+        svc_data = info.json()
+    except Exception:
+        LATENCY.record(backend, (time.perf_counter() - t0) * 1000, ok=False)
+        BREAKER.failure(backend)
+        BALANCER.end(instance, None)
+        raise
+    LATENCY.record(backend, (t1 - t0) * 1000)
+    BREAKER.success(backend)
+    BALANCER.end(instance, t1 - t0)
+    svc_data["status"] = "online"
+    svc_data["responseTime"] = int((t1 - t0) * 1000)
+    return svc_data
+
+def instance_entry(instance, svc_data=None):
+    if svc_data is None:
+        return {"address": backend_of(instance), "host": "N/A", "status": "offline", "responseTime": None}
+    return {"address": backend_of(instance), "host": svc_data.get("host", "N/A"),
+            "status": "online", "responseTime": svc_data["responseTime"]}
+
+def probe_one_instance(instance, deadline):
+    if not BREAKER.allow(backend_of(instance)):
+        return None
+    try:
+        return probe_instance(instance, deadline)
+    except Exception:
+        return None
+
+def probe_all_instances(name, instances, deadline):
+    futures = [INSTANCE_EXECUTOR.submit(probe_one_instance, inst, deadline) for inst in instances]
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    results = [fut.result() if fut in done else None for fut in futures]
+    # Top-level fields come from the first instance that answered.
+    svc_data = next((dict(r) for r in results if r is not None), None) or offline(name)
+    svc_data["instances"] = [instance_entry(inst, r) for inst, r in zip(instances, results)]
+    return svc_data
+
+def with_p99(svc_data, instances):
+    if LATENCY_P99:
+        svc_data["p99"] = LATENCY.summary(map(backend_of, instances), LATENCY_WINDOWS[0])["p99"]
+    return svc_data
+
+def probe_service(name, deadline, snap=None, consul=None):
+    instances = ()
+    try:
+        instances = snap.instances.get(name) if snap else None
+        if instances is None:
+            instances = lookup_instances(name, deadline, consul)
+        if not instances:
+            svc_data = offline(name)
+        elif PROBE_ALL_INSTANCES:
+            svc_data = probe_all_instances(name, instances, deadline)
+        else:
+            allowed = (i for i in BALANCER.order(name, instances) if BREAKER.allow(backend_of(i)))
+            instance = next(allowed, None)
+            svc_data = offline(name) if instance is None else probe_instance(instance, deadline)
+    except Exception:
+        svc_data = offline(name)
+    return with_p99(svc_data, instances or ())
+
+# "request": /services probes the backends itself. "scheduled": a background scheduler probes each
+# instance on its own adaptive interval, capped at PROBE_MAX_RATE per second, and /services reads
+# the latest results (with their age in probeAge, ms). Needs the catalog watcher. Every worker
+# process runs its own scheduler over every instance, so each gets an equal share of the cap.
+PROBE_MODE = os.getenv("PROBE_MODE", "request")
+
+def scheduled_targets():
+    """{(dc, name, instance): instance} for every passing instance the watchers know about."""
+    targets = {}
+    for dc, watcher in WATCHERS.items() if DATACENTERS else ((None, WATCHER),):
+        snap = watcher.snapshot()
+        for name in snap.names if snap else ():
+            for instance in known_instances(snap, name):
+                targets[(dc, name, instance)] = instance
+    return targets
+
+def scheduled_probe(instance):
+    if not BREAKER.allow(backend_of(instance)):
+        return None
+    return probe_instance(instance, time.monotonic() + TIMEOUT)
+
+SCHEDULER = ProbeScheduler(
+    lambda instance: scheduled_probe(instance), lambda: scheduled_targets(),
+    min_interval=float(os.getenv("PROBE_MIN_INTERVAL", "2.0")),
+    max_interval=float(os.getenv("PROBE_MAX_INTERVAL", "30.0")),
+    max_rate=float(os.getenv("PROBE_MAX_RATE", "50")) / worker_count(1),
+    executor=INSTANCE_EXECUTOR,
+)
+
+def probe_age(latest):
+    return None if latest is None else int(latest[1] * 1000)
+
+def scheduled_service(name, instances, dc=None):
+    """/services entry from the scheduler's latest results; makes no calls."""
+    latest = [SCHEDULER.latest((dc, name, instance)) for instance in instances]
+    answered = [r for r in latest if r is not None and r[0] is not None]
+    if answered:
+        # The freshest answer from any instance.
+        newest = min(answered, key=lambda r: r[1])
+        svc_data = dict(newest[0], probeAge=probe_age(newest))
+    else:
+        svc_data = offline(name)
+    if PROBE_ALL_INSTANCES:
+        svc_data["instances"] = [dict(instance_entry(instance, r[0] if r else None), probeAge=probe_age(r))
+                                 for instance, r in zip(instances, latest)]
+    return with_p99(svc_data, instances)
+
+def warm_snapshot(watcher, dc=None):
+    """(snapshot, stale) to answer from: ``watcher``'s, stale once it has not synced for
+    READY_MAX_SYNC_AGE, or for the local DC the saved catalog until the watcher first syncs."""
+    snap = watcher.snapshot()
+    if snap is None:
+        # The watcher hasn't synced since startup: serve the saved catalog meanwhile.
+        return (LAST_GOOD, True) if CATALOG_WATCH and dc is None and LAST_GOOD is not None else (None, False)
+    last_sync = watcher.last_sync
+    return snap, last_sync is not None and time.monotonic() - last_sync > READY_MAX_SYNC_AGE
+
+def consul_answered_since(t):
+    return CONSUL.last_success is not None and CONSUL.last_success >= t
+
+def scheduled_view(snap):
+    """Whether the scheduler's results cover ``snap`` (it only follows the watchers)."""
+    return PROBE_MODE == "scheduled" and snap is not None and snap is not LAST_GOOD
+
+def label(results, dc, stale):
+    for svc_data in results:
+        if dc is not None:
+            svc_data["datacenter"] = dc
+        if stale:
+            svc_data["stale"] = True
+    return results
+
+def collect_datacenter(consul, watcher, deadline, dc=None):
+    snap, stale = warm_snapshot(watcher, dc)
+    if scheduled_view(snap):
+        results = [scheduled_service(name, known_instances(snap, name), dc) for name in snap.names]
+    else:
+        started = time.monotonic()
+        results = probe_datacenter(consul, snap, deadline)
+        if not results and snap is None and dc is None and LAST_GOOD is not None and not consul_answered_since(started):
+            # The catalog call failed: probe what the saved catalog lists instead.
+            snap, stale = LAST_GOOD, True
+            results = probe_datacenter(consul, snap, deadline)
+    return label(results, dc, stale)
+
+def catalog_index(consul=None, deadline=None):
+    """A ServiceIndex (names and tags, no meta) read straight from the catalog, or None if it can't be."""
+    try:
+        services = (consul or CONSUL).catalog_services(deadline=deadline)
+    except Exception as e:
+        app.logger.error("Failed to load catalog services: %s", e)
+        return None
+    return ServiceIndex.from_catalog({name: tags for name, tags in services.items() if name.startswith(SERVICE_PREFIX)})
+
+def query_datacenter(consul, watcher, deadline, query, dc=None):
+    """([(name, entry)], whether more names match) for one datacenter, probing only what ``query`` selects."""
+    index = watcher.index
+    snap, stale = warm_snapshot(watcher, dc)
+    if snap is None:
+        # Not synced yet: index the catalog as it is now.
+        index = catalog_index(consul, deadline)
+        if index is None and dc is None and LAST_GOOD is not None:
+            snap, stale = LAST_GOOD, True
+    if LAST_GOOD is not None and snap is LAST_GOOD:
+        index = LAST_GOOD_INDEX
+    if index is None:
+        return [], False
+    names = query.select(index)
+    more = query.limit is not None and len(names) > query.limit and not query.status
+    if more:
+        names = names[:query.limit]
+    if scheduled_view(snap):
+        results = [scheduled_service(name, known_instances(snap, name), dc) for name in names]
+    else:
+        results = probe_datacenter(consul, snap, deadline, names)
+    return list(zip(names, label(results, dc, stale))), more
+
+def probe_datacenter(consul, snap, deadline, names=None):
+    if names is None:
+        names = list(snap.names) if snap else get_registered_service_names(consul=consul, deadline=deadline)
+    futures = [EXECUTOR.submit(probe_service, name, deadline, snap, consul) for name in names]
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    results = []
+    for name, fut in zip(names, futures):
+        if fut in done:
+            results.append(fut.result())
+        else:
+            # Past the request deadline: report offline and drop queued probes.
+            fut.cancel()
+            results.append(offline(name))
+    return results
+
+def collect_services(dcs=None):
+    """Probe every service, across all datacenters (or just ``dcs``) when federated."""
+    if not DATACENTERS:
+        return collect_datacenter(None, WATCHER, time.monotonic() + SERVICES_DEADLINE)
+    dcs = dcs or list(DATACENTERS)
+    # All DCs run at once, each against its own deadline, so a slow one only delays its own slice.
+    deadline = time.monotonic() + min(DC_DEADLINE, SERVICES_DEADLINE)
+    futures = [DC_EXECUTOR.submit(collect_datacenter, DATACENTERS[dc], WATCHERS[dc], deadline, dc)
+               for dc in dcs]
+    # A DC whose catalog is unreachable has no names to report offline, so it has no slice at all.
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()) + 0.1)
+    results = []
+    for dc, fut in zip(dcs, futures):
+        if fut in done:
+            results.extend(fut.result())
+        else:
+            app.logger.warning("Datacenter %s missed its deadline", dc)
+    return results
+
+def query_services(query, dcs=None):
+    """(entries, cursor of the next page or None) for ``query``; raises FilterUnavailable."""
+    if not DATACENTERS:
+        return query.page([query_datacenter(None, WATCHER, time.monotonic() + SERVICES_DEADLINE, query)])
+    dcs = dcs or list(DATACENTERS)
+    deadline = time.monotonic() + min(DC_DEADLINE, SERVICES_DEADLINE)
+    futures = [DC_EXECUTOR.submit(query_datacenter, DATACENTERS[dc], WATCHERS[dc], deadline, query, dc)
+               for dc in dcs]
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()) + 0.1)
+    views = []
+    for dc, fut in zip(dcs, futures):
+        if fut in done:
+            views.append(fut.result())
+        else:
+            app.logger.warning("Datacenter %s missed its deadline", dc)
+    return query.page(views)
+
+def services_cache(dcs=None):
+    return ResponseCache(
+        lambda: collect_services(dcs), encode=encoding.dumps,
+        ttl=float(os.getenv("SERVICES_CACHE_TTL", "2.0")),
+        max_stale=float(os.getenv("SERVICES_CACHE_MAX_STALE", "30.0")),
+    )
+
+# Serve /services from a short-lived cache; 0 disables it. ?dc= selections get their own.
+SERVICES_CACHE = services_cache()
+DC_CACHES = {}
+
+@app.route("/services", methods=["GET"])
+def list_services():
+    """Every service, or with ?prefix=, ?status=, ?tag=, ?meta=key:value, ?after= and ?limit= only the
+    ones selected (and only those probed); ?fields= keeps just the listed fields of each entry."""
+    cache, dcs = SERVICES_CACHE, None
+    if request.args.get("dc"):
+        dcs = tuple(dict.fromkeys(request.args["dc"].split(",")))
+        unknown = [dc for dc in dcs if dc not in DATACENTERS]
+        if unknown:
+            return jsonify({"error": f"unknown datacenter: {', '.join(unknown)}"}), 400
+        cache = DC_CACHES.get(dcs) or DC_CACHES.setdefault(dcs, services_cache(dcs))
+    try:
+        query = ServiceQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if query.selects:
+        try:
+            results, cursor = query_services(query, dcs)
+        except FilterUnavailable as e:
+            return jsonify({"error": str(e)}), 503
+        resp = encoding.respond(app.response_class, request, results)
+        if cursor is not None:
+            resp.headers["X-Next-After"] = cursor
+        return resp
+    entry = cache.get()
+    if query.fields is not None:
+        return encoding.respond(app.response_class, request, [query.project(svc_data) for svc_data in entry.data])
+    # JSON, MessagePack, gzip or brotli per Accept/Accept-Encoding; each is encoded once per entry.
+    return encoding.respond(app.response_class, request, entry.data, entry.body, entry.etag, entry.variants)
+
+# Push updates over SSE from one shared refresh loop instead of per-client polling.
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "3.0"))
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15.0"))
+STREAM = ServiceStream(collect_services, interval=STREAM_INTERVAL)
+# Under gunicorn an open stream holds a worker thread for as long as it lasts, so a process serves
+# at most STREAM_MAX_CLIENTS of them (default: half its threads) and leaves the rest for /services
+# and the probes; later ones get 503 and the dashboard polls instead. gateway.asgi has no such cap.
+GATEWAY_THREADS = 16
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "0")) or max(1, thread_count(GATEWAY_THREADS) // 2)
+STREAM_SLOTS = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+
+@app.route("/services/stream", methods=["GET"])
+def stream_services():
+    if not STREAM_SLOTS.acquire(blocking=False):
+        resp = jsonify({"error": "too many open streams; poll /services instead"})
+        resp.headers["Retry-After"] = str(int(STREAM_INTERVAL) or 1)
+        return resp, 503
+    sub = QueueSubscriber()
+    snapshot = STREAM.subscribe(sub, timeout=STREAM_INTERVAL + SERVICES_DEADLINE)
+
+    def events():
+        yield snapshot
+        while not sub.closed:
+            try:
+                yield sub.queue.get(timeout=STREAM_KEEPALIVE)
+            except queue.Empty:
+                yield KEEPALIVE
+
+    def close():
+        # Runs when the server closes the response, even if the body was never started.
+        STREAM.unsubscribe(sub)
+        STREAM_SLOTS.release()
+
+    resp = app.response_class(events(), mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    resp.call_on_close(close)
+    return resp
+
+def latency_report(name, windows):
+    """Probe latency percentiles (ms) and outcomes of ``name``, overall and per instance, over each of
+    ``windows``; None for a name the gateway doesn't know (see known_name)."""
+    snap = WATCHER.snapshot()
+    if not known_name(snap, name):
+        return None
+    if snap is not None:
+        instances = known_instances(snap, name)
+    else:
+        try:
+            instances = lookup_instances(name, time.monotonic() + TIMEOUT)
         except Exception:
-            results.append({"service": name, "status": "offline",
-                            "timestamp": "N/A", "host": "N/A", "responseTime": None})
-    return jsonify(results)
+            instances = ()
+    backends = [backend_of(instance) for instance in instances]
+    return {
+        "service": name,
+        "windows": [dict(LATENCY.summary(backends, w), window=w) for w in windows],
+        "instances": [{"address": backend, "windows": [dict(LATENCY.summary((backend,), w), window=w)
+                                                       for w in windows]}
+                      for backend in backends],
+    }
+
+@app.route("/services/<name>/latency", methods=["GET"])
+def service_latency(name):
+    """latency_report() over each of LATENCY_WINDOWS or just ?window=<seconds>. Read from memory, like
+    the watcher's instances, and from this process's probes only."""
+    window = request.args.get("window", type=int)
+    if "window" in request.args and (window is None or window <= 0):
+        return jsonify({"error": "window must be a positive number of seconds"}), 400
+    report = latency_report(name, [window] if window else LATENCY_WINDOWS)
+    if report is None:
+        return jsonify({"error": f"unknown service: {name}"}), 404
+    return jsonify(report)
+
+@app.route("/debug/latency", methods=["GET"])
+def latency_stats():
+    return jsonify(LATENCY.stats)
+
+@app.route("/debug/cache", methods=["GET"])
+def cache_stats():
+    return jsonify(SERVICES_CACHE.stats)
+
+@app.route("/debug/dns", methods=["GET"])
+def dns_stats():
+    return jsonify(RESOLVER.stats if RESOLVER else {})
+
+@app.route("/debug/breakers", methods=["GET"])
+def breaker_state():
+    return jsonify(BREAKER.snapshot())
+
+# /svc/<name>/<path> forwards to a passing instance of <name>, picked like the probes pick one.
+PROXY = ReverseProxy(pool_size=int(os.getenv("PROXY_POOL_SIZE", "32")), connect_timeout=TIMEOUT,
+                     read_timeout=float(os.getenv("PROXY_READ_TIMEOUT", "30.0")))
+PROXY_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+# Names found with no passing instance -> until when to answer 503 without asking Consul again.
+PROXY_NEGATIVE_TTL = float(os.getenv("PROXY_NEGATIVE_TTL", "5.0"))
+PROXY_MISSES = {}
+PROXY_MISSES_MAX = 10_000
+
+def proxy_instances(name):
+    """Passing instances of ``name`` from the snapshot (or resolver), asking Consul only on a miss.
+
+    None for a name the gateway does not route to: one the watcher doesn't
+    track and that doesn't start with SERVICE_PREFIX, like /services.
+    """
+    snap = WATCHER.snapshot()
+    instances = snap.instances.get(name) if snap else None
+    if instances is not None:
+        return instances
+    if not known_name(snap, name):
+        return None
+    now = time.monotonic()
+    if PROXY_MISSES.get(name, 0) > now:
+        return ()
+    instances = lookup_instances(name, now + TIMEOUT)
+    if not instances and PROXY_NEGATIVE_TTL > 0:
+        if len(PROXY_MISSES) >= PROXY_MISSES_MAX:
+            PROXY_MISSES.clear()
+        PROXY_MISSES[name] = now + PROXY_NEGATIVE_TTL
+    return instances
+
+def proxy_error(status, message):
+    return jsonify({"error": message}), status
+
+@app.route("/svc/<name>/", defaults={"path": ""}, methods=PROXY_METHODS)
+@app.route("/svc/<name>/<path:path>", methods=PROXY_METHODS)
+def proxy(name, path):
+    try:
+        instances = proxy_instances(name)
+    except Exception as e:
+        app.logger.error("Proxy lookup of %s failed: %s", name, e)
+        return proxy_error(503, f"cannot resolve {name}")
+    if instances is None:
+        return proxy_error(404, f"unknown service {name}")
+    if not instances:
+        return proxy_error(503, f"no passing instance of {name}")
+
+    target = "/" + path + (f"?{request.query_string.decode('latin-1')}" if request.query_string else "")
+    headers = ReverseProxy.request_headers(request.headers, request.remote_addr or "", request.host, request.scheme)
+    has_body = request.content_length is not None or "chunked" in request.headers.get("Transfer-Encoding", "")
+    body = request.stream if has_body else None
+    # Only a request whose body hasn't been sent can move on to the next instance.
+    retry = request.method in IDEMPOTENT and body is None
+    error = None
+    for instance in BALANCER.order(name, instances):
+        backend = backend_of(instance)
+        if not BREAKER.allow(backend):
+            continue
+        BALANCER.begin(instance)
+        t0 = time.perf_counter()
+        try:
+            with track("proxy_upstream"):
+                upstream = PROXY.open(request.method, instance, target, headers, body, request.content_length)
+        except Exception as e:
+            BREAKER.failure(backend)
+            BALANCER.end(instance, None)
+            error = e
+            if retry:
+                continue
+            break
+        BREAKER.success(backend)
+        BALANCER.end(instance, time.perf_counter() - t0)
+        return app.response_class(PROXY.stream(upstream), status=upstream.status,
+                                  headers=ReverseProxy.response_headers(upstream.headers), direct_passthrough=True)
+    if error is None:
+        return proxy_error(503, f"every instance of {name} is failing")
+    app.logger.warning("Proxy to %s failed: %s", name, error)
+    if is_timeout(error):
+        return proxy_error(504, f"{name} did not answer in time")
+    return proxy_error(502, f"{name} is unreachable")
+
+# Past this age of the freshest successful Consul read (watcher long-poll or direct call), /readyz
+# only stays ready while a catalog can still be served from memory or the saved snapshot, and says
+# it is stale. Long-polls answer at least every CATALOG_WATCH_WAIT, so keep it above that.
+READY_MAX_SYNC_AGE = float(os.getenv("READY_MAX_SYNC_AGE", "45"))
+LIVEZ_BODY = b"ok\n"
+
+def sync_age():
+    """Seconds since any watcher or the Consul client last heard from Consul, or None if never."""
+    syncs = [w.last_sync for w in (WATCHERS.values() if DATACENTERS else (WATCHER,))]
+    syncs.append(CONSUL.last_success)
+    syncs = [t for t in syncs if t is not None]
+    return time.monotonic() - max(syncs) if syncs else None
+
+def last_known_good():
+    """Whether /services can answer without Consul: some watcher has a snapshot, or one was saved."""
+    return LAST_GOOD is not None or any(
+        w.snapshot() is not None for w in (WATCHERS.values() if DATACENTERS else (WATCHER,)))
+
+def readiness():
+    """(ready, body) from in-memory state only; probes must never wait on Consul or a backend.
+
+    A Consul outage doesn't pull the pod out of rotation while it can serve a
+    last-known-good catalog: it stays ready, with "stale": true.
+    """
+    age = sync_age()
+    fresh = age is not None and age <= READY_MAX_SYNC_AGE
+    ready = fresh or last_known_good()
+    body = {"status": "ready" if ready else "not ready", "syncAge": None if age is None else round(age, 3)}
+    if ready and not fresh:
+        body["stale"] = True
+    return ready, body
+
+@app.route("/livez", methods=["GET"])
+def livez():
+    return app.response_class(LIVEZ_BODY, mimetype="text/plain")
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ready, body = readiness()
+    return jsonify(body), 200 if ready else 503
 
 @app.route("/healthz", methods=["GET"])
 def proxy_healthz():
     try:
-        r = SESSION.get("http://healthz:6000/report", timeout=TIMEOUT)
-        r.raise_for_status()
+        with track("healthz_report"):
+            r = SESSION.get(HEALTHZ_REPORT, timeout=TIMEOUT)
+            r.raise_for_status()
         return jsonify(r.json())
     except Exception:
         return jsonify([])
 
+def start_watchers():
+    for watcher in WATCHERS.values() if DATACENTERS else (WATCHER,):
+        watcher.start()
+    # The scheduler probes what the watchers find.
+    if PROBE_MODE == "scheduled":
+        SCHEDULER.start()
+
+def stop_watchers():
+    SCHEDULER.stop()
+    for watcher in WATCHERS.values() if DATACENTERS else (WATCHER,):
+        watcher.stop()
+
 if __name__ == "__main__":
-    app.run(host=BIND_HOST, port=8000)
+    # The watcher snapshot, breakers, balancer and EWMA state, the /services cache, latency history,
+    # the probe scheduler and the SSE refresh loop all live in process memory,
+    # so the gateway runs one worker (with more threads) unless WEB_WORKERS says otherwise.
+    serve(app, BIND_HOST, 8000, on_worker_start=start_watchers if CATALOG_WATCH else None,
+          asgi_app="gateway.asgi:app", workers=1, threads=GATEWAY_THREADS)
@@ -0,0 +1,419 @@
+"""asyncio variant of the gateway with the same /services, /healthz and latency history contracts.
+
+Outbound calls share one keep-alive aiohttp pool, so a single worker can keep
+thousands of probes in flight. Configuration (Consul URLs, deadlines, the
+catalog watcher) comes from gateway.app.
+
+    uvicorn gateway.asgi:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import parse_qs, parse_qsl
+
+import aiohttp
+from werkzeug.datastructures import MultiDict
+
+from common import encoding, metrics
+from gateway import app as core
+from gateway.stream import KEEPALIVE, AsyncSubscriber
+from gateway.index import FilterUnavailable, ServiceIndex, ServiceQuery
+from gateway.watcher import parse_instances
+
+log = logging.getLogger(__name__)
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", "256"))
+ASYNC_MAX_INFLIGHT = int(os.getenv("ASYNC_MAX_INFLIGHT", "4096"))
+
+# Both are created on first use so they belong to the serving event loop.
+CLIENT = None
+_inflight = None
+
+
+def client():
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = aiohttp.ClientSession(
+            headers={"Accept": "application/json"},
+            connector=aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, keepalive_timeout=30),
+        )
+    return CLIENT
+
+
+def inflight():
+    global _inflight
+    if _inflight is None:
+        _inflight = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    return _inflight
+
+
+async def get_json(url, timeout, target):
+    with metrics.track(target):
+        async with client().get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+            r.raise_for_status()
+            return await r.json(content_type=None)
+
+
+async def get_registered_service_names(prefix=None, consul=None, timeout=None):
+    if prefix is None:
+        prefix = core.SERVICE_PREFIX
+    url = consul.url("/v1/catalog/services") if consul else core.CATALOG_SERVICES
+    try:
+        services = await get_json(url, timeout or core.TIMEOUT, "consul_catalog")
+        if consul is None:
+            # Readiness and the last-known-good fallback go by the local client's last answer.
+            core.CONSUL.last_success = time.monotonic()
+        names = [name for name in services.keys() if name.startswith(prefix)]
+        log.info("Discovered services: %s", names)
+        return names
+    except Exception as e:
+        log.error("Failed to load catalog services: %s", e)
+        return []
+
+
+async def probe_instance(instance, deadline):
+    backend = core.backend_of(instance)
+    core.BALANCER.begin(instance)
+    t0 = None
+    try:
+        async with inflight():
+            t0 = time.perf_counter()
+            svc_data = await get_json(f"http://{backend}/info", core.remaining(deadline), "backend_info")
+            t1 = time.perf_counter()
+    except (Exception, asyncio.CancelledError):
+        # Cancelled at the request deadline counts as a failure too (once the request went out).
+        if t0 is not None:
+            core.LATENCY.record(backend, (time.perf_counter() - t0) * 1000, ok=False)
+        core.BREAKER.failure(backend)
+        core.BALANCER.end(instance, None)
+        raise
+    core.LATENCY.record(backend, (t1 - t0) * 1000)
+    core.BREAKER.success(backend)
+    core.BALANCER.end(instance, t1 - t0)
+    svc_data["status"] = "online"
+    svc_data["responseTime"] = int((t1 - t0) * 1000)
+    return svc_data
+
+
+async def probe_one_instance(instance, deadline):
+    if not core.BREAKER.allow(core.backend_of(instance)):
+        return None
+    try:
+        return await probe_instance(instance, deadline)
+    except Exception:
+        return None
+
+
+async def probe_all_instances(name, instances, deadline):
+    results = await asyncio.gather(*(probe_one_instance(inst, deadline) for inst in instances))
+    svc_data = next((dict(r) for r in results if r is not None), None) or core.offline(name)
+    svc_data["instances"] = [core.instance_entry(inst, r) for inst, r in zip(instances, results)]
+    return svc_data
+
+
+async def probe_service(name, deadline, snap=None, consul=None):
+    instances = ()
+    try:
+        instances = snap.instances.get(name) if snap else None
+        if instances is None and core.RESOLVER is not None and consul is None:
+            # A cache hit costs no I/O; a miss does the (blocking) DNS query off the event loop.
+            instances = core.RESOLVER.cached(name)
+            if instances is None:
+                instances = await asyncio.get_running_loop().run_in_executor(None, core.RESOLVER.resolve, name)
+        if instances is None:
+            url = (consul.url(f"/v1/health/service/{name}?passing=true") if consul
+                   else f"{core.HEALTH_SERVICE}{name}?passing=true")
+            async with inflight():
+                entries = await get_json(url, core.remaining(deadline), "consul_health")
+            instances = parse_instances(entries)
+        if not instances:
+            svc_data = core.offline(name)
+        elif core.PROBE_ALL_INSTANCES:
+            svc_data = await probe_all_instances(name, instances, deadline)
+        else:
+            instance = next((i for i in core.BALANCER.order(name, instances)
+                             if core.BREAKER.allow(core.backend_of(i))), None)
+            svc_data = core.offline(name) if instance is None else await probe_instance(instance, deadline)
+    except Exception:
+        svc_data = core.offline(name)
+    return core.with_p99(svc_data, instances or ())
+
+
+async def probe_datacenter(consul, snap, deadline, names=None):
+    if names is None:
+        names = (list(snap.names) if snap
+                 else await get_registered_service_names(consul=consul, timeout=core.remaining(deadline)))
+    if not names:
+        return []
+    tasks = [asyncio.ensure_future(probe_service(name, deadline, snap, consul)) for name in names]
+    done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    for task in pending:
+        task.cancel()
+    return [task.result() if task in done else core.offline(name) for name, task in zip(names, tasks)]
+
+
+async def list_datacenter(consul, watcher, deadline, dc=None):
+    snap, stale = core.warm_snapshot(watcher, dc)
+    if core.PROBE_MODE == "scheduled" and snap is not None and snap is not core.LAST_GOOD:
+        results = [core.scheduled_service(name, core.known_instances(snap, name), dc) for name in snap.names]
+    else:
+        started = time.monotonic()
+        results = await probe_datacenter(consul, snap, deadline)
+        if (not results and snap is None and dc is None and core.LAST_GOOD is not None
+                and not core.consul_answered_since(started)):
+            snap, stale = core.LAST_GOOD, True
+            results = await probe_datacenter(consul, snap, deadline)
+    for svc_data in results:
+        if dc is not None:
+            svc_data["datacenter"] = dc
+        if stale:
+            svc_data["stale"] = True
+    return results
+
+
+async def list_services(dcs=None):
+    if not core.DATACENTERS:
+        return await list_datacenter(None, core.WATCHER, time.monotonic() + core.SERVICES_DEADLINE)
+    deadline = time.monotonic() + min(core.DC_DEADLINE, core.SERVICES_DEADLINE)
+    slices = await asyncio.gather(*(list_datacenter(core.DATACENTERS[dc], core.WATCHERS[dc], deadline, dc)
+                                    for dc in dcs or core.DATACENTERS))
+    return [svc_data for results in slices for svc_data in results]
+
+
+async def catalog_index(consul, deadline):
+    """core.catalog_index() over the pooled client."""
+    url = consul.url("/v1/catalog/services") if consul else core.CATALOG_SERVICES
+    try:
+        services = await get_json(url, core.remaining(deadline), "consul_catalog")
+    except Exception as e:
+        log.error("Failed to load catalog services: %s", e)
+        return None
+    if consul is None:
+        core.CONSUL.last_success = time.monotonic()
+    return ServiceIndex.from_catalog({name: tags for name, tags in services.items()
+                                      if name.startswith(core.SERVICE_PREFIX)})
+
+
+async def query_datacenter(consul, watcher, deadline, query, dc=None):
+    """core.query_datacenter(), probing the selected names on the event loop."""
+    index = watcher.index
+    snap, stale = core.warm_snapshot(watcher, dc)
+    if snap is None:
+        index = await catalog_index(consul, deadline)
+        if index is None and dc is None and core.LAST_GOOD is not None:
+            snap, stale = core.LAST_GOOD, True
+    if core.LAST_GOOD is not None and snap is core.LAST_GOOD:
+        index = core.LAST_GOOD_INDEX
+    if index is None:
+        return [], False
+    names = query.select(index)
+    more = query.limit is not None and len(names) > query.limit and not query.status
+    if more:
+        names = names[:query.limit]
+    if core.scheduled_view(snap):
+        results = [core.scheduled_service(name, core.known_instances(snap, name), dc) for name in names]
+    else:
+        results = await probe_datacenter(consul, snap, deadline, names) if names else []
+    return list(zip(names, core.label(results, dc, stale))), more
+
+
+async def query_services(query, dcs=None):
+    """(entries, cursor of the next page or None) for ``query``; raises FilterUnavailable."""
+    if not core.DATACENTERS:
+        return query.page([await query_datacenter(None, core.WATCHER, time.monotonic() + core.SERVICES_DEADLINE,
+                                                  query)])
+    deadline = time.monotonic() + min(core.DC_DEADLINE, core.SERVICES_DEADLINE)
+    views = await asyncio.gather(*(query_datacenter(core.DATACENTERS[dc], core.WATCHERS[dc], deadline, query, dc)
+                                   for dc in dcs or core.DATACENTERS))
+    return query.page(views)
+
+
+async def proxy_healthz():
+    try:
+        return await get_json(core.HEALTHZ_REPORT, core.TIMEOUT, "healthz_report")
+    except Exception:
+        return []
+
+
+async def stream_services(receive, send):
+    loop = asyncio.get_running_loop()
+    sub = AsyncSubscriber(loop)
+    # subscribe() may wait for the first refresh, so keep it off the event loop.
+    snapshot = await loop.run_in_executor(
+        None, core.STREAM.subscribe, sub, core.STREAM_INTERVAL + core.SERVICES_DEADLINE)
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        sub.close()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                                (b"cache-control", b"no-cache"),
+                                (b"x-accel-buffering", b"no")]})
+        await send({"type": "http.response.body", "body": snapshot, "more_body": True})
+        while not sub.closed:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), core.STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                event = KEEPALIVE
+            if event:
+                await send({"type": "http.response.body", "body": event, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        watcher.cancel()
+        core.STREAM.unsubscribe(sub)
+
+
+async def breaker_state():
+    return core.BREAKER.snapshot()
+
+
+async def latency_stats():
+    return core.LATENCY.stats
+
+
+ROUTES = {
+    "/healthz": proxy_healthz,
+    "/debug/breakers": breaker_state,
+    "/debug/latency": latency_stats,
+}
+
+
+async def send_services(scope, send):
+    """/services with the Flask app's ?dc=, filter, ?fields= and paging arguments."""
+    args = MultiDict(parse_qsl(scope.get("query_string", b"").decode(), keep_blank_values=True))
+    dcs = None
+    if args.get("dc"):
+        dcs = tuple(dict.fromkeys(args["dc"].split(",")))
+        unknown = [dc for dc in dcs if dc not in core.DATACENTERS]
+        if unknown:
+            return await send_json(send, 400, {"error": f"unknown datacenter: {', '.join(unknown)}"})
+    try:
+        query = ServiceQuery.from_args(args)
+    except ValueError as e:
+        return await send_json(send, 400, {"error": str(e)})
+    extra = {}
+    if query.selects:
+        try:
+            results, cursor = await handle(scope["path"], scope["method"], lambda: query_services(query, dcs))
+        except FilterUnavailable as e:
+            return await send_json(send, 503, {"error": str(e)})
+        if cursor is not None:
+            extra["X-Next-After"] = cursor
+    else:
+        results = [query.project(svc_data)
+                   for svc_data in await handle(scope["path"], scope["method"], lambda: list_services(dcs))]
+    await send_json(send, 200, results, dict(scope["headers"]), extra)
+
+
+async def send_latency(scope, send):
+    """/services/<name>/latency, as the Flask app serves it."""
+    name = scope["path"][len("/services/"):-len("/latency")]
+    if not name or "/" in name:
+        return await send_json(send, 404, {"error": "not found"})
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    window = None
+    if "window" in query:
+        window = int(query["window"][0]) if query["window"][0].isdigit() else 0
+        if window <= 0:
+            return await send_json(send, 400, {"error": "window must be a positive number of seconds"})
+    # Without a watcher snapshot the instances come from a (blocking) Consul call.
+    report = await asyncio.get_running_loop().run_in_executor(
+        None, core.latency_report, name, [window] if window else core.LATENCY_WINDOWS)
+    if report is None:
+        return await send_json(send, 404, {"error": f"unknown service: {name}"})
+    await send_json(send, 200, report)
+
+
+def encode(payload):
+    # Laid out as Flask's jsonify does outside debug mode; see encoding.dumps for where the bytes differ.
+    return encoding.dumps(payload)
+
+
+async def send_json(send, status, payload, request_headers=None, extra_headers=None):
+    """Send ``payload`` as JSON, or in the representation ``request_headers`` negotiate."""
+    if request_headers is None:
+        body, headers = encode(payload), {"Content-Type": encoding.JSON}
+    else:
+        body, headers, _ = encoding.represent(payload, request_headers.get(b"accept", b"").decode("latin-1"),
+                                              request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+    headers.update(extra_headers or {})
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+                + [(b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_metrics(send):
+    body = metrics.render().encode()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", metrics.CONTENT_TYPE.encode()),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_livez(send):
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(core.LIVEZ_BODY)).encode())]})
+    await send({"type": "http.response.body", "body": core.LIVEZ_BODY})
+
+
+async def handle(path, method, handler):
+    metrics.INBOUND_IN_FLIGHT.labels().inc()
+    t0 = time.perf_counter_ns()
+    try:
+        return await handler()
+    except Exception:
+        metrics.INBOUND_ERRORS.labels(path, method).inc()
+        raise
+    finally:
+        metrics.INBOUND_IN_FLIGHT.labels().dec()
+        metrics.INBOUND_LATENCY.labels(path, method).observe((time.perf_counter_ns() - t0) / 1e9)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if core.CATALOG_WATCH:
+                core.start_watchers()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            core.stop_watchers()
+            if CLIENT is not None:
+                await CLIENT.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/services/stream" and scope["method"] == "GET":
+        return await stream_services(receive, send)
+    if scope["path"] == "/metrics" and scope["method"] == "GET":
+        return await send_metrics(send)
+    if scope["path"] == "/livez" and scope["method"] == "GET":
+        return await send_livez(send)
+    if scope["path"].startswith("/services/") and scope["path"].endswith("/latency") and scope["method"] == "GET":
+        return await send_latency(scope, send)
+    if scope["path"] == "/services":
+        if scope["method"] not in ("GET", "HEAD"):
+            return await send_json(send, 405, {"error": "method not allowed"})
+        return await send_services(scope, send)
+    if scope["path"] == "/readyz" and scope["method"] == "GET":
+        ready, body = core.readiness()
+        return await send_json(send, 200 if ready else 503, body)
+    handler = ROUTES.get(scope["path"])
+    if handler is None:
+        return await send_json(send, 404, {"error": "not found"})
+    if scope["method"] not in ("GET", "HEAD"):
+        return await send_json(send, 405, {"error": "method not allowed"})
+    await send_json(send, 200, await handle(scope["path"], scope["method"], handler), dict(scope["headers"]))
@@ -0,0 +1,90 @@
+import itertools
+import threading
+
+
+class Balancer:
+    """Orders a service's passing instances for probing.
+
+    ``order`` returns the instances best-first; callers probe the first one
+    they are allowed to and report the outcome with ``begin``/``end`` so
+    strategies can track outstanding requests and latency. Instances are
+    ``(address, port)`` tuples as produced by ``parse_instances``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._turns = {}
+        self._outstanding = {}
+
+    def _rotate(self, name, instances):
+        with self._lock:
+            turn = self._turns.setdefault(name, itertools.count())
+            start = next(turn) % len(instances)
+        return list(instances[start:]) + list(instances[:start])
+
+    def order(self, name, instances):
+        return self._rotate(name, instances)
+
+    def begin(self, instance):
+        with self._lock:
+            self._outstanding[instance] = self._outstanding.get(instance, 0) + 1
+
+    def end(self, instance, seconds):
+        """Record a finished probe; ``seconds`` is None when it failed."""
+        with self._lock:
+            left = self._outstanding.get(instance, 1) - 1
+            if left > 0:
+                self._outstanding[instance] = left
+            else:
+                self._outstanding.pop(instance, None)
+
+
+class RoundRobin(Balancer):
+    pass
+
+
+class LeastOutstanding(Balancer):
+    def order(self, name, instances):
+        # Rotating first spreads ties instead of always picking the first instance.
+        rotated = self._rotate(name, instances)
+        return sorted(rotated, key=lambda inst: self._outstanding.get(inst, 0))
+
+
+class Ewma(Balancer):
+    """Prefers the lowest latency EWMA, weighted by outstanding requests.
+
+    Instances without samples score 0 so they are tried first. A failed probe
+    counts as ``penalty`` seconds.
+    """
+
+    def __init__(self, alpha=0.3, penalty=2.5):
+        super().__init__()
+        self.alpha = alpha
+        self.penalty = penalty
+        self._ewma = {}
+
+    def order(self, name, instances):
+        rotated = self._rotate(name, instances)
+        return sorted(rotated, key=lambda inst: self._ewma.get(inst, 0.0) * (self._outstanding.get(inst, 0) + 1))
+
+    def end(self, instance, seconds):
+        super().end(instance, seconds)
+        if seconds is None:
+            seconds = self.penalty
+        with self._lock:
+            prev = self._ewma.get(instance)
+            self._ewma[instance] = seconds if prev is None else self.alpha * seconds + (1 - self.alpha) * prev
+
+
+STRATEGIES = {
+    "round-robin": RoundRobin,
+    "least-outstanding": LeastOutstanding,
+    "ewma": Ewma,
+}
+
+
+def make_balancer(strategy):
+    try:
+        return STRATEGIES[strategy]()
+    except KeyError:
+        raise ValueError(f"unknown probe strategy {strategy!r}, expected one of {sorted(STRATEGIES)}") from None
@@ -0,0 +1,71 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Circuit breakers for backends, keyed by ``"address:port"``.
+
+    After ``threshold`` consecutive failures a backend's circuit opens and
+    ``allow`` returns False, so callers skip the network call. Once
+    ``reset_timeout`` has passed one trial call is let through (half-open):
+    success closes the circuit, failure opens it again. A trial that never
+    reports back counts as failed after another ``reset_timeout``.
+    A ``threshold`` of 0 disables the breaker.
+    """
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._circuits = {}
+
+    def allow(self, key):
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit["state"] == CLOSED:
+                return True
+            now = self.clock()
+            if now < circuit["retry_at"]:
+                return False
+            circuit["state"] = HALF_OPEN
+            circuit["retry_at"] = now + self.reset_timeout
+            return True
+
+    def success(self, key):
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def failure(self, key):
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(key, {"state": CLOSED, "failures": 0, "retry_at": 0.0})
+            circuit["failures"] += 1
+            if circuit["state"] == HALF_OPEN or circuit["failures"] >= self.threshold:
+                circuit["state"] = OPEN
+                circuit["retry_at"] = self.clock() + self.reset_timeout
+
+    def state(self, key):
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit["state"] if circuit else CLOSED
+
+    def snapshot(self):
+        """Breakers with recent failures, for the debug endpoint. Closed ones with no failures are omitted."""
+        now = self.clock()
+        with self._lock:
+            return {
+                key: {
+                    "state": c["state"],
+                    "failures": c["failures"],
+                    "retryIn": round(max(0.0, c["retry_at"] - now), 3) if c["state"] != CLOSED else None,
+                }
+                for key, c in sorted(self._circuits.items())
+            }
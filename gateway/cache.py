@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import namedtuple
+
+log = logging.getLogger(__name__)
+
+# data: what compute() returned when there is an encode step; variants: other encodings of it.
+CacheEntry = namedtuple("CacheEntry", "body etag at data variants", defaults=(None, None))
+
+
+class ResponseCache:
+    """Stale-while-revalidate cache for one encoded response body.
+
+    Within ``ttl`` the cached body is served as-is. For ``max_stale`` seconds
+    after that the stale body is still served while one background refresh runs.
+    Older (or missing) entries are refreshed inline. Refreshes are single-flight:
+    concurrent callers share one computation instead of starting their own.
+    A ``ttl`` of 0 disables caching.
+
+    With ``encode``, ``compute`` returns data and the body is ``encode(data)``;
+    each entry keeps the data and an empty ``variants`` dict for callers that
+    serve other representations of it.
+    """
+
+    def __init__(self, compute, ttl, max_stale, encode=None):
+        self.compute = compute
+        self.encode = encode
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entry = None
+        self._fill = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get(self):
+        if self.ttl <= 0:
+            self._count("misses")
+            return self._build()
+        entry = self._entry
+        age = time.monotonic() - entry.at if entry else None
+        if entry and age < self.ttl:
+            self._count("hits")
+            return entry
+        if entry and age < self.ttl + self.max_stale:
+            self._count("stale")
+            self._refresh_in_background()
+            return entry
+        self._count("misses")
+        return self._refresh()
+
+    def _build(self):
+        if self.encode is None:
+            body, data, variants = self.compute(), None, None
+        else:
+            data = self.compute()
+            body, variants = self.encode(data), {}
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        return CacheEntry(body, etag, time.monotonic(), data, variants)
+
+    def _refresh(self):
+        with self._fill:
+            entry = self._entry
+            # Another caller may have refreshed while we waited for the lock.
+            if entry and time.monotonic() - entry.at < self.ttl:
+                return entry
+            self._entry = self._build()
+            return self._entry
+
+    def _refresh_in_background(self):
+        if not self._fill.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._entry = self._build()
+            except Exception as e:
+                log.error("Background refresh failed: %s", e)
+            finally:
+                self._fill.release()
+
+        threading.Thread(target=run, name="cache-refresh", daemon=True).start()
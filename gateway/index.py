@@ -0,0 +1,193 @@
+import bisect
+import threading
+
+_EMPTY = frozenset()
+
+
+class FilterUnavailable(Exception):
+    """The query filters on something this index doesn't track (meta without health watches, say)."""
+
+
+def _after_prefix(prefix):
+    """The first string greater than every string that starts with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class ServiceIndex:
+    """Service names kept sorted, plus inverted indexes from tag and meta pair to names.
+
+    A prefix or ``after`` cursor is a bisection into the sorted names. Tag and
+    ``(key, value)`` meta filters walk the smallest matching set in name order
+    from the cursor (sorted once, until it changes), keeping the names that
+    are in the other sets too, and stop at the limit. The catalog watcher
+    threads write; every method holds the lock, so a reader never sees half
+    of a change.
+    """
+
+    def __init__(self, names=(), tags=True, meta=True):
+        self.has_tags = tags
+        self.has_meta = meta
+        self._lock = threading.Lock()
+        self._names = sorted(names)
+        self._tags = {}
+        self._meta = {}
+        # tag -> names, (key, value) -> names
+        self._by_tag = {}
+        self._by_meta = {}
+        # ("tag", tag) or ("meta", pair) -> its names sorted, built on first use
+        self._sorted = {}
+
+    @classmethod
+    def from_catalog(cls, services, meta=False):
+        """An index of {name: tags}, as /v1/catalog/services returns it."""
+        index = cls(meta=meta)
+        index.sync(services)
+        return index
+
+    def __len__(self):
+        return len(self._names)
+
+    def sync(self, services):
+        """Make ``services`` ({name: tags}, the whole catalog) what the index holds."""
+        with self._lock:
+            current = set(self._names)
+            removed = current - services.keys()
+            added = services.keys() - current
+            for name in removed:
+                self._assign("tag", self._tags, self._by_tag, name, _EMPTY)
+                self._assign("meta", self._meta, self._by_meta, name, _EMPTY)
+            if len(removed) + len(added) > 64:
+                self._names = sorted(services)
+            else:
+                for name in removed:
+                    del self._names[bisect.bisect_left(self._names, name)]
+                for name in added:
+                    bisect.insort(self._names, name)
+            for name, tags in services.items():
+                self._assign("tag", self._tags, self._by_tag, name, frozenset(tags or ()))
+
+    def set_meta(self, name, meta):
+        """Index ``name`` under each (key, value) of ``meta``, replacing what it had."""
+        with self._lock:
+            self._assign("meta", self._meta, self._by_meta, name, frozenset(meta))
+
+    def _assign(self, kind, current, inverted, name, values):
+        old = current.get(name, _EMPTY)
+        if old == values:
+            return
+        for value in old - values:
+            names = inverted[value]
+            names.discard(name)
+            if not names:
+                del inverted[value]
+            self._sorted.pop((kind, value), None)
+        for value in values - old:
+            inverted.setdefault(value, set()).add(name)
+            self._sorted.pop((kind, value), None)
+        if values:
+            current[name] = values
+        else:
+            current.pop(name, None)
+
+    def select(self, prefix="", tags=(), meta=(), after=None, limit=None):
+        """Sorted names starting with ``prefix`` that carry every tag and (key, value) pair, after ``after``.
+
+        Raises FilterUnavailable for tag or meta filters the index has no data for.
+        """
+        if tags and not self.has_tags:
+            raise FilterUnavailable("tag filters need the catalog watcher")
+        if meta and not self.has_meta:
+            raise FilterUnavailable("meta filters need the catalog watcher's health watches")
+        with self._lock:
+            names = self._names
+            lo = bisect.bisect_left(names, prefix) if prefix else 0
+            if after is not None:
+                lo = max(lo, bisect.bisect_right(names, after))
+            hi = bisect.bisect_left(names, _after_prefix(prefix), lo) if prefix else len(names)
+            if not tags and not meta:
+                return names[lo:hi if limit is None else min(hi, lo + limit)]
+            filters = [(self._by_tag.get(tag, _EMPTY), ("tag", tag)) for tag in tags]
+            filters += [(self._by_meta.get(pair, _EMPTY), ("meta", pair)) for pair in meta]
+            filters.sort(key=lambda f: len(f[0]))
+            (smallest, key), rest = filters[0], [members for members, _ in filters[1:]]
+            # Walk the smallest set in name order from the cursor; its sorted form is kept until it changes.
+            ordered = self._sorted.get(key)
+            if ordered is None:
+                ordered = self._sorted[key] = sorted(smallest)
+            start = bisect.bisect_left(ordered, names[lo]) if lo < len(names) else len(ordered)
+            end = bisect.bisect_left(ordered, names[hi]) if hi < len(names) else len(ordered)
+            out = []
+            for i in range(start, end):
+                name = ordered[i]
+                if all(name in members for members in rest):
+                    out.append(name)
+                    if len(out) == limit:
+                        break
+            return out
+
+
+class ServiceQuery:
+    """What a /services request selects: ``prefix``, ``status``, ``tag`` and ``meta=key:value``
+    (both repeatable, all must match), ``fields`` to keep, and a ``limit`` page after the ``after`` name.
+    """
+
+    def __init__(self, prefix="", status=None, tags=(), meta=(), fields=None, after=None, limit=None):
+        self.prefix = prefix
+        self.status = status
+        self.tags = tuple(tags)
+        self.meta = tuple(meta)
+        self.fields = fields
+        self.after = after
+        self.limit = limit
+
+    @classmethod
+    def from_args(cls, args):
+        """The query in request ``args`` (a MultiDict); raises ValueError on a malformed one."""
+        meta = []
+        for item in args.getlist("meta"):
+            key, sep, value = item.partition(":")
+            if not sep or not key:
+                raise ValueError(f"meta filter {item!r} is not key:value")
+            meta.append((key, value))
+        limit = args.get("limit")
+        if limit is not None:
+            if not limit.isdigit() or int(limit) < 1:
+                raise ValueError("limit must be a positive integer")
+            limit = int(limit)
+        fields = args.get("fields")
+        return cls(prefix=args.get("prefix", ""), status=args.get("status") or None, tags=args.getlist("tag"),
+                   meta=meta, fields=tuple(f for f in fields.split(",") if f) if fields else None,
+                   after=args.get("after") or None, limit=limit)
+
+    @property
+    def selects(self):
+        """Whether the query narrows the listing (rather than only projecting it)."""
+        return bool(self.prefix or self.status or self.tags or self.meta or self.after or self.limit)
+
+    def select(self, index):
+        """Names to probe from ``index``: one more than a page, so the caller can tell if there is another.
+
+        With a status filter every match is probed; the page is cut after the statuses are known.
+        """
+        limit = None if self.limit is None or self.status else self.limit + 1
+        return index.select(self.prefix, self.tags, self.meta, self.after, limit)
+
+    def page(self, views):
+        """(entries, cursor for the next page or None) from per-datacenter ([(name, entry)], more) views."""
+        pairs = [pair for pairs, _ in views for pair in pairs]
+        if self.status:
+            pairs = [(name, entry) for name, entry in pairs if entry.get("status") == self.status]
+        more = any(more for _, more in views)
+        if self.limit is not None:
+            names = sorted({name for name, _ in pairs})
+            if len(names) > self.limit:
+                more = True
+                last = names[self.limit - 1]
+                pairs = [(name, entry) for name, entry in pairs if name <= last]
+        cursor = max(name for name, _ in pairs) if more and pairs else None
+        return [self.project(entry) for _, entry in pairs], cursor
+
+    def project(self, entry):
+        if self.fields is None:
+            return entry
+        return {field: entry[field] for field in self.fields if field in entry}
@@ -0,0 +1,92 @@
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+QUANTILES = ((50, 0.50), (90, 0.90), (99, 0.99))
+
+
+class _Ring:
+    __slots__ = ("latencies", "times", "next")
+
+    def __init__(self, capacity):
+        # A failed probe is stored as NaN; a slot never written has time -inf.
+        self.latencies = array("f", bytes(4 * capacity))
+        self.times = array("d", [-math.inf]) * capacity
+        self.next = 0
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class LatencyHistory:
+    """The last ``capacity`` probe outcomes of each instance, in fixed-size ring buffers.
+
+    Each instance costs ``capacity`` float32 latencies plus ``capacity``
+    float64 timestamps, allocated on its first sample. At most
+    ``max_instances`` are kept: a new one takes over the buffers of the
+    instance that has gone longest without a sample, so memory never grows
+    past ``max_instances * capacity * 12`` bytes. Percentiles are computed on
+    read, from the samples inside the requested window.
+    """
+
+    def __init__(self, capacity=128, max_instances=10_000, clock=time.monotonic):
+        self.capacity = capacity
+        self.max_instances = max_instances
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> _Ring, least recently recorded first
+        self._rings = OrderedDict()
+
+    def record(self, key, ms, ok=True):
+        """Add one probe of ``key`` that took ``ms`` milliseconds (and failed, unless ``ok``)."""
+        now = self.clock()
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is not None:
+                self._rings.move_to_end(key)
+            elif len(self._rings) >= self.max_instances:
+                _, ring = self._rings.popitem(last=False)
+                ring.times[:] = array("d", [-math.inf]) * self.capacity
+                ring.next = 0
+                self._rings[key] = ring
+            else:
+                ring = self._rings[key] = _Ring(self.capacity)
+            i = ring.next
+            ring.latencies[i] = ms if ok else math.nan
+            ring.times[i] = now
+            ring.next = i + 1 if i + 1 < self.capacity else 0
+
+    def summary(self, keys, window):
+        """{"samples", "ok", "failed", "p50", "p90", "p99"} over the last ``window`` seconds of ``keys``.
+
+        Percentiles are of successful probes, in ms; None without any.
+        """
+        since = self.clock() - window
+        latencies, failed = [], 0
+        with self._lock:
+            for key in keys:
+                ring = self._rings.get(key)
+                if ring is None:
+                    continue
+                for ms, at in zip(ring.latencies, ring.times):
+                    if at < since:
+                        continue
+                    if ms != ms:
+                        failed += 1
+                    else:
+                        latencies.append(ms)
+        latencies.sort()
+        out = {"samples": len(latencies) + failed, "ok": len(latencies), "failed": failed}
+        for name, q in QUANTILES:
+            out[f"p{name}"] = round(percentile(latencies, q), 2) if latencies else None
+        return out
+
+    @property
+    def stats(self):
+        instances = len(self._rings)
+        return {"instances": instances, "capacity": self.capacity, "maxInstances": self.max_instances,
+                "bytes": instances * self.capacity * 12}
@@ -0,0 +1,81 @@
+import logging
+
+import urllib3
+
+log = logging.getLogger(__name__)
+
+# Connection-level headers (RFC 9110 section 7.6.1) are not forwarded in either direction.
+HOP_BY_HOP = frozenset(("connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "proxy-connection",
+                        "te", "trailer", "transfer-encoding", "upgrade"))
+IDEMPOTENT = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+def is_timeout(exc):
+    # urllib3 files a refused connection under ConnectTimeoutError too.
+    return (isinstance(exc, urllib3.exceptions.TimeoutError)
+            and not isinstance(exc, urllib3.exceptions.NewConnectionError))
+
+
+class ReverseProxy:
+    """Forwards requests to ``(address, port)`` upstreams over pooled keep-alive connections.
+
+    urllib3 keeps one pool of up to ``pool_size`` connections per upstream.
+    Bodies are never read whole: the request body is sent from the incoming
+    stream as it arrives and the response is handed back undecoded, in
+    ``chunk_size`` pieces, so memory stays flat whatever the payload size.
+    """
+
+    def __init__(self, pool_size=32, connect_timeout=2.5, read_timeout=30.0, chunk_size=64 * 1024, max_pools=256):
+        self.chunk_size = chunk_size
+        self.timeout = urllib3.Timeout(connect=connect_timeout, read=read_timeout)
+        self.pools = urllib3.PoolManager(num_pools=max_pools, maxsize=pool_size, block=False, retries=False)
+
+    @staticmethod
+    def request_headers(headers, client, host, scheme):
+        """Headers to send upstream: the client's minus hop-by-hop ones, plus X-Forwarded-*."""
+        drop = HOP_BY_HOP | {"host", "content-length"}
+        drop |= {h.strip().lower() for h in headers.get("Connection", "").split(",")}
+        out = {k: v for k, v in headers.items() if k.lower() not in drop}
+        forwarded = headers.get("X-Forwarded-For")
+        out["X-Forwarded-For"] = f"{forwarded}, {client}" if forwarded else client
+        out["X-Forwarded-Host"] = host
+        out["X-Forwarded-Proto"] = scheme
+        return out
+
+    @staticmethod
+    def response_headers(headers):
+        drop = HOP_BY_HOP | {h.strip().lower() for h in headers.get("Connection", "").split(",")}
+        return [(k, v) for k, v in headers.items() if k.lower() not in drop]
+
+    def open(self, method, instance, path, headers, body=None, content_length=None):
+        """Send the request to ``instance`` and return the urllib3 response once its headers are in.
+
+        ``body`` is a file-like object; with ``content_length`` it is sent as
+        is, otherwise chunked. Raises urllib3 errors when the upstream can't be
+        reached or doesn't answer in time.
+        """
+        address, port = instance
+        headers = dict(headers)
+        chunked = False
+        if body is not None:
+            if content_length is not None:
+                headers["Content-Length"] = str(content_length)
+            else:
+                chunked = True
+                source = body
+                body = iter(lambda: source.read(self.chunk_size), b"")
+        return self.pools.urlopen(method, f"http://{address}:{port}{path}", body=body, headers=headers,
+                                  chunked=chunked, redirect=False, retries=False, timeout=self.timeout,
+                                  preload_content=False, decode_content=False)
+
+    def stream(self, resp):
+        """The response body in chunks as received; returns the connection to its pool when done."""
+        complete = False
+        try:
+            yield from resp.stream(self.chunk_size, decode_content=False)
+            complete = True
+        finally:
+            if not complete:
+                # The client went away mid-body; the rest can't be reused, so drop the connection.
+                resp.close()
+            resp.release_conn()
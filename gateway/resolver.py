@@ -0,0 +1,149 @@
+import logging
+import socket
+import threading
+import time
+
+import dns.exception
+import dns.message
+import dns.query
+import dns.rcode
+import dns.rdatatype
+
+log = logging.getLogger(__name__)
+
+
+class SrvResolver:
+    """Resolves services through Consul's DNS interface, with an in-process cache.
+
+    ``resolve(name)`` looks up the ``<name>.service.<domain>`` SRV records and
+    returns ((address, port), ...) for the instances Consul considers healthy,
+    taking addresses from the answer's additional section (or an A lookup of
+    the SRV target when it is missing). Answers are kept for their TTL, clamped
+    to [``min_ttl``, ``max_ttl``]: Consul serves service records with TTL 0
+    unless ``dns_config.service_ttl`` is set. Unknown names and names with no
+    healthy instance are cached as empty for the SOA's negative TTL (RFC 2308),
+    or ``negative_ttl`` when it is 0 (Consul's default) or missing.
+    ``host`` may be a name; its address is looked up again after ``host_ttl``
+    seconds and after any failed query, since a replaced Consul container
+    comes back on a new address. At most ``max_entries`` names are cached:
+    a full cache first drops its expired entries, then the oldest ones.
+    """
+
+    def __init__(self, host, port=8600, domain="consul", timeout=1.0, min_ttl=1.0, max_ttl=300.0,
+                 negative_ttl=5.0, host_ttl=30.0, max_entries=10_000, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.domain = domain.strip(".")
+        self.timeout = timeout
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.host_ttl = host_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # (address of host, looked up until)
+        self._server = (None, 0.0)
+        self._lock = threading.Lock()
+        # name -> (expires at, instances), oldest insert first
+        self._cache = {}
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache), "evictions": self.evictions}
+
+    def cached(self, name):
+        """The cached instances of ``name`` if still fresh, else None; never queries."""
+        entry = self._cache.get(name)
+        if entry is None or entry[0] <= self.clock():
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def resolve(self, name):
+        """Healthy (address, port) pairs for ``name``; raises dns.exception.DNSException on failure."""
+        instances = self.cached(name)
+        if instances is not None:
+            return instances
+        self.misses += 1
+        ttl, instances = self._lookup(f"{name}.service.{self.domain}.")
+        with self._lock:
+            self._cache.pop(name, None)
+            if self._cache and len(self._cache) >= self.max_entries:
+                self._evict()
+            self._cache[name] = (self.clock() + ttl, instances)
+        return instances
+
+    def _evict(self):
+        """Make room for one entry: drop the expired ones, or else the oldest."""
+        now = self.clock()
+        expired = [name for name, (expires, _) in self._cache.items() if expires <= now]
+        for name in expired or [next(iter(self._cache))]:
+            del self._cache[name]
+        self.evictions += len(expired) or 1
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+    def _address(self):
+        address, until = self._server
+        if address is None or until <= self.clock():
+            # dnspython wants an IP; "consul" is a container name.
+            address = socket.gethostbyname(self.host)
+            self._server = (address, self.clock() + self.host_ttl)
+        return address
+
+    def _query(self, qname, rdtype):
+        query = dns.message.make_query(qname, rdtype)
+        try:
+            response, _ = dns.query.udp_with_fallback(query, self._address(), timeout=self.timeout,
+                                                      port=self.port)
+        except (dns.exception.DNSException, OSError):
+            self._server = (None, 0.0)
+            raise
+        if response.rcode() not in (dns.rcode.NOERROR, dns.rcode.NXDOMAIN):
+            raise dns.exception.DNSException(f"{qname} {dns.rdatatype.to_text(rdtype)}: "
+                                             f"{dns.rcode.to_text(response.rcode())}")
+        return response
+
+    def _negative_ttl(self, response):
+        for rrset in response.authority:
+            if rrset.rdtype == dns.rdatatype.SOA and min(rrset.ttl, rrset[0].minimum):
+                return min(rrset.ttl, rrset[0].minimum)
+        return self.negative_ttl
+
+    def _clamp(self, ttl):
+        return min(self.max_ttl, max(self.min_ttl, ttl))
+
+    def _lookup(self, qname):
+        """(seconds to cache, instances) for one SRV name."""
+        response = self._query(qname, dns.rdatatype.SRV)
+        srv = next((rrset for rrset in response.answer if rrset.rdtype == dns.rdatatype.SRV), None)
+        if srv is None or not len(srv):
+            return self._clamp(self._negative_ttl(response)), ()
+        ttl = srv.ttl
+        addresses = {}
+        for rrset in response.additional:
+            if rrset.rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+                addresses.setdefault(rrset.name.to_text(), rrset[0].address)
+                ttl = min(ttl, rrset.ttl)
+        instances = []
+        for record in sorted(srv, key=lambda r: (r.priority, -r.weight, r.target.to_text(), r.port)):
+            target = record.target.to_text()
+            address = addresses.get(target)
+            if address is None:
+                a = next((rrset for rrset in self._query(target, dns.rdatatype.A).answer
+                          if rrset.rdtype == dns.rdatatype.A), None)
+                if a is None:
+                    log.warning("No address for SRV target %s of %s", target, qname)
+                    continue
+                address = addresses[target] = a[0].address
+                ttl = min(ttl, a.ttl)
+            instances.append((address, record.port))
+        return self._clamp(ttl), tuple(instances)
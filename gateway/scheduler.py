@@ -0,0 +1,147 @@
+import heapq
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class _Target:
+    __slots__ = ("key", "instance", "interval", "due", "data", "at", "failures")
+
+    def __init__(self, key, instance, interval, due):
+        self.key = key
+        self.instance = instance
+        self.interval = interval
+        self.due = due
+        # Latest probe outcome: the /info payload (None if it failed) and when it finished.
+        self.data = None
+        self.at = None
+        self.failures = 0
+
+
+class ProbeScheduler:
+    """Probes every known instance on its own timer instead of once per request.
+
+    ``targets()`` returns {key: instance} for everything that should be probed
+    and is re-read every ``sync_interval`` seconds; ``probe(instance)`` returns
+    the /info payload or raises. An instance that keeps answering is probed
+    ``backoff`` times less often each time, up to ``max_interval``; one that
+    fails goes back to ``min_interval``. Every delay is spread by +/-``jitter``
+    and a token bucket holds all probes to ``max_rate`` per second, so the
+    outbound rate depends on the number of instances, never on readers.
+
+    Readers call latest(), which never touches the network.
+    """
+
+    def __init__(self, probe, targets, min_interval=2.0, max_interval=30.0, backoff=1.5, jitter=0.2,
+                 max_rate=50.0, sync_interval=1.0, executor=None, clock=time.monotonic, rng=None):
+        self.probe = probe
+        self.targets = targets
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_rate = max_rate
+        self.sync_interval = sync_interval
+        self.executor = executor
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.probes = 0
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._heap = []
+        self._tokens = 1.0
+        self._refilled = None
+        self._synced = None
+        self._stop = threading.Event()
+
+    def latest(self, key):
+        """(payload or None, seconds since the probe finished), or None if not probed yet."""
+        target = self._targets.get(key)
+        if target is None or target.at is None:
+            return None
+        return target.data, self.clock() - target.at
+
+    def start(self):
+        self._stop.clear()
+        threading.Thread(target=self._run, name="probe-scheduler", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                log.error("Probe scheduler tick failed: %s", e)
+            self._stop.wait(self._idle())
+
+    def _idle(self):
+        with self._lock:
+            due = self._heap[0][0] - self.clock() if self._heap else self.sync_interval
+        # Wake for the next due probe, the next token or the next sync, whichever is first.
+        return min(max(due, 1.0 / self.max_rate, 0.001), self.sync_interval)
+
+    def _jittered(self, delay):
+        return delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _sync(self, now):
+        wanted = self.targets()
+        with self._lock:
+            for key in self._targets.keys() - wanted.keys():
+                del self._targets[key]
+            for key, instance in wanted.items():
+                if key not in self._targets:
+                    # First probes are spread over one minimum interval rather than all at once.
+                    target = _Target(key, instance, self.min_interval, now + self.rng.uniform(0, self.min_interval))
+                    self._targets[key] = target
+                    heapq.heappush(self._heap, (target.due, id(target), target))
+        self._synced = now
+
+    def tick(self):
+        """Start every probe that is due and fits under the rate cap; returns how many started."""
+        now = self.clock()
+        if self._synced is None or now - self._synced >= self.sync_interval:
+            self._sync(now)
+        started = []
+        with self._lock:
+            if self._refilled is not None:
+                self._tokens = min(max(1.0, self.max_rate), self._tokens + (now - self._refilled) * self.max_rate)
+            self._refilled = now
+            while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+                due, _, target = heapq.heappop(self._heap)
+                # Skip entries for targets that were removed or rescheduled since.
+                if self._targets.get(target.key) is not target or target.due != due:
+                    continue
+                target.due = None
+                self._tokens -= 1
+                started.append(target)
+        self.probes += len(started)
+        for target in started:
+            if self.executor is None:
+                self._probe(target)
+            else:
+                self.executor.submit(self._probe, target)
+        return len(started)
+
+    def _probe(self, target):
+        try:
+            data = self.probe(target.instance)
+        except Exception:
+            data = None
+        now = self.clock()
+        with self._lock:
+            target.data, target.at = data, now
+            if data is None:
+                target.failures += 1
+                target.interval = self.min_interval
+            else:
+                target.failures = 0
+                target.interval = min(self.max_interval, target.interval * self.backoff)
+            if self._targets.get(target.key) is target:
+                target.due = now + self._jittered(target.interval)
+                heapq.heappush(self._heap, (target.due, id(target), target))
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# A change in any of these fields puts a service into the next diff event.
+WATCHED_FIELDS = ("status", "host", "responseTime")
+KEEPALIVE = b": keepalive\n\n"
+
+
+def sse(event, payload):
+    data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+def row_key(svc):
+    """A /services row's identity: federated listings repeat service names across datacenters."""
+    return svc.get("datacenter"), svc.get("service")
+
+
+def diff_services(old, new):
+    """Return ``{"changed": [...], "removed": [...]}`` between two /services lists, or None.
+
+    ``removed`` holds the key fields (``service``, and ``datacenter`` when set) of each row that is gone.
+    """
+    before = {row_key(svc): svc for svc in old}
+    changed = []
+    for svc in new:
+        prev = before.pop(row_key(svc), None)
+        if prev is None or any(prev.get(f) != svc.get(f) for f in WATCHED_FIELDS):
+            changed.append(svc)
+    removed = [{"service": name} if dc is None else {"service": name, "datacenter": dc} for dc, name in before]
+    if not changed and not removed:
+        return None
+    return {"changed": changed, "removed": removed}
+
+
+class QueueSubscriber:
+    """Subscriber for a thread-per-connection server (Flask/gunicorn gthread)."""
+
+    def __init__(self, maxsize=64):
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncSubscriber:
+    """Subscriber whose events are consumed on an asyncio loop (gateway.asgi)."""
+
+    def __init__(self, loop, maxsize=64):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+    def push(self, event):
+        if self.closed or self.queue.full():
+            return False
+        self.loop.call_soon_threadsafe(self._put, event)
+        return True
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+        # Wake the consumer so it notices the close.
+        self.loop.call_soon_threadsafe(self._put, b"")
+
+
+class ServiceStream:
+    """One refresh loop shared by every open /services/stream connection.
+
+    The loop calls ``collect`` once per ``interval`` while at least one
+    subscriber is connected and stops when the last one leaves. Each refresh
+    is diffed against the previous one and the encoded event is pushed to all
+    subscribers, so backend work does not grow with the number of viewers.
+    Subscribers that fall ``maxsize`` events behind are closed; browsers
+    reconnect and start over from a fresh snapshot.
+    """
+
+    def __init__(self, collect, interval):
+        self.collect = collect
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._subscribers = set()
+        self._latest = None
+        self._snapshot = None
+        self._thread = None
+        self.refreshes = 0
+
+    def subscribe(self, subscriber, timeout=None):
+        """Register ``subscriber`` and return the encoded snapshot event to send first."""
+        with self._cond:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="service-stream", daemon=True)
+                self._thread.start()
+            self._cond.wait_for(lambda: self._snapshot is not None, timeout=timeout)
+            return self._snapshot or sse("snapshot", [])
+
+    def unsubscribe(self, subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._subscribers:
+                    # Nobody is watching: stop, and make the next subscriber wait for fresh data.
+                    self._thread = None
+                    self._latest = self._snapshot = None
+                    return
+            started = time.monotonic()
+            try:
+                results = self.collect()
+            except Exception as e:
+                log.error("Service stream refresh failed: %s", e)
+                results = None
+            if results is not None:
+                self._publish(results)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _publish(self, results):
+        with self._cond:
+            self.refreshes += 1
+            diff = diff_services(self._latest, results) if self._latest is not None else None
+            self._latest = results
+            self._snapshot = sse("snapshot", results)
+            self._cond.notify_all()
+            if diff is None:
+                return
+            event = sse("diff", diff)
+            for sub in list(self._subscribers):
+                if not sub.push(event):
+                    self._subscribers.discard(sub)
+                    sub.close()
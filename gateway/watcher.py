@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from common.consul import ConsulClient, ServiceEntry
+from gateway.index import ServiceIndex
+
+log = logging.getLogger(__name__)
+
+# names: catalog order; instances: name -> tuple of (address, port) for passing instances.
+# A name missing from instances has not had its first health sync yet.
+Snapshot = namedtuple("Snapshot", "version names instances")
+
+_UNREAD = object()
+
+
+def endpoints(entries):
+    """(address, port) for each ServiceEntry, skipping ones Consul can't route to."""
+    return tuple(e.endpoint for e in entries if e.endpoint)
+
+
+def parse_instances(entries):
+    """endpoints() of raw /v1/health/service JSON."""
+    return endpoints(map(ServiceEntry.from_json, entries))
+
+
+def meta_pairs(entries):
+    """Every (key, value) of Service.Meta across raw /v1/health/service JSON entries."""
+    return frozenset((k, v) for e in entries for k, v in ((e.get("Service") or {}).get("Meta") or {}).items())
+
+
+def health_fingerprints(checks, prefix=""):
+    """{name: fingerprint} from raw /v1/health/state/any checks, for services starting with ``prefix``.
+
+    A fingerprint changes whenever /v1/health/service/<name>?passing=true may
+    answer differently: a check of one of the service's instances, or a node
+    check on a node it runs on, is added, removed or changes status.
+    """
+    node_checks = defaultdict(set)
+    service_checks = defaultdict(set)
+    for c in checks:
+        key = (c.get("Node"), c.get("ServiceID") or "", c.get("CheckID"), c.get("Status"), c.get("ModifyIndex"))
+        if not key[1]:
+            node_checks[key[0]].add(key)
+        elif (c.get("ServiceName") or "").startswith(prefix):
+            service_checks[c["ServiceName"]].add(key)
+    return {name: (frozenset(own), frozenset(k for node in {k[0] for k in own} for k in node_checks[node]))
+            for name, own in service_checks.items()}
+
+
+class CatalogWatcher:
+    """Keeps an in-memory snapshot of the catalog using Consul blocking queries.
+
+    Two long-polls, however large the catalog: /v1/catalog/services for the
+    names and /v1/health/state/any for every check. A service whose checks
+    (or its nodes' checks) changed has its passing instances read again from
+    /v1/health/service/<name>?passing=true, ``fetch_workers`` reads at a time.
+    Readers call snapshot(), which never touches the network. With
+    ``health=False`` only the names are tracked (instances stay empty) for
+    callers that resolve instances elsewhere.
+    ``index`` follows the same answers: names and tags from the catalog, meta
+    from the passing instances as of their last read.
+    Changes are published at most every ``publish_interval`` seconds, so a
+    burst of them (the first sync of a large catalog) builds one snapshot
+    rather than one per service. ``on_publish(snapshot)`` runs after every
+    new snapshot, under the watcher's lock, so it must not block.
+    A read that fails is tried again after every poll that returns (a watch
+    timeout at the latest) once its backoff has passed: ``retry_backoff``
+    seconds, doubling per failure up to ``retry_max``.
+    """
+
+    def __init__(self, consul, prefix="service-", wait="30s", health=True, on_publish=None,
+                 fetch_workers=16, publish_interval=0.05, retry_backoff=1.0, retry_max=30.0):
+        if isinstance(consul, str):
+            # The two long-polls plus the reads in flight; keep all of their connections alive.
+            consul = ConsulClient(consul, pool_size=fetch_workers + 2)
+        self.consul = consul
+        self.catalog_path = "/v1/catalog/services"
+        self.state_path = "/v1/health/state/any"
+        self.health_path = "/v1/health/service/"
+        self.prefix = prefix
+        self.wait = wait
+        self.health = health
+        self.on_publish = on_publish
+        self.fetch_workers = fetch_workers
+        self.publish_interval = publish_interval
+        self.retry_backoff = retry_backoff
+        self.retry_max = retry_max
+        self.index = ServiceIndex(meta=health)
+        self.last_sync = None
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._names = ()
+        self._known = frozenset()
+        self._instances = {}
+        # name -> fingerprint from the latest health state (None until the first one),
+        # and the fingerprint each name's instances were last read at.
+        self._prints = None
+        self._read_at = {}
+        # names being read -> whether to read them once more when done
+        self._reading = {}
+        # names whose last read failed -> (failures in a row, retry after)
+        self._failed = {}
+        self._executor = None
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+
+    def snapshot(self):
+        """Latest Snapshot, or None until the first catalog sync completes."""
+        return self._snapshot
+
+    def start(self):
+        self._stop.clear()
+        self._reading.clear()
+        self._failed.clear()
+        threading.Thread(target=self._poll, args=(self.catalog_path, self._apply_catalog),
+                         name="watch-catalog", daemon=True).start()
+        if self.health:
+            self._executor = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="watch-read")
+            threading.Thread(target=self._poll, args=(self.state_path, self._apply_state),
+                             name="watch-health", daemon=True).start()
+        threading.Thread(target=self._publish_changes, name="watch-publish", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._dirty.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _publish_changes(self):
+        while True:
+            self._dirty.wait()
+            # Let the rest of a burst arrive before building the snapshot.
+            if self._stop.wait(self.publish_interval):
+                return
+            with self._lock:
+                self._dirty.clear()
+                self._publish()
+
+    def _publish(self):
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        self._snapshot = Snapshot(version, self._names, dict(self._instances))
+        if self.on_publish is not None:
+            self.on_publish(self._snapshot)
+
+    def _apply_catalog(self, services):
+        names = tuple(name for name in services if name.startswith(self.prefix))
+        with self._lock:
+            if self._stop.is_set():
+                return
+            self.index.sync({name: services[name] for name in names})
+            known = frozenset(names)
+            changed = self._snapshot is None or names != self._names
+            for name in self._known - known:
+                self._read_at.pop(name, None)
+                self._failed.pop(name, None)
+                changed |= self._instances.pop(name, None) is not None
+            if changed:
+                log.info("Catalog: %d services", len(names))
+            self._names, self._known = names, known
+            if self.health and self._prints is not None:
+                self._read_changed()
+            if changed:
+                self._dirty.set()
+
+    def _apply_state(self, checks):
+        prints = health_fingerprints(checks, self.prefix)
+        with self._lock:
+            if self._stop.is_set():
+                return
+            self._prints = prints
+            self._read_changed()
+
+    def _read_changed(self):
+        """Queue a read of every known name whose checks moved since its last read; lock held."""
+        for name in self._names:
+            if self._read_at.get(name, _UNREAD) != self._prints.get(name):
+                self._queue_read(name)
+
+    def _queue_read(self, name):
+        """Read ``name`` now, or once more after the read in flight; lock held."""
+        if name in self._reading:
+            self._reading[name] = True
+        else:
+            self._reading[name] = False
+            self._executor.submit(self._read, name)
+
+    def _retry_failed(self):
+        """Queue the failed reads whose backoff has passed; nothing else would until their checks change."""
+        if not self._failed:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._stop.is_set():
+                return
+            for name, (_, retry_at) in list(self._failed.items()):
+                if retry_at <= now and name in self._known and name not in self._reading:
+                    self._queue_read(name)
+
+    def _read(self, name):
+        while True:
+            with self._lock:
+                fingerprint = (self._prints or {}).get(name)
+            entries = None
+            if not self._stop.is_set():
+                try:
+                    entries = self.consul.get(f"{self.health_path}{quote(name, safe='')}?passing=true",
+                                              "consul_watch").json()
+                except Exception as e:
+                    log.warning("Reading %s failed: %s", name, e)
+            instances = parse_instances(entries or ())
+            with self._lock:
+                if entries is None and name in self._known and not self._stop.is_set():
+                    failures = self._failed.get(name, (0, 0.0))[0] + 1
+                    self._failed[name] = (failures, time.monotonic()
+                                          + min(self.retry_max, self.retry_backoff * 2 ** (failures - 1)))
+                if entries is not None and name in self._known and not self._stop.is_set():
+                    self._failed.pop(name, None)
+                    self._read_at[name] = fingerprint
+                    self.index.set_meta(name, meta_pairs(entries))
+                    if self._instances.get(name) != instances:
+                        self._instances[name] = instances
+                        self._dirty.set()
+                if not self._reading.get(name):
+                    self._reading.pop(name, None)
+                    return
+                self._reading[name] = False
+
+    def _poll(self, path, apply):
+        self.consul.watch(path, lambda data, index: apply(data), self._stop, self.wait, synced=self._synced)
+
+    def _synced(self):
+        self.last_sync = time.monotonic()
+        if self.health:
+            self._retry_failed()
@@ -1,76 +1,193 @@
-from flask import Flask, jsonify
-import requests
+from common import encoding
+from common.consul import ConsulClient
+from common.lifecycle import drain
+from common.metrics import instrument_flask
+from common.serving import serve
+from common.snapshot import SnapshotStore
+from flask import Flask, jsonify, request
+from healthz.model import HealthModel, healthy_services
+import threading
+import time
 import os
 
 app = Flask(__name__)
+instrument_flask(app)
+encoding.use_fast_json(app)
 
 CONSUL_HOST = os.getenv("CONSUL_HOST", "consul")
 CONSUL_PORT = int(os.getenv("CONSUL_PORT", "8500"))
 SERVICE_NAME = os.getenv("SERVICE_NAME", "healthz")
 SERVICE_PORT = int(os.getenv("SERVICE_PORT", "6000"))
+SERVICE_ID = os.getenv("SERVICE_ID", SERVICE_NAME)
+SERVICE_ADDRESS = os.getenv("SERVICE_ADDRESS", SERVICE_NAME)
 BIND_HOST = os.getenv("BIND_HOST", "0.0.0.0") # nosec B104
 
+TIMEOUT = 2.5
 CONSUL_BASE = f"http://{CONSUL_HOST}:{CONSUL_PORT}"
-CATALOG_SERVICES = f"{CONSUL_BASE}/v1/catalog/services"
-HEALTH_SERVICE = f"{CONSUL_BASE}/v1/health/service/"
-REGISTER = f"{CONSUL_BASE}/v1/agent/service/register"
+CONSUL = ConsulClient(CONSUL_BASE, timeout=TIMEOUT)
+SESSION = CONSUL.session
+CATALOG_SERVICES = CONSUL.url("/v1/catalog/services")
+HEALTH_SERVICE = CONSUL.url("/v1/health/service/")
+HEALTH_STATE_ANY = CONSUL.url("/v1/health/state/any")
+REGISTER = CONSUL.url("/v1/agent/service/register")
+# "bulk" reads every check in one /v1/health/state/any call; "per-service" does one call per service.
+REPORT_MODE = os.getenv("REPORT_MODE", "bulk")
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "2.0"))
 
-SESSION = requests.Session()
-SESSION.headers.update({"Accept": "application/json"})
-TIMEOUT = 2.5
+# Last-known-good statuses on disk; empty disables it. Loaded at startup and served with
+# "stale": true until the model syncs. Once synced, the model's statuses are marked stale
+# while Consul can't be reached (no answer for SNAPSHOT_STALE_AFTER seconds), file or not.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "")
+SNAPSHOT_STALE_AFTER = float(os.getenv("SNAPSHOT_STALE_AFTER", "45"))
+SNAPSHOT_STORE = (SnapshotStore(SNAPSHOT_PATH, "healthz", min_interval=float(os.getenv("SNAPSHOT_INTERVAL", "5")))
+                  if SNAPSHOT_PATH else None)
+LAST_GOOD = SNAPSHOT_STORE.load() if SNAPSHOT_STORE else None
+
+def save_snapshot(version, statuses):
+    if SNAPSHOT_STORE is not None:
+        SNAPSHOT_STORE.save(statuses, version=version)
+
+# Keep a live model from Consul blocking queries; /report polls Consul until it has synced.
+HEALTH_WATCH = os.getenv("HEALTH_WATCH", "1") == "1"
+MODEL = HealthModel(CONSUL, wait=os.getenv("HEALTH_WATCH_WAIT", "30s"),
+                    max_events=int(os.getenv("HEALTH_EVENTS_MAX", "10000")), on_update=save_snapshot,
+                    max_removed=int(os.getenv("HEALTH_REMOVED_MAX", "10000")))
+
+_report_cache = {"at": None, "results": None}
+_report_lock = threading.Lock()
+# Encoded forms of the model's current report, so each representation is built once per version.
+_report_variants = (None, {})
 
 @app.route("/health", methods=["GET"])
 def health():
     return "ok", 200
 
-@app.route("/report", methods=["GET"])
-def report():
-    try:
-        all_services = SESSION.get(CATALOG_SERVICES, timeout=TIMEOUT).json().keys()
-    except Exception:
-        all_services = []
-
+def report_per_service(names):
     results = []
-    for name in sorted(all_services):
-        if name == "consul":
-            continue
+    for name in names:
         try:
-            r = SESSION.get(f"{HEALTH_SERVICE}{name}", timeout=TIMEOUT)
-            r.raise_for_status()
-            entries = r.json()
-            passing = False
-            for e in entries:
-                checks = e.get("Checks", [])
-                service_checks = [c for c in checks if c.get("CheckID") != "serfHealth"]
-                if service_checks and all(c.get("Status") == "passing" for c in service_checks):
-                    passing = True
-                    break
+            passing = any(e.passing for e in CONSUL.health_service(name))
             results.append({"name": name, "status": "healthy" if passing else "unhealthy"})
         except Exception:
             results.append({"name": name, "status": "unhealthy"})
-    return jsonify(results)
+    return results
+
+def report_bulk(names):
+    try:
+        checks = CONSUL.health_state("any")
+    except Exception:
+        return [{"name": name, "status": "unhealthy"} for name in names]
+
+    healthy = healthy_services(checks)
+    return [{"name": name, "status": "healthy" if name in healthy else "unhealthy"} for name in names]
+
+def poll_report():
+    with _report_lock:
+        at, cached = _report_cache["at"], _report_cache["results"]
+        if at is not None and time.monotonic() - at < REPORT_CACHE_TTL:
+            return cached
+
+    try:
+        all_services = CONSUL.catalog_services().keys()
+    except Exception:
+        return []
+
+    names = [name for name in sorted(all_services) if name != "consul"]
+    results = report_bulk(names) if REPORT_MODE == "bulk" else report_per_service(names)
+    with _report_lock:
+        _report_cache["at"], _report_cache["results"] = time.monotonic(), results
+    if not HEALTH_WATCH:
+        save_snapshot(0, {entry["name"]: entry["status"] for entry in results})
+    return results
+
+def last_good_report():
+    return [{"name": name, "status": status, "stale": True} for name, status in LAST_GOOD.items()]
+
+def unsynced_report():
+    """(results, stale) before the model has synced."""
+    if LAST_GOOD is None:
+        return poll_report(), False
+    if HEALTH_WATCH:
+        # The watches will catch up; serve the saved statuses meanwhile.
+        return last_good_report(), True
+    started = time.monotonic()
+    results = poll_report()
+    if not results and (CONSUL.last_success is None or CONSUL.last_success < started):
+        return last_good_report(), True
+    return results, False
+
+def model_stale():
+    return MODEL.last_sync is not None and time.monotonic() - MODEL.last_sync > SNAPSHOT_STALE_AFTER
+
+@app.route("/report", methods=["GET"])
+def report():
+    """Every service's status, or with ?since=<version> only what changed after it."""
+    global _report_variants
+    since = request.args.get("since", type=int)
+    if not MODEL.ready:
+        results, stale = unsynced_report()
+        if since is None:
+            return encoding.respond(app.response_class, request, results)
+        # No versions yet: hand out everything; the client asks again from 0.
+        body = {"version": 0, "changed": results, "removed": []}
+        if stale:
+            body["stale"] = True
+        return encoding.respond(app.response_class, request, body)
+    stale = model_stale()
+    if since is not None:
+        body = MODEL.delta(since)
+        if stale:
+            body["stale"] = True
+            body["changed"] = [dict(entry, stale=True) for entry in body["changed"]]
+        return encoding.respond(app.response_class, request, body)
+    version, results = MODEL.report()
+    if stale:
+        # Consul has gone quiet: still the last known statuses, but say so.
+        resp = encoding.respond(app.response_class, request, [dict(entry, stale=True) for entry in results])
+        resp.headers["X-Health-Version"] = str(version)
+        return resp
+    if _report_variants[0] != version:
+        _report_variants = (version, {})
+    resp = encoding.respond(app.response_class, request, results, variants=_report_variants[1])
+    resp.headers["X-Health-Version"] = str(version)
+    return resp
+
+@app.route("/events", methods=["GET"])
+def events():
+    """Healthy <-> unhealthy transitions after ?since=<version>, oldest first.
+
+    ``"resync": true`` means some of them already left the log; /report has the current state.
+    """
+    since = request.args.get("since", default=0, type=int)
+    limit = request.args.get("limit", type=int)
+    body = {"version": MODEL.version, "events": MODEL.events(since, limit)}
+    if MODEL.missed(since):
+        body["resync"] = True
+    return jsonify(body)
 
 def register_with_consul():
+    # This runs in the process the workers are forked from, so it gets a client of its own:
+    # a keep-alive connection left in CONSUL's pool would be shared by every worker's watches.
+    consul = ConsulClient(CONSUL_BASE, timeout=TIMEOUT)
     try:
-        SESSION.put(
-            REGISTER,
-            json={
-                "Name": SERVICE_NAME,
-                "ID": SERVICE_NAME,
-                "Address": SERVICE_NAME,
-                "Port": SERVICE_PORT,
-                "Check": {
-                    "HTTP": f"http://{SERVICE_NAME}:{SERVICE_PORT}/health",
-                    "Interval": "5s",
-                    "Timeout": "2s",
-                    "DeregisterCriticalServiceAfter": "10s"
-                }
-            },
-            timeout=TIMEOUT,
-        )
+        consul.register({
+            "Name": SERVICE_NAME,
+            "ID": SERVICE_ID,
+            "Address": SERVICE_ADDRESS,
+            "Port": SERVICE_PORT,
+            "Check": {
+                "HTTP": f"http://{SERVICE_ADDRESS}:{SERVICE_PORT}/health",
+                "Interval": "5s",
+                "Timeout": "2s",
+                "DeregisterCriticalServiceAfter": "10s"
+            }
+        })
     except Exception:
         pass
+    finally:
+        consul.close()
 
 if __name__ == "__main__":
-    register_with_consul()
-    app.run(host=BIND_HOST, port=SERVICE_PORT)
+    # The model is per process, so every worker runs its own watches.
+    serve(app, BIND_HOST, SERVICE_PORT, on_start=register_with_consul,
+          on_worker_start=MODEL.start if HEALTH_WATCH else None, on_drain=lambda: drain(CONSUL, SERVICE_ID))
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from common.consul import Check, checks_passing
+
+log = logging.getLogger(__name__)
+
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+
+
+def healthy_services(checks):
+    """Names of services with at least one passing instance, from /v1/health/state/any.
+
+    Rebuilds what /v1/health/service/<name> returns per instance: the node's
+    checks plus the instance's own, then applies the usual passing rule.
+    """
+    node_checks = defaultdict(list)
+    instance_checks = defaultdict(list)
+    for c in checks:
+        if c.service_id:
+            instance_checks[(c.service_name, c.node, c.service_id)].append(c)
+        else:
+            node_checks[c.node].append(c)
+    healthy = set()
+    for (name, node, _), own in instance_checks.items():
+        if name not in healthy and checks_passing(node_checks[node] + own):
+            healthy.add(name)
+    return healthy
+
+
+class HealthModel:
+    """Per-service health kept current from Consul blocking queries.
+
+    One long-poll follows /v1/catalog/services and another
+    /v1/health/state/any. Each answer is diffed against the model; every
+    service whose status changed is stamped with the model version, and a
+    healthy <-> unhealthy flip is appended to a bounded transition log.
+    Removed services are remembered so deltas can report them, the newest
+    ``max_removed`` of them; a client whose version predates a forgotten
+    removal, or transitions that already left the log, is told to resync.
+
+    Versions are the Consul index that carried the change, so they mean the
+    same thing in every worker process and a client can send the one it last
+    saw to any of them.
+
+    ``on_update(version, statuses)`` runs after every change with a copy of
+    the new {name: status}, under the model's lock, so it must not block.
+    """
+
+    def __init__(self, consul, wait="30s", max_events=10_000, exclude=("consul",), on_update=None,
+                 max_removed=10_000):
+        self.consul = consul
+        self.wait = wait
+        self.exclude = frozenset(exclude)
+        self.on_update = on_update
+        self.version = 0
+        self.last_sync = None
+        self._lock = threading.Lock()
+        self._status = {}
+        # name -> version of its last change or removal, oldest change first.
+        self._changed = {}
+        # (version, name) per removal, oldest first, and the newest removal forgotten since.
+        self._removed = deque()
+        self.max_removed = max_removed
+        self._removed_horizon = 0
+        # (version, unix time, name, new status); the old status is the other one.
+        self._events = deque(maxlen=max_events)
+        # Version of the newest transition pushed out of the log.
+        self._events_horizon = 0
+        self._report = (None, [])
+        self._names = None
+        self._healthy = None
+        # Serializes the two watches so a stale answer is never applied after a newer one.
+        self._apply_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def ready(self):
+        """True once both the catalog and the health state have been read."""
+        return self._names is not None and self._healthy is not None
+
+    def start(self):
+        self._stop.clear()
+        for path, apply in (("/v1/catalog/services", self._apply_catalog),
+                            ("/v1/health/state/any", self._apply_health)):
+            threading.Thread(target=self.consul.watch, args=(path, apply, self._stop, self.wait),
+                             kwargs={"synced": self._synced}, name=f"watch-{path.rsplit('/', 1)[1]}",
+                             daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _synced(self):
+        self.last_sync = time.monotonic()
+
+    def _apply_catalog(self, services, index):
+        with self._apply_lock:
+            self._names = [name for name in services if name not in self.exclude]
+            self._refresh(index)
+
+    def _apply_health(self, checks, index):
+        healthy = healthy_services(Check.from_json(c) for c in checks)
+        with self._apply_lock:
+            self._healthy = healthy
+            self._refresh(index)
+
+    def _refresh(self, index):
+        if self.ready:
+            healthy = self._healthy
+            self.update({name: HEALTHY if name in healthy else UNHEALTHY for name in self._names}, index)
+
+    def update(self, statuses, version=None):
+        """Make ``statuses`` ({name: status}, every known service) the current state.
+
+        Returns the number of services that changed. ``version`` defaults to
+        one past the current version, and never moves backwards (Consul resets
+        its index when it loses its state).
+        """
+        now = time.time()
+        with self._lock:
+            if version is None or version <= self.version:
+                version = self.version + 1
+            changes = 0
+            for name in self._status.keys() - statuses.keys():
+                del self._status[name]
+                self._mark(name, version)
+                self._removed.append((version, name))
+                changes += 1
+            self._forget_removed()
+            for name, status in statuses.items():
+                old = self._status.get(name)
+                if old == status:
+                    continue
+                self._status[name] = status
+                self._mark(name, version)
+                changes += 1
+                if old is not None:
+                    if len(self._events) == self._events.maxlen:
+                        self._events_horizon = self._events[0][0]
+                    self._events.append((version, now, name, status))
+            if changes:
+                self.version = version
+                log.info("Health v%d: %d change(s)", version, changes)
+                if self.on_update is not None:
+                    self.on_update(version, dict(self._status))
+            return changes
+
+    def _mark(self, name, version):
+        self._changed.pop(name, None)
+        self._changed[name] = version
+
+    def _forget_removed(self):
+        while len(self._removed) > self.max_removed:
+            version, name = self._removed.popleft()
+            # Skip names that came back (or were removed again) since.
+            if name not in self._status and self._changed.get(name) == version:
+                del self._changed[name]
+                self._removed_horizon = version
+
+    def report(self):
+        """(version, [{"name", "status"}] sorted by name) for every service."""
+        with self._lock:
+            if self._report[0] != self.version:
+                self._report = (self.version, [{"name": name, "status": self._status[name]}
+                                               for name in sorted(self._status)])
+            return self._report
+
+    def delta(self, since):
+        """What changed after version ``since``: {"version", "changed", "removed"}.
+
+        A ``since`` ahead of this model (another process, or a restart) gets
+        everything, as if it were 0. So does one older than a removal the model
+        has forgotten, with ``"resync": True``: ``changed`` is then every
+        service and the client should replace its state rather than patch it.
+        """
+        with self._lock:
+            resync = since < self._removed_horizon
+            if since > self.version or resync:
+                since = 0
+            changed, removed = [], []
+            for name in reversed(self._changed):
+                if self._changed[name] <= since:
+                    break
+                status = self._status.get(name)
+                if status is None:
+                    removed.append(name)
+                else:
+                    changed.append({"name": name, "status": status})
+            changed.sort(key=lambda entry: entry["name"])
+            body = {"version": self.version, "changed": changed, "removed": sorted(removed)}
+            if resync:
+                body["resync"] = True
+            return body
+
+    def missed(self, since):
+        """True if transitions after version ``since`` have already left the log."""
+        return since < self._events_horizon
+
+    def events(self, since=0, limit=None):
+        """Transitions after version ``since``, oldest first; at most the newest ``limit``."""
+        with self._lock:
+            out = []
+            for version, at, name, status in reversed(self._events):
+                if version <= since or (limit is not None and len(out) >= limit):
+                    break
+                out.append({"version": version, "time": round(at, 3), "name": name,
+                            "from": UNHEALTHY if status == HEALTHY else HEALTHY, "to": status})
+            out.reverse()
+            return out
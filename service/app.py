@@ -1,47 +1,88 @@
-from flask import Flask, jsonify
-import os, socket, time, threading, requests
-from datetime import datetime
+from flask import Flask
+import os, json, socket, time, threading, random
+from common.consul import ConsulClient
+from common.lifecycle import drain
+from common.metrics import instrument_flask
+from common.serving import serve
 
 app = Flask(__name__)
+instrument_flask(app)
 
 SERVICE_NAME = os.getenv("SERVICE_NAME", "default-service")
 SERVICE_PORT = int(os.getenv("SERVICE_PORT", "5000"))
+# Replicas need their own ID (e.g. the pod name) so one leaving doesn't remove the others.
+SERVICE_ID = os.getenv("SERVICE_ID", SERVICE_NAME)
+SERVICE_ADDRESS = os.getenv("SERVICE_ADDRESS", SERVICE_NAME)
 CONSUL_HOST = os.getenv("CONSUL_HOST", "consul")
 CONSUL_PORT = int(os.getenv("CONSUL_PORT", "8500"))
 BIND_HOST = os.getenv("BIND_HOST", "0.0.0.0") # nosec B104
 
-CONSUL_BASE = f"http://{CONSUL_HOST}:{CONSUL_PORT}"
-REGISTER_URL = f"{CONSUL_BASE}/v1/agent/service/register"
+# "http": Consul polls /info. "ttl": the service pushes heartbeats to a TTL check instead.
+REGISTRATION_MODE = os.getenv("REGISTRATION_MODE", "http")
+CHECK_TTL = os.getenv("CHECK_TTL", "15s")
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "5"))
+# Retry delays are drawn from [delay * (1 - jitter), delay] so instances don't retry in lockstep.
+REGISTER_JITTER = float(os.getenv("REGISTER_JITTER", "0.5"))
 
-SESSION = requests.Session()
-SESSION.headers.update({"Accept": "application/json"})
 TIMEOUT = 2.5
+CONSUL_BASE = f"http://{CONSUL_HOST}:{CONSUL_PORT}"
+CONSUL = ConsulClient(CONSUL_BASE, timeout=TIMEOUT)
+SESSION = CONSUL.session
+CHECK_ID = f"service:{SERVICE_ID}"
+REGISTER_URL = CONSUL.url("/v1/agent/service/register")
+CHECK_PASS_URL = CONSUL.url(f"/v1/agent/check/pass/{CHECK_ID}")
+STOP = threading.Event()
+
+# /info answers every probe and health check, so everything but the timestamp is encoded
+# once, in the same bytes jsonify produces (sorted keys, compact, trailing newline).
+INFO_PREFIX = ('{"host":%s,"service":%s,"timestamp":"' % (
+    json.dumps(socket.gethostname()), json.dumps(SERVICE_NAME))).encode()
+INFO_SUFFIX = b'"}\n'
+# (millisecond, its timestamp, second, its "YYYY-mm-dd HH:MM:SS." prefix)
+_clock = (None, b"", None, b"")
+
+def timestamp():
+    global _clock
+    ms = time.time_ns() // 1_000_000
+    cached_ms, stamp, second, prefix = _clock
+    if ms == cached_ms:
+        return stamp
+    now, frac = divmod(ms, 1000)
+    if now != second:
+        prefix = time.strftime("%Y-%m-%d %H:%M:%S.", time.localtime(now)).encode()
+    stamp = prefix + b"%03d" % frac
+    _clock = (ms, stamp, now, prefix)
+    return stamp
 
 @app.route("/info")
 def info():
-    return jsonify({
-        "service": SERVICE_NAME,
-        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
-        "host": socket.gethostname()
-    })
+    return app.response_class(INFO_PREFIX + timestamp() + INFO_SUFFIX, mimetype="application/json")
 
 def build_payload():
+    check = {
+        "HTTP": f"http://{SERVICE_ADDRESS}:{SERVICE_PORT}/info",
+        "Interval": "5s",
+        "Timeout": "2s",
+        "DeregisterCriticalServiceAfter": "10s"
+    }
+    if REGISTRATION_MODE == "ttl":
+        check = {
+            "CheckID": CHECK_ID,
+            "TTL": CHECK_TTL,
+            "Status": "passing",
+            "DeregisterCriticalServiceAfter": "10s"
+        }
     return {
         "Name": SERVICE_NAME,
-        "ID": SERVICE_NAME,
-        "Address": SERVICE_NAME,
+        "ID": SERVICE_ID,
+        "Address": SERVICE_ADDRESS,
         "Port": SERVICE_PORT,
-        "Check": {
-            "HTTP": f"http://{SERVICE_NAME}:{SERVICE_PORT}/info",
-            "Interval": "5s",
-            "Timeout": "2s",
-            "DeregisterCriticalServiceAfter": "10s"
-        }
+        "Check": check
     }
 
 def try_register():
     try:
-        r = SESSION.put(REGISTER_URL, json=build_payload(), timeout=TIMEOUT)
+        r = CONSUL.register(build_payload())
         if r.status_code == 200:
             print(f"[consul] registered {SERVICE_NAME}")
             return True
@@ -50,12 +91,48 @@ def try_register():
         print(f"[consul] register error: {e}")
     return False
 
-def ensure_registration():
+def ensure_registration(stop=None):
     delay = 2
     while not try_register():
-        time.sleep(delay)
+        pause = random.uniform(delay * (1 - REGISTER_JITTER), delay)
+        if stop is None:
+            time.sleep(pause)
+        elif stop.wait(pause):
+            return False
         delay = min(delay * 2, 30)
+    return True
+
+def send_heartbeat():
+    try:
+        r = CONSUL.check_pass(CHECK_ID)
+        if r.status_code == 200:
+            return True
+        # 404 (or 500 on older agents): the agent no longer knows the check.
+        print(f"[consul] heartbeat {SERVICE_NAME} -> {r.status_code} {r.text}")
+    except Exception as e:
+        print(f"[consul] heartbeat error: {e}")
+    return False
+
+def heartbeat_forever(stop):
+    # A failed heartbeat means the agent restarted, forgot us or is down: register again.
+    if not ensure_registration(stop):
+        return
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        if not send_heartbeat() and not ensure_registration(stop):
+            return
+
+def start_registration():
+    if REGISTRATION_MODE == "ttl":
+        threading.Thread(target=heartbeat_forever, args=(STOP,), daemon=True).start()
+    else:
+        threading.Thread(target=ensure_registration, daemon=True).start()
+
+def stop_registration():
+    # Stop heartbeats first so they don't re-register the instance we are removing.
+    STOP.set()
+    drain(CONSUL, SERVICE_ID)
+    print(f"[consul] drained {SERVICE_ID}")
 
 if __name__ == "__main__":
-    threading.Thread(target=ensure_registration, daemon=True).start()
-    app.run(host=BIND_HOST, port=SERVICE_PORT)
+    # Registration runs once in the supervising process, not once per worker.
+    serve(app, BIND_HOST, SERVICE_PORT, on_start=start_registration, on_drain=stop_registration)
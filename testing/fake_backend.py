@@ -0,0 +1,99 @@
+"""Minimal asyncio HTTP server standing in for service backends in tests and benchmarks.
+
+Answers every GET with an /info-shaped JSON body (or a fixed ``payload``) after
+an optional delay, and fails a configurable fraction of requests with a 500. Keep-alive is supported
+so pooled clients can be measured fairly.
+"""
+import asyncio
+import json
+import random
+import threading
+from datetime import datetime
+
+
+class FakeBackend:
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, failure_rate=0.0, name="stub", payload=None):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.name = name
+        self.payload = payload
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        def close():
+            self._server.close()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(close)
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def body(self):
+        if self.payload is not None:
+            return json.dumps(self.payload).encode()
+        return json.dumps({
+            "service": self.name,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "host": self.name,
+        }).encode()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if self.failure_rate and random.random() < self.failure_rate:  # nosec B311
+                    status, body = b"500 Internal Server Error", b"{}"
+                else:
+                    status, body = b"200 OK", self.body()
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            writer.close()
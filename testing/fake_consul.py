@@ -0,0 +1,298 @@
+"""In-process fake of the Consul HTTP API for offline tests and benchmarks.
+
+Supports the subset the stack uses: catalog and health listings with blocking
+queries (``index=``/``wait=`` and ``X-Consul-Index``), plus agent service
+registration, maintenance mode and TTL checks. Every request is counted in ``requests`` keyed by
+path and every TTL heartbeat is logged in ``heartbeats``. Expired TTL checks
+turn critical when they are next read; blocked queries are not woken for it.
+With ``http_checks`` set, registrations carrying an HTTP check start critical
+and are polled every ``check_interval`` seconds, like a real agent would.
+"""
+import json
+import socket
+import threading
+import time
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def parse_wait(value, default=300.0):
+    if not value:
+        return default
+    for suffix, scale in (("ms", 0.001), ("s", 1.0), ("m", 60.0)):
+        if value.endswith(suffix):
+            return float(value[: -len(suffix)]) * scale
+    return float(value)
+
+
+class FakeConsul:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, http_checks=False, check_interval=0.05):
+        self.latency = latency
+        self.http_checks = http_checks
+        self.check_interval = check_interval
+        self.requests = Counter()
+        self.heartbeats = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._connections = set()
+        self._index = 1
+        self._catalog_index = 1
+        self._service_index = {}
+        self._services = {}
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        if self.http_checks:
+            threading.Thread(target=self._run_http_checks, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+        # Drop keep-alive connections too, so clients see the agent go away.
+        for conn in list(self._connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -- state mutation -------------------------------------------------
+
+    def _bump(self, name, catalog=False):
+        self._index += 1
+        self._service_index[name] = self._index
+        if catalog:
+            self._catalog_index = self._index
+        self._cond.notify_all()
+
+    def register(self, name, address, port, service_id=None, status="passing", tags=(), meta=None, check=None):
+        service_id = service_id or name
+        svc = {
+            "ID": service_id, "Service": name, "Address": address, "Port": port,
+            "Tags": list(tags), "Meta": dict(meta or {}), "Status": status,
+            "CheckID": (check or {}).get("CheckID") or f"service:{service_id}", "TTL": None,
+            "Maintenance": False, "HTTP": (check or {}).get("HTTP"),
+        }
+        if self.http_checks and svc["HTTP"]:
+            svc["Status"] = "critical"
+        if check and check.get("TTL"):
+            # Like Consul, a TTL check starts critical unless the registration says otherwise.
+            svc["TTL"] = parse_wait(check["TTL"])
+            svc["Status"] = check.get("Status", "critical")
+            svc["ExpiresAt"] = time.monotonic() + svc["TTL"]
+        with self._cond:
+            self._services[service_id] = svc
+            self._bump(name, catalog=True)
+        return service_id
+
+    def set_maintenance(self, service_id, enable):
+        with self._cond:
+            svc = self._services.get(service_id)
+            if svc is None:
+                return False
+            if svc["Maintenance"] != enable:
+                svc["Maintenance"] = enable
+                self._bump(svc["Service"])
+            return True
+
+    def pass_check(self, check_id):
+        with self._cond:
+            svc = next((s for s in self._services.values() if s["CheckID"] == check_id and s["TTL"]), None)
+            if svc is None:
+                return False
+            self.heartbeats.append((check_id, time.monotonic()))
+            svc["ExpiresAt"] = time.monotonic() + svc["TTL"]
+            if svc["Status"] != "passing":
+                svc["Status"] = "passing"
+                self._bump(svc["Service"])
+            return True
+
+    def _run_http_checks(self):
+        while not self._closed:
+            with self._cond:
+                targets = [(sid, svc["HTTP"]) for sid, svc in self._services.items() if svc["HTTP"]]
+            for service_id, url in targets:
+                try:
+                    with urllib.request.urlopen(url, timeout=0.5) as r:  # nosec B310
+                        status = "passing" if r.status == 200 else "critical"
+                except OSError:
+                    status = "critical"
+                with self._cond:
+                    if service_id in self._services:
+                        self.set_status(service_id, status)
+            time.sleep(self.check_interval)
+
+    def _expire_ttls(self):
+        now = time.monotonic()
+        for svc in self._services.values():
+            if svc["TTL"] and svc["Status"] != "critical" and now >= svc["ExpiresAt"]:
+                svc["Status"] = "critical"
+                self._bump(svc["Service"])
+
+    def deregister(self, service_id):
+        with self._cond:
+            svc = self._services.pop(service_id, None)
+            if svc is not None:
+                self._bump(svc["Service"], catalog=True)
+            return svc is not None
+
+    def set_status(self, service_id, status):
+        with self._cond:
+            svc = self._services[service_id]
+            if svc["Status"] != status:
+                svc["Status"] = status
+                self._bump(svc["Service"])
+
+    # -- queries ----------------------------------------------------------
+
+    def _block(self, index_fn, index, wait):
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while index and index_fn() <= index and not self._closed:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            return index_fn()
+
+    def catalog_services(self):
+        out = {}
+        for svc in self._services.values():
+            tags = out.setdefault(svc["Service"], [])
+            tags.extend(t for t in svc["Tags"] if t not in tags)
+        return out
+
+    def _checks(self, svc):
+        checks = [
+            {"Node": "fake", "CheckID": "serfHealth", "Status": "passing", "ServiceID": "", "ServiceName": ""},
+            {"Node": "fake", "CheckID": svc["CheckID"], "Status": svc["Status"],
+             "ServiceID": svc["ID"], "ServiceName": svc["Service"]},
+        ]
+        if svc["Maintenance"]:
+            checks.append({"Node": "fake", "CheckID": f"_service_maintenance:{svc['ID']}", "Status": "critical",
+                           "ServiceID": svc["ID"], "ServiceName": svc["Service"]})
+        return checks
+
+    def health_state_any(self):
+        checks = [{"Node": "fake", "CheckID": "serfHealth", "Status": "passing", "ServiceID": "", "ServiceName": ""}]
+        for svc in self._services.values():
+            checks.extend(self._checks(svc)[1:])
+        return checks
+
+    def health_service(self, name, passing=False):
+        entries = []
+        for svc in self._services.values():
+            healthy = svc["Status"] == "passing" and not svc["Maintenance"]
+            if svc["Service"] != name or (passing and not healthy):
+                continue
+            entries.append({
+                "Node": {"Node": "fake", "Address": "127.0.0.1"},
+                "Service": {k: svc[k] for k in ("ID", "Service", "Address", "Port", "Tags", "Meta")},
+                "Checks": self._checks(svc),
+            })
+        return entries
+
+
+def _make_handler(consul):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            consul._connections.add(self.connection)
+
+        def finish(self):
+            consul._connections.discard(self.connection)
+            super().finish()
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, payload=None, index=None):
+            body = json.dumps(payload).encode() if payload is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if index is not None:
+                self.send_header("X-Consul-Index", str(index))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"null")
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+            consul.requests[parts.path] += 1
+            if consul.latency:
+                time.sleep(consul.latency)
+            index = int(query.get("index") or 0)
+            wait = parse_wait(query.get("wait"))
+
+            with consul._cond:
+                consul._expire_ttls()
+            if parts.path == "/v1/catalog/services":
+                idx = consul._block(lambda: consul._catalog_index, index, wait)
+                with consul._cond:
+                    payload = consul.catalog_services()
+                return self._send(200, payload, idx)
+            if parts.path.startswith("/v1/health/service/"):
+                name = parts.path[len("/v1/health/service/"):]
+                idx = consul._block(lambda: consul._service_index.get(name, consul._catalog_index), index, wait)
+                with consul._cond:
+                    payload = consul.health_service(name, "passing" in query)
+                return self._send(200, payload, idx)
+            if parts.path == "/v1/health/state/any":
+                idx = consul._block(lambda: consul._index, index, wait)
+                with consul._cond:
+                    payload = consul.health_state_any()
+                return self._send(200, payload, idx)
+            self._send(404)
+
+        def do_PUT(self):
+            parts = urlsplit(self.path)
+            consul.requests[parts.path] += 1
+            if parts.path == "/v1/agent/service/register":
+                body = self._read_json()
+                consul.register(body["Name"], body.get("Address"), body.get("Port"),
+                                service_id=body.get("ID"), tags=body.get("Tags") or (),
+                                meta=body.get("Meta"), check=body.get("Check"))
+                return self._send(200)
+            if parts.path.startswith("/v1/agent/check/pass/"):
+                check_id = parts.path[len("/v1/agent/check/pass/"):]
+                if consul.pass_check(check_id):
+                    return self._send(200)
+                return self._send(404, f"Unknown check ID {check_id!r}")
+            if parts.path.startswith("/v1/agent/service/maintenance/"):
+                query = parse_qs(parts.query)
+                found = consul.set_maintenance(parts.path.rsplit("/", 1)[-1], query.get("enable") == ["true"])
+                return self._send(200 if found else 404)
+            if parts.path.startswith("/v1/agent/service/deregister/"):
+                consul.deregister(parts.path.rsplit("/", 1)[-1])
+                return self._send(200)
+            self._send(404)
+
+    return Handler
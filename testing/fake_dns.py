@@ -0,0 +1,95 @@
+"""Stub of Consul's DNS interface (UDP) for offline tests.
+
+Answers ``<name>.service.consul`` SRV queries from ``services`` with one SRV
+record per instance and its A record in the additional section, like Consul
+does, and A queries for those targets. Unknown names get NXDOMAIN with an SOA
+in the authority section carrying ``negative_ttl``. ``omit_additional`` leaves
+the A records out so clients have to look the targets up. Every query is
+counted in ``queries`` keyed by (name, type).
+"""
+import socket
+import threading
+from collections import Counter
+
+import dns.message
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+
+class FakeDNS:
+    def __init__(self, host="127.0.0.1", port=0, ttl=30, negative_ttl=10, domain="consul"):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.domain = domain
+        self.omit_additional = False
+        self.services = {}
+        self.queries = Counter()
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._sock.getsockname()
+
+    def register(self, name, address, port):
+        self.services.setdefault(name, []).append((address, port))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _target(self, address):
+        # Consul names instances with their own address "<hex IP>.addr.<dc>.consul.".
+        return "".join(f"{int(octet):02x}" for octet in address.split(".")) + f".addr.dc1.{self.domain}."
+
+    def answer(self, query):
+        question = query.question[0]
+        qname, rdtype = question.name.to_text(), question.rdtype
+        self.queries[(qname, dns.rdatatype.to_text(rdtype))] += 1
+        response = dns.message.make_response(query)
+        response.flags |= 0x400  # authoritative
+        suffix = f".service.{self.domain}."
+        if rdtype == dns.rdatatype.SRV and qname.endswith(suffix) and qname[: -len(suffix)] in self.services:
+            instances = self.services[qname[: -len(suffix)]]
+            response.answer.append(dns.rrset.from_text_list(
+                qname, self.ttl, dns.rdataclass.IN, dns.rdatatype.SRV,
+                [f"1 1 {port} {self._target(address)}" for address, port in instances]))
+            if not self.omit_additional:
+                for address in dict.fromkeys(address for address, _ in instances):
+                    response.additional.append(dns.rrset.from_text(
+                        self._target(address), self.ttl, dns.rdataclass.IN, dns.rdatatype.A, address))
+            return response
+        for address in {address for instances in self.services.values() for address, _ in instances}:
+            if rdtype == dns.rdatatype.A and qname == self._target(address):
+                response.answer.append(dns.rrset.from_text(qname, self.ttl, dns.rdataclass.IN,
+                                                           dns.rdatatype.A, address))
+                return response
+        response.set_rcode(dns.rcode.NXDOMAIN)
+        response.authority.append(dns.rrset.from_text(
+            f"{self.domain}.", self.negative_ttl, dns.rdataclass.IN, dns.rdatatype.SOA,
+            f"ns.{self.domain}. hostmaster.{self.domain}. 1 3600 600 86400 {self.negative_ttl}"))
+        return response
+
+    def _serve(self):
+        while True:
+            try:
+                data, peer = self._sock.recvfrom(4096)
+            except OSError:
+                return
+            try:
+                self._sock.sendto(self.answer(dns.message.from_wire(data)).to_wire(), peer)
+            except OSError:
+                return
@@ -0,0 +1,134 @@
+"""Minimal asyncio HTTP/1.1 upstream for reverse-proxy tests and benchmarks.
+
+Routes, by path:
+
+- ``/bytes/<n>``: ``n`` bytes of a repeating pattern, written in 1 MiB pieces
+  with a Content-Length, so a client can stream gigabytes without the server
+  holding them;
+- ``/echo`` (and anything else): a JSON description of the request (method,
+  path, headers) plus the length and a checksum of the body it read, which
+  may be sent with Content-Length or chunked;
+- ``/slow``: answers after ``slow_delay`` seconds.
+
+Keep-alive is supported; ``connections`` counts accepted TCP connections so
+tests can check that a client reuses them.
+"""
+import asyncio
+import json
+import threading
+import zlib
+
+PATTERN = bytes(range(256)) * 4096  # 1 MiB
+
+
+class FakeUpstream:
+    def __init__(self, host="127.0.0.1", port=0, name="upstream", slow_delay=5.0):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.slow_delay = slow_delay
+        self.connections = 0
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def instance(self):
+        return (self.host, self.port)
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if not self._thread.is_alive():
+            return
+
+        def close():
+            self._server.close()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(close)
+        self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def _body(self, reader, headers):
+        """(length, crc32) of the request body, read in pieces."""
+        length, crc = 0, 0
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await reader.readuntil(b"\r\n")
+                    return length, crc
+                left = size
+                while left:
+                    piece = await reader.read(min(left, 1 << 16))
+                    length, crc, left = length + len(piece), zlib.crc32(piece, crc), left - len(piece)
+                await reader.readexactly(2)
+        left = int(headers.get("content-length", 0))
+        while left:
+            piece = await reader.read(min(left, 1 << 16))
+            if not piece:
+                raise asyncio.IncompleteReadError(b"", left)
+            length, crc, left = length + len(piece), zlib.crc32(piece, crc), left - len(piece)
+        return length, crc
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                method, target, _ = head[0].split(" ", 2)
+                headers = {}
+                for line in head[1:]:
+                    if line:
+                        key, _, value = line.partition(":")
+                        headers[key.strip().lower()] = value.strip()
+                length, crc = await self._body(reader, headers)
+                self.requests += 1
+                path = target.split("?", 1)[0]
+                if path.startswith("/bytes/"):
+                    size = int(path.rsplit("/", 1)[1])
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n"
+                                 b"Content-Length: %d\r\n\r\n" % size)
+                    while size:
+                        piece = PATTERN[:min(size, len(PATTERN))]
+                        writer.write(piece)
+                        size -= len(piece)
+                        await writer.drain()
+                    continue
+                if path == "/slow":
+                    await asyncio.sleep(self.slow_delay)
+                body = json.dumps({"upstream": self.name, "method": method, "target": target, "headers": headers,
+                                   "bodyLength": length, "bodyCrc": crc}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nX-Upstream: " + self.name.encode()
+                             + b"\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,88 @@
+"""Small helpers shared by the test modules, so none of them imports another."""
+import asyncio
+import socket
+import time
+
+from common import metrics
+
+
+def free_port():
+    """A TCP port on 127.0.0.1 that nothing listens on right now."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_resp(status_code=200, payload=None, raise_http=False):
+    """A stand-in for a requests.Response answering ``payload``."""
+    class R:
+        def __init__(self):
+            self.status_code = status_code
+            self._payload = payload
+
+        def json(self):
+            return self._payload
+
+        def raise_for_status(self):
+            if raise_http or self.status_code >= 400:
+                raise RuntimeError(f"HTTP {self.status_code}")
+
+    return R()
+
+
+def sample(name, **labels):
+    """Current value of one sample line in the global metrics registry, or 0 if absent."""
+    want = name + ("{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else "")
+    for line in metrics.render().splitlines():
+        if line.startswith(want + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+class FakeClock:
+    """A monotonic clock that only moves when a test sets ``now``."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(predicate, timeout=3.0):
+    """Poll ``predicate`` until it is true; False if ``timeout`` seconds pass first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+async def asgi_get(agw, path):
+    """(status, headers, body) of a GET of ``path`` (query string included) on the ASGI gateway module ``agw``."""
+    path, _, query = path.partition("?")
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await agw.app({"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+                   "headers": []}, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+
+def run(agw, coro):
+    """Run ``coro`` to completion, then close the ASGI gateway's HTTP client on the same loop."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            if agw.CLIENT is not None:
+                await agw.CLIENT.close()
+
+    return asyncio.run(main())
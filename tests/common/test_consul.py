@@ -0,0 +1,122 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from common import consul as consul_mod
+from common.consul import Check, ConsulClient, ServiceEntry, checks_passing
+from testing.fake_consul import FakeConsul
+from testing.helpers import sample
+
+
+def ok(payload):
+    return SimpleNamespace(status_code=200, json=lambda: payload, raise_for_status=lambda: None)
+
+
+def http_error(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=resp)
+
+
+class ScriptedSession:
+    """Stands in for requests.Session: each GET pops the next outcome."""
+
+    def __init__(self, *outcomes):
+        self.headers = {}
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+        self.urls = []
+
+    def get(self, url, timeout):
+        self.urls.append(url)
+        self.timeouts.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture()
+def pauses(monkeypatch):
+    pauses = []
+    monkeypatch.setattr(consul_mod.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(consul_mod.time, "sleep", pauses.append)
+    return pauses
+
+
+def test_decodes_health_entries_into_slotted_objects():
+    entry = ServiceEntry.from_json({
+        "Node": {"Node": "n1", "Address": "10.0.0.1"},
+        "Service": {"ID": "a1", "Service": "service-a", "Address": "", "Port": 5000, "Tags": ["v1"]},
+        "Checks": [{"Node": "n1", "CheckID": "serfHealth", "Status": "passing"},
+                   {"Node": "n1", "CheckID": "service:a1", "Status": "passing", "ServiceID": "a1"}],
+    })
+    assert (entry.id, entry.name, entry.node, entry.tags, dict(entry.meta)) == ("a1", "service-a", "n1", ("v1",), {})
+    # An empty service address falls back to the node's.
+    assert entry.endpoint == ("10.0.0.1", 5000)
+    assert entry.passing
+    assert not hasattr(entry, "__dict__") and not hasattr(entry.checks[0], "__dict__")
+    assert ServiceEntry.from_json({"Service": {"Address": "svc"}}).endpoint is None
+
+
+def test_checks_passing_ignores_serf_health_but_needs_a_service_check():
+    serf = Check("n1", "serfHealth", "Serf", "passing")
+    assert not checks_passing([serf])
+    assert checks_passing([serf, Check("n1", "service:a", "a", "passing")])
+    assert not checks_passing([serf, Check("n1", "service:a", "a", "warning")])
+
+
+def test_retries_transient_failures_with_jittered_backoff(pauses):
+    session = ScriptedSession(requests.ConnectionError("refused"), http_error(503), ok({"service-a": []}))
+    client = ConsulClient("http://consul:8500", retries=2, backoff=0.05, session=session)
+    before = sample("outbound_request_retries_total", target="test_retry")
+
+    assert client.get("/v1/catalog/services", "test_retry").json() == {"service-a": []}
+    # Full jitter: each pause is drawn from [0, backoff * 2**attempt].
+    assert pauses == [0.05, 0.1]
+    assert sample("outbound_request_retries_total", target="test_retry") == before + 2
+    assert sample("outbound_request_errors_total", target="test_retry") >= 2
+
+
+def test_does_not_retry_client_errors_or_past_the_deadline(pauses):
+    client = ConsulClient("http://consul:8500", session=ScriptedSession(http_error(404)))
+    with pytest.raises(requests.HTTPError):
+        client.get("/v1/health/service/nope", "test_no_retry")
+
+    session = ScriptedSession(requests.ConnectTimeout("slow"), ok([]))
+    client = ConsulClient("http://consul:8500", backoff=1.0, session=session)
+    with pytest.raises(requests.ConnectTimeout):
+        client.get("/v1/health/service/a", "test_no_retry", deadline=time.monotonic() + 0.5)
+    assert pauses == []
+    # The socket timeout never outlives the deadline either.
+    assert session.timeouts[0] <= 0.5
+
+
+def test_reads_and_writes_against_consul():
+    with FakeConsul() as fake:
+        client = ConsulClient(fake.url, pool_size=4)
+        assert client.register({"Name": "service-a", "ID": "a1", "Address": "10.0.0.1", "Port": 5000,
+                                "Check": {"CheckID": "service:a1", "TTL": "15s", "Status": "passing"}}).status_code == 200
+        fake.register("service-a", "10.0.0.2", 5000, service_id="a2", status="critical")
+
+        assert client.catalog_services() == {"service-a": []}
+        entries = client.health_service("service-a")
+        assert {e.id: e.passing for e in entries} == {"a1": True, "a2": False}
+        assert [e.id for e in client.health_service("service-a", passing=True)] == ["a1"]
+        assert {(c.service_id, c.status) for c in client.health_state() if c.service_id} == {
+            ("a1", "passing"), ("a2", "critical")}
+
+        assert client.check_pass("service:a1").status_code == 200
+        client.maintenance("a1", "draining")
+        assert client.health_service("service-a", passing=True) == []
+        client.deregister("a1")
+        assert [e.id for e in client.health_service("service-a")] == ["a2"]
+
+
+def test_service_names_are_quoted_into_the_path():
+    session = ScriptedSession(ok([]))
+    client = ConsulClient("http://consul:8500", session=session)
+    assert client.health_service("a/b?x#y", passing=True) == []
+    assert session.urls == ["http://consul:8500/v1/health/service/a%2Fb%3Fx%23y?passing=true"]
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import brotli
+import msgpack
+import pytest
+from flask import Flask, jsonify
+
+from common import encoding
+
+ROWS = [{"service": f"service-{i}", "status": "online", "host": f"h{i}", "timestamp": "2024-01-01 00:00:00.000",
+         "responseTime": i} for i in range(100)] + [{"service": "service-x", "status": "offline",
+                                                     "instances": [{"address": "a:1"}]}]
+
+
+def test_dumps_matches_jsonify_for_ascii_rows():
+    app = Flask(__name__)
+    with app.app_context():
+        expected = jsonify(ROWS).get_data()
+    assert encoding.dumps(ROWS) == expected
+    fast = encoding.use_fast_json(Flask(__name__))
+    with fast.app_context():
+        assert jsonify(ROWS).get_data() == expected
+        assert jsonify(service="a", n=1).get_data() == b'{"n":1,"service":"a"}\n'
+    # Types orjson can't encode fall back to the standard library.
+    assert encoding.dumps({1: "a"}) == b'{"1":"a"}\n'
+
+
+def test_dumps_keeps_jsonify_values_where_orjson_bytes_differ():
+    app = Flask(__name__)
+    payload = {"host": "caf\u00e9", "big": 1e20, "small": 1e-7}
+    with app.app_context():
+        expected = jsonify(payload).get_data()
+    assert json.loads(encoding.dumps(payload)) == json.loads(expected) == payload
+    if encoding.orjson is not None:
+        assert encoding.dumps(payload) != expected
+
+
+def test_columnar_round_trips_with_missing_fields():
+    table = encoding.columnar(ROWS)
+    assert table["count"] == len(ROWS)
+    assert list(table["columns"]) == ["service", "status", "host", "timestamp", "responseTime", "instances"]
+    assert all(len(values) == len(ROWS) for values in table["columns"].values())
+    back = encoding.rows(table)
+    assert back[0] == dict(ROWS[0], instances=None)
+    assert back[-1]["host"] is None and back[-1]["instances"] == [{"address": "a:1"}]
+
+
+@pytest.mark.parametrize("accept, accept_encoding, expected", [
+    (None, None, (encoding.JSON, None)),
+    ("*/*", "gzip, deflate, br", (encoding.JSON, "br")),
+    ("application/json", "gzip", (encoding.JSON, "gzip")),
+    ("application/msgpack", "br;q=0.5, gzip", (encoding.MSGPACK, "gzip")),
+    ("application/x-msgpack, application/json;q=0.5", "identity", (encoding.MSGPACK, None)),
+    ("application/json, application/msgpack;q=0.5", "gzip;q=0, br;q=0", (encoding.JSON, None)),
+    ("text/html,*/*;q=0.8", "*", (encoding.JSON, "br")),
+])
+def test_negotiate(accept, accept_encoding, expected):
+    assert encoding.negotiate(accept, accept_encoding) == expected
+
+
+def test_small_bodies_are_not_compressed():
+    body, headers, suffix = encoding.represent([{"a": 1}], "*/*", "gzip, br")
+    assert body == b'[{"a":1}]\n' and "Content-Encoding" not in headers and suffix == ""
+
+
+def test_represent_encodes_each_variant_once():
+    variants = {}
+    json_body = encoding.dumps(ROWS)
+    br, headers, suffix = encoding.represent(ROWS, None, "br", json_body, variants)
+    assert headers == {"Content-Type": "application/json", "Vary": "Accept, Accept-Encoding",
+                       "Content-Encoding": "br"} and suffix == "-br"
+    assert brotli.decompress(br) == json_body
+    gz, _, _ = encoding.represent(ROWS, None, "gzip", json_body, variants)
+    assert json.loads(gzip.decompress(gz)) == ROWS
+    packed, headers, suffix = encoding.represent(ROWS, "application/msgpack", None, json_body, variants)
+    assert headers["Content-Type"] == "application/msgpack" and suffix == "-mp"
+    assert encoding.rows(msgpack.unpackb(packed))[0] == dict(ROWS[0], instances=None)
+    assert len(packed) < len(json_body) * 0.6
+
+    assert encoding.represent(ROWS, None, "br", json_body, variants)[0] is br
+    assert set(variants) == {(encoding.JSON, None), (encoding.JSON, "br"), (encoding.JSON, "gzip"),
+                             (encoding.MSGPACK, None)}
+
+
+def test_non_list_payloads_stay_json():
+    body, headers, _ = encoding.represent({"version": 1}, "application/msgpack", None)
+    assert headers["Content-Type"] == "application/json" and body == b'{"version":1}\n'
@@ -0,0 +1,139 @@
+import importlib
+import sys
+import time
+
+import pytest
+
+from common import metrics
+from testing.helpers import sample
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    hist = metrics.Histogram("call_seconds", "Call latency.", ("target",), buckets=(0.1, 1), registry=registry)
+    for seconds in (0.05, 0.5, 0.7, 3):
+        hist.labels("consul").observe(seconds)
+
+    assert registry.render().splitlines() == [
+        "# HELP call_seconds Call latency.",
+        "# TYPE call_seconds histogram",
+        'call_seconds_bucket{target="consul",le="0.1"} 1',
+        'call_seconds_bucket{target="consul",le="1.0"} 3',
+        'call_seconds_bucket{target="consul",le="+Inf"} 4',
+        'call_seconds_sum{target="consul"} 4.25',
+        'call_seconds_count{target="consul"} 4',
+    ]
+
+
+def test_counters_gauges_and_label_escaping():
+    registry = metrics.Registry()
+    errors = metrics.Counter("errors_total", "Errors.", ("route",), registry=registry)
+    inflight = metrics.Gauge("in_flight", "In flight.", registry=registry)
+    errors.labels('/a"b\\').inc()
+    errors.labels('/a"b\\').inc(2)
+    inflight.labels().inc()
+    inflight.labels().inc()
+    inflight.labels().dec()
+
+    text = registry.render()
+    assert 'errors_total{route="/a\\"b\\\\"} 3' in text
+    assert "# TYPE in_flight gauge\nin_flight 1\n" in text
+    with pytest.raises(ValueError):
+        errors.labels("a", "b")
+    with pytest.raises(ValueError):
+        metrics.Counter("errors_total", "Again.", registry=registry)
+
+
+def test_render_sums_processes_and_drops_gauges_of_exited_ones():
+    registry = metrics.Registry()
+    served = metrics.Counter("served_total", "Served.", ("route",), registry=registry)
+    inflight = metrics.Gauge("in_flight", "In flight.", registry=registry)
+    hist = metrics.Histogram("call_seconds", "Call latency.", buckets=(0.1,), registry=registry)
+    served.labels("/a").inc(2)
+    inflight.labels().inc()
+    hist.labels().observe(0.05)
+    live = registry.dump()
+    served.labels("/b").inc()
+    hist.labels().observe(1)
+    exited = registry.dump()
+
+    lines = registry.render([(live, True), (exited, False)]).splitlines()
+    assert 'served_total{route="/a"} 4' in lines and 'served_total{route="/b"} 1' in lines
+    assert "in_flight 1" in lines
+    assert 'call_seconds_bucket{le="0.1"} 2' in lines and "call_seconds_count 3" in lines
+    # The registry's own values are untouched.
+    assert 'served_total{route="/a"} 2' in registry.render().splitlines()
+
+
+def test_track_records_latency_and_errors():
+    before = sample("outbound_request_errors_total", target="test_track")
+    with metrics.track("test_track"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.track("test_track"):
+            raise RuntimeError("down")
+
+    assert sample("outbound_request_duration_seconds_count", target="test_track") == 2
+    assert sample("outbound_request_errors_total", target="test_track") == before + 1
+    assert sample("outbound_requests_in_flight", target="test_track") == 0
+
+
+def test_observation_costs_under_five_microseconds():
+    hist = metrics.Histogram("hot_path_seconds", "Hot path.", ("target",), registry=None)
+    n = 100_000
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        hist.labels("consul_health").observe(0.004)
+    assert (time.perf_counter_ns() - t0) / n < 5000
+
+
+def fresh(monkeypatch, module, **env):
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    sys.modules.pop(module, None)
+    return importlib.import_module(module)
+
+
+def test_service_exposes_inbound_metrics(monkeypatch):
+    svc = fresh(monkeypatch, "service.app", SERVICE_NAME="service-a", BIND_HOST="127.0.0.1")
+    client = svc.app.test_client()
+    before = sample("http_request_duration_seconds_count", route="/info", method="GET")
+    client.get("/info")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == metrics.CONTENT_TYPE
+    assert sample("http_request_duration_seconds_count", route="/info", method="GET") == before + 1
+    # The scrape itself is in flight while the body is rendered.
+    assert "\nhttp_requests_in_flight 1\n" in resp.get_data(as_text=True)
+
+
+def test_gateway_counts_consul_calls_and_errors(monkeypatch):
+    gw = fresh(monkeypatch, "gateway.app", BIND_HOST="127.0.0.1")
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+
+    def down(url, timeout):
+        raise ConnectionError("consul down")
+
+    monkeypatch.setattr(gw.SESSION, "get", down)
+    calls = sample("outbound_request_duration_seconds_count", target="consul_catalog")
+    errors = sample("outbound_request_errors_total", target="consul_catalog")
+    handled = sample("http_request_duration_seconds_count", route="/services", method="GET")
+
+    assert gw.app.test_client().get("/services").get_json() == []
+    assert sample("outbound_request_duration_seconds_count", target="consul_catalog") == calls + 1
+    assert sample("outbound_request_errors_total", target="consul_catalog") == errors + 1
+    assert sample("http_request_duration_seconds_count", route="/services", method="GET") == handled + 1
+
+
+def test_healthz_records_view_exceptions_as_errors(monkeypatch):
+    hz = fresh(monkeypatch, "healthz.app", BIND_HOST="127.0.0.1")
+
+    @hz.app.route("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    before = sample("http_request_errors_total", route="/boom", method="GET")
+    assert hz.app.test_client().get("/boom").status_code == 500
+    assert sample("http_request_errors_total", route="/boom", method="GET") == before + 1
+    assert "http_request_duration_seconds" in hz.app.test_client().get("/metrics").get_data(as_text=True)
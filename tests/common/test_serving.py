@@ -0,0 +1,171 @@
+import importlib
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from testing.fake_consul import FakeConsul
+from testing.helpers import free_port
+
+
+class FakeApp:
+    def __init__(self):
+        self.ran = None
+
+    def run(self, host, port):
+        self.ran = (host, port)
+
+
+class FakeArbiter:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def stop(self, graceful=True):
+        self.calls.append("stop")
+
+
+def load_serving(monkeypatch, mode):
+    monkeypatch.setenv("SERVE_MODE", mode)
+    monkeypatch.setenv("WEB_WORKERS", "3")
+    monkeypatch.delitem(sys.modules, "common.serving", raising=False)
+    return importlib.import_module("common.serving")
+
+
+def test_dev_mode_runs_flask_server_and_hooks_once(monkeypatch):
+    serving = load_serving(monkeypatch, "dev")
+    app, calls = FakeApp(), []
+
+    serving.serve(app, "127.0.0.1", 5000,
+                  on_start=lambda: calls.append("start"), on_worker_start=lambda: calls.append("worker"))
+
+    assert app.ran == ("127.0.0.1", 5000)
+    assert calls == ["start", "worker"]
+
+
+def test_prod_mode_configures_gunicorn(monkeypatch, tmp_path):
+    serving = load_serving(monkeypatch, "prod")
+    from gunicorn.app.base import BaseApplication
+    from common import metrics
+
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    (tmp_path / "123.json").write_text("{}")
+    shared = []
+    monkeypatch.setattr(metrics, "share", shared.append)
+
+    captured = {}
+
+    def fake_run(self):
+        captured["cfg"] = self.cfg
+        captured["app"] = self.load()
+
+    monkeypatch.setattr(BaseApplication, "run", fake_run)
+    app, calls = FakeApp(), []
+
+    serving.serve(app, "127.0.0.1", 5000, on_start=lambda: calls.append("start"),
+                  on_worker_start=lambda: calls.append("worker"), on_drain=lambda: calls.append("drain"))
+
+    cfg = captured["cfg"]
+    assert captured["app"] is app and app.ran is None
+    assert cfg.bind == ["127.0.0.1:5000"]
+    assert cfg.workers == 3 and cfg.threads == 4
+    assert cfg.worker_class_str == "gthread"
+    assert calls == ["start"]
+    cfg.post_fork(None, None)
+    assert calls == ["start", "worker"]
+    # Each of the three workers reports the pod's metrics; the last run's values are gone.
+    assert shared == [str(tmp_path)] and not list(tmp_path.iterdir())
+
+    # Draining runs once, before the arbiter's graceful stop closes the listeners.
+    assert cfg.graceful_timeout == serving.DRAIN_TIMEOUT
+    arbiter = FakeArbiter(calls)
+    cfg.on_starting(arbiter)
+    arbiter.stop()
+    arbiter.stop()
+    assert calls == ["start", "worker", "drain", "stop", "stop"]
+
+
+def test_workers_default_to_the_app_then_the_cgroup_quota(monkeypatch, tmp_path):
+    serving = load_serving(monkeypatch, "prod")
+    monkeypatch.setattr(serving, "WEB_WORKERS", 0)
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(64)))
+    assert serving.worker_count(1) == 1
+
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert serving.cpu_limit(str(tmp_path)) == 2
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert serving.cpu_limit(str(tmp_path)) == 64
+    # cgroup v1
+    (tmp_path / "cpu.max").unlink()
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("50000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert serving.cpu_limit(str(tmp_path)) == 1
+
+    monkeypatch.setattr(serving, "cpu_limit", lambda: 2)
+    assert serving.worker_count() == 5
+    monkeypatch.setattr(serving, "WEB_WORKERS", 3)
+    assert serving.worker_count(1) == 3
+
+
+def test_prod_mode_registers_once_per_pod_not_per_worker():
+    port = free_port()
+    with FakeConsul() as consul:
+        host, consul_port = consul.url.rsplit("//", 1)[1].split(":")
+        env = dict(os.environ, SERVE_MODE="prod", WEB_WORKERS="3", SERVICE_NAME="service-a",
+                   SERVICE_PORT=str(port), BIND_HOST="127.0.0.1", CONSUL_HOST=host, CONSUL_PORT=consul_port)
+        proc = subprocess.Popen([sys.executable, "-m", "service.app"], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 15
+            while True:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/info", timeout=1) as r:
+                        assert r.status == 200
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        pytest.fail("service never came up")
+                    time.sleep(0.1)
+            time.sleep(0.5)
+            assert consul.requests["/v1/agent/service/register"] == 1
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+def test_prod_mode_metrics_cover_every_worker():
+    port = free_port()
+    with FakeConsul() as consul:
+        host, consul_port = consul.url.rsplit("//", 1)[1].split(":")
+        env = dict(os.environ, SERVE_MODE="prod", WEB_WORKERS="3", SERVICE_NAME="service-a",
+                   SERVICE_PORT=str(port), BIND_HOST="127.0.0.1", CONSUL_HOST=host, CONSUL_PORT=consul_port,
+                   METRICS_FLUSH_INTERVAL="0.1")
+        env.pop("METRICS_DIR", None)
+        proc = subprocess.Popen([sys.executable, "-m", "service.app"], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 15
+            while True:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/info", timeout=1):
+                        break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        pytest.fail("service never came up")
+                    time.sleep(0.1)
+            for _ in range(29):
+                # A new connection each time, so the requests spread over the workers.
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/info", timeout=1):
+                    pass
+            time.sleep(0.5)
+
+            for _ in range(6):
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as r:
+                    text = r.read().decode()
+                assert 'http_request_duration_seconds_count{route="/info",method="GET"} 30\n' in text
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
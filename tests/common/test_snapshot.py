@@ -0,0 +1,90 @@
+import os
+import time
+
+import pytest
+
+from common import snapshot
+from common.snapshot import SnapshotError, SnapshotFile, SnapshotStore
+
+ENTRIES = {"service-b": [["10.0.0.2", 5000]], "service-a": [["10.0.0.1", 5000], ["10.0.0.1", 5001]],
+           "service-é": [], "service-c": {"status": "healthy"}}
+
+
+def test_round_trip_is_sorted_and_lazy(tmp_path):
+    path = tmp_path / "snap.bin"
+    size = snapshot.write(path, ENTRIES, meta={"kind": "test", "version": 7})
+    assert os.path.getsize(path) == size
+    with SnapshotFile(path) as snap:
+        assert snap.meta == {"kind": "test", "version": 7}
+        assert 0 <= snap.age < 5
+        assert list(snap) == sorted(ENTRIES)
+        assert len(snap) == 4
+        assert dict(snap) == ENTRIES
+        assert snap.get("service-zzz") is None
+        assert "service-é" in snap
+    with SnapshotFile(path, decode=lambda v: tuple(map(tuple, v))) as snap:
+        assert snap["service-a"] == (("10.0.0.1", 5000), ("10.0.0.1", 5001))
+
+
+def test_empty_snapshot(tmp_path):
+    path = tmp_path / "snap.bin"
+    snapshot.write(path, {})
+    with SnapshotFile(path) as snap:
+        assert len(snap) == 0 and list(snap) == [] and snap.meta == {}
+
+
+def test_bad_files_are_rejected(tmp_path):
+    path = tmp_path / "snap.bin"
+    data = snapshot.encode(ENTRIES)
+
+    for bad, message in ((b"", "empty"), (data[:10], "truncated header"), (b"X" + data[1:], "not a snapshot"),
+                         (data[:-3], "truncated"), (data[:-1] + bytes([data[-1] ^ 1]), "checksum")):
+        path.write_bytes(bad)
+        with pytest.raises(SnapshotError, match=message):
+            SnapshotFile(path)
+
+    newer = bytearray(data)
+    newer[6:8] = (snapshot.FORMAT_VERSION + 1).to_bytes(2, "little")
+    path.write_bytes(bytes(newer))
+    with pytest.raises(SnapshotError, match="format version"):
+        SnapshotFile(path)
+
+
+def test_replace_leaves_open_readers_on_the_old_file(tmp_path):
+    path = tmp_path / "snap.bin"
+    snapshot.write(path, {"service-a": 1})
+    with SnapshotFile(path) as old:
+        snapshot.write(path, {"service-a": 2, "service-b": 3})
+        assert dict(old) == {"service-a": 1}
+        with SnapshotFile(path) as new:
+            assert dict(new) == {"service-a": 2, "service-b": 3}
+    # No temporary files left behind.
+    assert os.listdir(tmp_path) == ["snap.bin"]
+
+
+def test_store_loads_only_its_own_kind(tmp_path):
+    path = tmp_path / "snap.bin"
+    assert SnapshotStore(path, "gateway").load() is None
+    snapshot.write(path, ENTRIES, meta={"kind": "healthz"})
+    assert SnapshotStore(path, "gateway").load() is None
+    path.write_bytes(b"garbage")
+    assert SnapshotStore(path, "healthz").load() is None
+
+
+def test_store_writes_in_the_background_newest_state_wins(tmp_path):
+    path = tmp_path / "snap.bin"
+    store = SnapshotStore(path, "gateway", min_interval=0.2)
+    store.save({"service-a": 1}, version=1)
+    store.flush()
+    assert store.writes == 1
+    t0 = time.monotonic()
+    for version in range(2, 50):
+        store.save({"service-a": version}, version=version)
+    # save() never waits for the disk.
+    assert time.monotonic() - t0 < 0.1
+    store.flush()
+    assert store.writes == 2
+    assert time.monotonic() - t0 >= 0.1
+    with store.load() as snap:
+        assert snap.meta == {"kind": "gateway", "version": 49}
+        assert snap["service-a"] == 49
@@ -5,6 +5,7 @@ from typing import Any, Dict
 import pytest
 
 GATEWAY_IMPORT = "gateway.app"
+GATEWAY_ASGI_IMPORT = "gateway.asgi"
 
 
 def _fresh_import(monkeypatch: pytest.MonkeyPatch, env: Dict[str, Any]):
@@ -27,3 +28,10 @@ def gw(monkeypatch: pytest.MonkeyPatch):
 @pytest.fixture()
 def client(gw):
     return gw.app.test_client()
+
+
+@pytest.fixture()
+def agw(gw):
+    if GATEWAY_ASGI_IMPORT in sys.modules:
+        del sys.modules[GATEWAY_ASGI_IMPORT]
+    return importlib.import_module(GATEWAY_ASGI_IMPORT)
@@ -0,0 +1,117 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from common.consul import ConsulClient
+from gateway.balancer import Ewma, LeastOutstanding, RoundRobin, make_balancer
+from testing.fake_backend import FakeBackend
+from testing.fake_consul import FakeConsul
+from testing.helpers import make_resp
+
+A, B, C = ("10.0.0.1", 80), ("10.0.0.2", 80), ("10.0.0.3", 80)
+
+
+def test_round_robin_rotates_per_service():
+    rr = RoundRobin()
+    firsts = [rr.order("svc", (A, B, C))[0] for _ in range(6)]
+    assert firsts == [A, B, C, A, B, C]
+    assert rr.order("other", (A, B, C))[0] == A
+
+
+def test_least_outstanding_prefers_idle_instances():
+    lo = LeastOutstanding()
+    lo.begin(A)
+    lo.begin(B)
+    assert lo.order("svc", (A, B, C))[0] == C
+    lo.end(A, 0.01)
+    assert lo.order("svc", (A, B, C))[:2] in ([A, C], [C, A])
+
+
+def test_ewma_tries_unknown_first_then_prefers_fast_and_penalizes_failures():
+    ewma = Ewma(penalty=2.5)
+    for inst, seconds in ((A, 0.2), (B, 0.01)):
+        ewma.begin(inst)
+        ewma.end(inst, seconds)
+    assert ewma.order("svc", (A, B, C))[0] == C
+    ewma.begin(C)
+    ewma.end(C, None)
+    assert [ewma.order("svc", (A, B, C)) for _ in range(3)] == [[B, A, C]] * 3
+
+
+def test_unknown_strategy_is_rejected():
+    assert isinstance(make_balancer("ewma"), Ewma)
+    with pytest.raises(ValueError):
+        make_balancer("random")
+
+
+def test_probes_rotate_across_passing_instances(monkeypatch, gw, client):
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    probes = Counter()
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={"service-a": []})
+        if url.startswith(gw.HEALTH_SERVICE):
+            return make_resp(payload=[{"Service": {"Address": addr, "Port": port}} for addr, port in (A, B, C)])
+        probes[url] += 1
+        return make_resp(payload={"service": "service-a", "host": url.split("/")[2]})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    hosts = [client.get("/services").get_json()[0]["host"] for _ in range(6)]
+    assert hosts == ["10.0.0.1:80", "10.0.0.2:80", "10.0.0.3:80"] * 2
+    assert set(probes.values()) == {2}
+
+
+def test_all_instances_mode_reports_each_replica(monkeypatch, gw, client):
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    monkeypatch.setattr(gw, "PROBE_ALL_INSTANCES", True)
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={"service-a": []})
+        if url.startswith(gw.HEALTH_SERVICE):
+            return make_resp(payload=[{"Service": {"Address": addr, "Port": port}} for addr, port in (A, B, C)])
+        if "10.0.0.1" in url:
+            raise TimeoutError("replica hung")
+        return make_resp(payload={"service": "service-a", "host": "host-" + url.split("/")[2].split(":")[0][-1]})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    (svc,) = client.get("/services").get_json()
+    assert svc["status"] == "online" and svc["host"] == "host-2"
+    assert [(i["address"], i["host"], i["status"]) for i in svc["instances"]] == [
+        ("10.0.0.1:80", "N/A", "offline"),
+        ("10.0.0.2:80", "host-2", "online"),
+        ("10.0.0.3:80", "host-3", "online"),
+    ]
+    assert svc["instances"][0]["responseTime"] is None
+    assert all(isinstance(i["responseTime"], int) for i in svc["instances"][1:])
+
+
+def test_asgi_all_instances_mode_matches_flask(monkeypatch, gw, agw, client):
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    monkeypatch.setattr(gw, "PROBE_ALL_INSTANCES", True)
+    with FakeConsul() as consul, FakeBackend(name="service-a") as one, FakeBackend(name="service-a") as two:
+        monkeypatch.setattr(gw, "CATALOG_SERVICES", f"{consul.url}/v1/catalog/services")
+        monkeypatch.setattr(gw, "HEALTH_SERVICE", f"{consul.url}/v1/health/service/")
+        monkeypatch.setattr(gw, "CONSUL", ConsulClient(consul.url, session=gw.SESSION))
+        consul.register("service-a", "127.0.0.1", one.port, service_id="a1")
+        consul.register("service-a", "127.0.0.1", two.port, service_id="a2")
+
+        async def main():
+            try:
+                return await agw.list_services()
+            finally:
+                await agw.CLIENT.close()
+
+        async_result = asyncio.run(main())
+        flask_result = client.get("/services").get_json()
+
+    def shape(services):
+        return [(s["status"], [(i["address"], i["status"]) for i in s["instances"]]) for s in services]
+
+    assert shape(async_result) == shape(flask_result) == [
+        ("online", [(f"127.0.0.1:{one.port}", "online"), (f"127.0.0.1:{two.port}", "online")])]
+    assert one.requests == two.requests == 2
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+
+from gateway.watcher import CatalogWatcher, parse_instances
+from testing.fake_consul import FakeConsul
+from testing.helpers import wait_until
+
+
+@pytest.fixture()
+def consul():
+    with FakeConsul() as fake:
+        yield fake
+
+
+@pytest.fixture()
+def watcher(consul):
+    w = CatalogWatcher(consul.url, wait="5s")
+    yield w
+    w.stop()
+
+
+def test_parse_instances_skips_entries_without_address_or_port():
+    entries = [
+        {"Service": {"Address": "", "Port": 5000}, "Node": {"Address": "10.0.0.1"}},
+        {"Service": {"Address": "svc"}},
+        {"Service": {"Address": "svc", "Port": 5001}},
+    ]
+    assert parse_instances(entries) == (("10.0.0.1", 5000), ("svc", 5001))
+
+
+def test_watcher_builds_snapshot_of_passing_instances(consul, watcher):
+    consul.register("service-a", "10.0.0.1", 5000)
+    consul.register("service-b", "10.0.0.2", 5000, status="critical")
+    consul.register("healthz", "10.0.0.3", 6000)
+
+    assert watcher.snapshot() is None
+    watcher.start()
+
+    assert wait_until(lambda: len((watcher.snapshot() or ((), (), {}))[2]) == 2)
+    snap = watcher.snapshot()
+    assert snap.names == ("service-a", "service-b")
+    assert snap.instances == {"service-a": (("10.0.0.1", 5000),), "service-b": ()}
+    assert watcher.last_sync is not None
+
+
+def test_watcher_picks_up_changes_without_waiting_for_poll_timeout(consul, watcher):
+    consul.register("service-a", "10.0.0.1", 5000)
+    watcher.start()
+    assert wait_until(lambda: "service-a" in (watcher.snapshot() or ((), (), {}))[2])
+    version = watcher.snapshot().version
+
+    consul.set_status("service-a", "critical")
+    assert wait_until(lambda: watcher.snapshot().instances["service-a"] == (), timeout=1.0)
+
+    consul.register("service-c", "10.0.0.3", 5000)
+    assert wait_until(lambda: watcher.snapshot().instances.get("service-c") == (("10.0.0.3", 5000),), timeout=1.0)
+
+    consul.deregister("service-a")
+    assert wait_until(lambda: watcher.snapshot().names == ("service-c",), timeout=1.0)
+    assert "service-a" not in watcher.snapshot().instances
+    assert watcher.snapshot().version > version
+
+
+def test_failed_read_is_retried_on_the_next_poll(consul):
+    consul.register("service-a", "10.0.0.1", 5000)
+    watcher = CatalogWatcher(consul.url, wait="1s", retry_backoff=0.1)
+    get, reads = watcher.consul.get, []
+
+    def flaky_get(path, *args, **kwargs):
+        if path.startswith(watcher.health_path):
+            reads.append(path)
+            if len(reads) == 1:
+                raise ConnectionError("reset")
+        return get(path, *args, **kwargs)
+
+    watcher.consul.get = flaky_get
+    watcher.start()
+    try:
+        assert wait_until(lambda: watcher.snapshot() is not None)
+        assert "service-a" not in watcher.snapshot().instances
+        # Nothing changes in Consul; the next poll (a watch timeout at the latest) retries the read.
+        assert wait_until(lambda: watcher.snapshot().instances.get("service-a") == (("10.0.0.1", 5000),),
+                          timeout=4)
+        assert len(reads) == 2 and not watcher._failed
+    finally:
+        watcher.stop()
+
+
+def test_first_sync_of_a_large_catalog_is_one_read_per_service_and_few_snapshots(consul):
+    names = [f"service-{i:04d}" for i in range(400)]
+    for i, name in enumerate(names):
+        consul.register(name, f"10.0.{i // 256}.{i % 256}", 5000)
+    published = []
+    watcher = CatalogWatcher(consul.url, wait="5s", on_publish=published.append)
+    watcher.start()
+    try:
+        assert wait_until(lambda: len((watcher.snapshot() or ((), (), {}))[2]) == len(names), timeout=10)
+        assert all(consul.requests[f"/v1/health/service/{name}"] == 1 for name in names)
+        # Two long-polls in all, and the reads are coalesced into a handful of snapshots.
+        assert sum(t.name.startswith("watch-") for t in threading.enumerate()) <= 3 + watcher.fetch_workers
+        assert len(published) < 40
+
+        consul.set_status("service-0007", "critical")
+        assert wait_until(lambda: watcher.snapshot().instances["service-0007"] == ())
+        assert consul.requests["/v1/health/service/service-0007"] == 2
+        assert consul.requests["/v1/health/service/service-0008"] == 1
+    finally:
+        watcher.stop()
+
+
+def test_list_services_reads_snapshot_and_only_probes_info(monkeypatch, gw, client, consul):
+    for name in ("service-a", "service-b"):
+        consul.register(name, name, 5000)
+    watcher = CatalogWatcher(consul.url, wait="5s")
+    monkeypatch.setattr(gw, "WATCHER", watcher)
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    watcher.start()
+    try:
+        assert wait_until(lambda: len((watcher.snapshot() or ((), (), {}))[2]) == 2)
+        # Both watches have moved on to their blocking requests.
+        assert wait_until(lambda: consul.requests["/v1/catalog/services"] >= 2
+                          and consul.requests["/v1/health/state/any"] >= 2)
+
+        probed = []
+
+        def fake_get(url, timeout):
+            assert url.endswith("/info"), f"Unexpected GET {url}"
+            probed.append(url)
+            name = url.split("//")[1].split(":")[0]
+
+            class R:
+                status_code = 200
+
+                def raise_for_status(self):
+                    pass
+
+                def json(self):
+                    return {"service": name, "timestamp": "t", "host": "h"}
+
+            return R()
+
+        monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+        consul_calls = sum(consul.requests.values())
+        for _ in range(20):
+            data = client.get("/services").get_json()
+            assert [d["service"] for d in data] == ["service-a", "service-b"]
+            assert all(d["status"] == "online" for d in data)
+
+        # Dashboard traffic costs only the /info probes; Consul sees no extra calls.
+        assert len(probed) == 40
+        assert sum(consul.requests.values()) == consul_calls
+    finally:
+        watcher.stop()
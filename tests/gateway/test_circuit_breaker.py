@@ -0,0 +1,98 @@
+import time
+from collections import Counter
+
+from gateway.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from testing.helpers import FakeClock, make_resp
+
+
+def test_breaker_opens_after_threshold_and_recovers_through_half_open():
+    clock = FakeClock(100.0)
+    breaker = CircuitBreaker(threshold=3, reset_timeout=10, clock=clock)
+    key = "10.0.0.1:5000"
+
+    for _ in range(2):
+        assert breaker.allow(key)
+        breaker.failure(key)
+    assert breaker.state(key) == CLOSED
+    breaker.failure(key)
+    assert breaker.state(key) == OPEN
+    assert not breaker.allow(key)
+    assert breaker.snapshot() == {key: {"state": OPEN, "failures": 3, "retryIn": 10.0}}
+
+    # One trial after the reset timeout; concurrent callers still short-circuit.
+    clock.now += 10
+    assert breaker.allow(key)
+    assert breaker.state(key) == HALF_OPEN
+    assert not breaker.allow(key)
+
+    # A failed trial opens the circuit again.
+    breaker.failure(key)
+    assert breaker.state(key) == OPEN and not breaker.allow(key)
+
+    clock.now += 10
+    assert breaker.allow(key)
+    breaker.success(key)
+    assert breaker.state(key) == CLOSED and breaker.allow(key)
+    assert breaker.snapshot() == {}
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=10)
+    breaker.failure("a:1")
+    breaker.success("a:1")
+    breaker.failure("a:1")
+    assert breaker.state("a:1") == CLOSED
+
+
+def test_lost_half_open_trial_allows_another_after_reset_timeout():
+    clock = FakeClock(100.0)
+    breaker = CircuitBreaker(threshold=1, reset_timeout=5, clock=clock)
+    breaker.failure("a:1")
+    clock.now += 5
+    assert breaker.allow("a:1")
+    clock.now += 5
+    assert breaker.allow("a:1")
+
+
+def test_zero_threshold_disables_breaker():
+    breaker = CircuitBreaker(threshold=0, reset_timeout=10)
+    for _ in range(10):
+        breaker.failure("a:1")
+    assert breaker.allow("a:1") and breaker.snapshot() == {}
+
+
+def test_dead_backend_is_skipped_once_its_circuit_opens(monkeypatch, gw, client):
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    calls = Counter()
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={"service-a": [], "service-dead": []})
+        if url.startswith(gw.HEALTH_SERVICE):
+            name = url[len(gw.HEALTH_SERVICE):].split("?")[0]
+            return make_resp(payload=[{"Service": {"Address": name, "Port": 5000}}])
+        calls[url] += 1
+        if "service-dead" in url:
+            time.sleep(0.2)
+            raise TimeoutError("read timed out")
+        return make_resp(payload={"service": "service-a", "host": "h1", "timestamp": "2024-01-01 00:00:00.000"})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    for _ in range(gw.BREAKER.threshold):
+        client.get("/services")
+
+    t0 = time.monotonic()
+    data = client.get("/services").get_json()
+    elapsed = time.monotonic() - t0
+
+    assert elapsed < 0.15
+    assert [s["status"] for s in data] == ["online", "offline"]
+    assert calls["http://service-dead:5000/info"] == gw.BREAKER.threshold
+    assert calls["http://service-a:5000/info"] == gw.BREAKER.threshold + 1
+
+    breakers = client.get("/debug/breakers").get_json()
+    assert list(breakers) == ["service-dead:5000"]
+    assert breakers["service-dead:5000"]["state"] == "open"
+    assert breakers["service-dead:5000"]["failures"] == gw.BREAKER.threshold
+    assert 0 < breakers["service-dead:5000"]["retryIn"] <= gw.BREAKER.reset_timeout
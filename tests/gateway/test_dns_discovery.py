@@ -0,0 +1,191 @@
+import importlib
+import socket
+import sys
+import time
+
+import dns.exception
+import pytest
+
+from gateway.resolver import SrvResolver
+from gateway.watcher import Snapshot
+from testing.fake_backend import FakeBackend
+from testing.fake_dns import FakeDNS
+from testing.helpers import FakeClock
+
+
+@pytest.fixture()
+def dns_server():
+    with FakeDNS(ttl=30, negative_ttl=10) as fake:
+        fake.register("service-a", "10.0.0.5", 5000)
+        fake.register("service-a", "10.0.0.6", 5001)
+        yield fake
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def resolver_for(dns_server, **kwargs):
+    host, port = dns_server.address
+    return SrvResolver(host, port, **kwargs)
+
+
+def test_srv_answers_are_cached_for_their_ttl(dns_server):
+    clock = FakeClock(1000.0)
+    resolver = resolver_for(dns_server, clock=clock)
+    assert resolver.resolve("service-a") == (("10.0.0.5", 5000), ("10.0.0.6", 5001))
+    assert resolver.resolve("service-a") == (("10.0.0.5", 5000), ("10.0.0.6", 5001))
+    assert dns_server.queries[("service-a.service.consul.", "SRV")] == 1
+    # Addresses came with the answer; no A lookups.
+    assert sum(dns_server.queries.values()) == 1
+
+    dns_server.register("service-a", "10.0.0.7", 5002)
+    clock.now += 29
+    assert len(resolver.resolve("service-a")) == 2
+    clock.now += 1
+    assert len(resolver.resolve("service-a")) == 3
+    assert dns_server.queries[("service-a.service.consul.", "SRV")] == 2
+    assert resolver.stats == {"hits": 2, "misses": 2, "entries": 1, "evictions": 0}
+
+
+def test_consul_host_is_looked_up_again_after_its_ttl_and_after_a_failure(monkeypatch, dns_server):
+    clock = FakeClock(1000.0)
+    address, port = dns_server.address
+    lookups = []
+
+    def gethostbyname(host):
+        lookups.append(host)
+        return address
+
+    monkeypatch.setattr("socket.gethostbyname", gethostbyname)
+    resolver = SrvResolver("consul", port, host_ttl=30, timeout=0.2, clock=clock)
+    resolver.resolve("service-a")
+    resolver.invalidate()
+    resolver.resolve("service-a")
+    assert lookups == ["consul"]
+    clock.now += 30
+    resolver.invalidate()
+    resolver.resolve("service-a")
+    assert lookups == ["consul", "consul"]
+
+    # Consul moved: the stale address fails once, and the next query looks the host up again.
+    resolver.invalidate()
+    resolver._server = ("127.0.0.1", clock.now + 30)
+    resolver.port = free_udp_port()
+    with pytest.raises((dns.exception.DNSException, OSError)):
+        resolver.resolve("service-a")
+    resolver.port = port
+    assert resolver.resolve("service-a") == (("10.0.0.5", 5000), ("10.0.0.6", 5001))
+    assert lookups == ["consul"] * 3
+
+
+def test_unknown_services_are_cached_negatively_for_the_soa_minimum(dns_server):
+    clock = FakeClock(1000.0)
+    resolver = resolver_for(dns_server, clock=clock)
+    assert resolver.resolve("service-x") == ()
+    clock.now += 9
+    assert resolver.resolve("service-x") == ()
+    assert dns_server.queries[("service-x.service.consul.", "SRV")] == 1
+
+    dns_server.register("service-x", "10.0.0.9", 5000)
+    clock.now += 1
+    assert resolver.resolve("service-x") == (("10.0.0.9", 5000),)
+
+    # Consul's SOA carries 0 unless soa.min_ttl is set; negative_ttl applies then.
+    dns_server.negative_ttl = 0
+    resolver = resolver_for(dns_server, clock=clock, negative_ttl=3.0)
+    resolver.resolve("service-y")
+    clock.now += 2.9
+    resolver.resolve("service-y")
+    assert dns_server.queries[("service-y.service.consul.", "SRV")] == 1
+    clock.now += 0.1
+    resolver.resolve("service-y")
+    assert dns_server.queries[("service-y.service.consul.", "SRV")] == 2
+
+
+def test_cache_is_capped_and_drops_expired_entries_first(dns_server):
+    clock = FakeClock(1000.0)
+    # Negative answers live 10s, service-a's 30s.
+    resolver = resolver_for(dns_server, clock=clock, max_entries=3)
+    for name in ("service-x", "service-y", "service-a"):
+        resolver.resolve(name)
+    clock.now += 11
+    resolver.resolve("service-z")
+    assert list(resolver._cache) == ["service-a", "service-z"]
+    for i in range(100):
+        resolver.resolve(f"service-{i}")
+    assert resolver.stats["entries"] == 3
+    assert list(resolver._cache) == ["service-97", "service-98", "service-99"]
+
+
+def test_zero_ttl_is_raised_to_min_ttl_and_targets_resolved_without_glue(dns_server):
+    # Consul's default service TTL is 0, and the additional section may be missing.
+    dns_server.ttl = 0
+    dns_server.omit_additional = True
+    clock = FakeClock(1000.0)
+    resolver = resolver_for(dns_server, clock=clock, min_ttl=2.0)
+    assert resolver.resolve("service-a") == (("10.0.0.5", 5000), ("10.0.0.6", 5001))
+    assert dns_server.queries[("0a000005.addr.dc1.consul.", "A")] == 1
+    clock.now += 1.9
+    resolver.resolve("service-a")
+    assert dns_server.queries[("service-a.service.consul.", "SRV")] == 1
+    clock.now += 0.1
+    resolver.resolve("service-a")
+    assert dns_server.queries[("service-a.service.consul.", "SRV")] == 2
+
+
+def test_cache_hits_take_microseconds(dns_server):
+    resolver = resolver_for(dns_server)
+    resolver.resolve("service-a")
+    n = 100_000
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        resolver.resolve("service-a")
+    per_hit_us = (time.perf_counter_ns() - t0) / n / 1000
+    assert per_hit_us < 20, per_hit_us
+
+
+def test_unreachable_dns_raises():
+    resolver = SrvResolver("127.0.0.1", 9, timeout=0.1)
+    with pytest.raises((dns.exception.DNSException, OSError)):
+        resolver.resolve("service-a")
+    assert resolver.stats["entries"] == 0
+
+
+def test_gateway_discovers_backends_over_dns(monkeypatch, dns_server):
+    with FakeBackend(name="service-a") as backend:
+        dns_server.services = {"service-a": [("127.0.0.1", backend.port)]}
+        host, port = dns_server.address
+        for k, v in {"BIND_HOST": "127.0.0.1", "DISCOVERY_BACKEND": "dns", "CONSUL_DNS_HOST": host,
+                     "CONSUL_DNS_PORT": str(port), "SERVICES_CACHE_TTL": "0"}.items():
+            monkeypatch.setenv(k, v)
+        sys.modules.pop("gateway.app", None)
+        gw = importlib.import_module("gateway.app")
+        assert gw.WATCHER.health is False
+
+        # The watcher only knows names; instances come from DNS, never from the HTTP API.
+        snap = Snapshot(1, ("service-a", "service-b"), {})
+        monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: snap)
+        get = gw.SESSION.get
+        urls = []
+        monkeypatch.setattr(gw.SESSION, "get", lambda url, timeout: urls.append(url) or get(url, timeout=timeout))
+
+        for _ in range(3):
+            results = {r["service"]: r for r in gw.app.test_client().get("/services").get_json()}
+            assert results["service-a"]["status"] == "online"
+            assert results["service-b"]["status"] == "offline"
+        assert all(url.endswith("/info") for url in urls)
+        assert dns_server.queries[("service-a.service.consul.", "SRV")] == 1
+        assert dns_server.queries[("service-b.service.consul.", "SRV")] == 1
+        assert gw.app.test_client().get("/debug/dns").get_json()["hits"] == 4
+
+
+def test_gateway_runs_without_dnspython_unless_dns_discovery_is_on(monkeypatch):
+    # A None entry makes "import dns" raise ImportError.
+    monkeypatch.setitem(sys.modules, "dns", None)
+    monkeypatch.delitem(sys.modules, "gateway.resolver", raising=False)
+    monkeypatch.delitem(sys.modules, "gateway.app", raising=False)
+    monkeypatch.setenv("DISCOVERY_BACKEND", "http")
+    assert importlib.import_module("gateway.app").RESOLVER is None
@@ -0,0 +1,128 @@
+import asyncio
+import importlib
+import json
+import sys
+import time
+
+import pytest
+
+from common.consul import ConsulClient
+from gateway.stream import QueueSubscriber, ServiceStream
+from testing.fake_backend import FakeBackend
+from testing.fake_consul import FakeConsul
+
+
+@pytest.fixture()
+def east():
+    with FakeConsul() as fake:
+        yield fake
+
+
+@pytest.fixture()
+def west():
+    # Partitioned: every Consul answer takes a second.
+    with FakeConsul(latency=1.0) as fake:
+        yield fake
+
+
+@pytest.fixture()
+def backend():
+    # Answers as service-a; only the datacenter and status matter here.
+    with FakeBackend(name="service-a") as fake:
+        yield fake
+
+
+def load_gateway(monkeypatch, datacenters, **env):
+    env = {"BIND_HOST": "127.0.0.1", "CONSUL_DATACENTERS": datacenters, "DC_DEADLINE": "0.3",
+           "SERVICES_CACHE_TTL": "0", **env}
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    sys.modules.pop("gateway.app", None)
+    return importlib.import_module("gateway.app")
+
+
+def test_slow_datacenter_only_degrades_its_own_slice(monkeypatch, east, west, backend):
+    east.register("service-a", "127.0.0.1", backend.port)
+    west.register("service-a", "127.0.0.1", backend.port)
+    gw = load_gateway(monkeypatch, f"east={east.url},west={west.url}")
+
+    t0 = time.monotonic()
+    data = gw.app.test_client().get("/services").get_json()
+    elapsed = time.monotonic() - t0
+
+    assert [(d["service"], d["datacenter"], d["status"]) for d in data] == [("service-a", "east", "online")]
+    # Bounded by DC_DEADLINE, not by the partitioned DC's one-second answers.
+    assert elapsed < 0.7, elapsed
+
+
+def test_known_services_in_a_slow_datacenter_are_reported_offline(monkeypatch, east, backend):
+    with FakeConsul() as west, FakeBackend(delay=1.0) as slow, FakeBackend(name="service-c") as fast:
+        east.register("service-a", "127.0.0.1", backend.port)
+        west.register("service-b", "127.0.0.1", slow.port)
+        west.register("service-c", "127.0.0.1", fast.port)
+        gw = load_gateway(monkeypatch, f"east={east.url},west={west.url}")
+        client = gw.app.test_client()
+
+        t0 = time.monotonic()
+        data = client.get("/services").get_json()
+        elapsed = time.monotonic() - t0
+        only_west = client.get("/services?dc=west").get_json()
+        unknown = client.get("/services?dc=west,mars")
+
+    assert [(d["service"], d["datacenter"], d["status"]) for d in data] == [
+        ("service-a", "east", "online"), ("service-b", "west", "offline"), ("service-c", "west", "online")]
+    assert elapsed < 0.7, elapsed
+    assert {d["datacenter"] for d in only_west} == {"west"} and len(only_west) == 2
+    assert unknown.status_code == 400 and "mars" in unknown.get_json()["error"]
+
+
+def test_asgi_gateway_merges_datacenters_with_the_same_deadlines(monkeypatch, east, west, backend):
+    east.register("service-a", "127.0.0.1", backend.port)
+    west.register("service-a", "127.0.0.1", backend.port)
+    load_gateway(monkeypatch, f"east={east.url},west={west.url}")
+    sys.modules.pop("gateway.asgi", None)
+    agw = importlib.import_module("gateway.asgi")
+
+    async def main():
+        try:
+            return await agw.list_services()
+        finally:
+            await agw.CLIENT.close()
+
+    t0 = time.monotonic()
+    data = asyncio.run(main())
+    assert time.monotonic() - t0 < 0.7
+    assert [(d["service"], d["datacenter"], d["status"]) for d in data] == [("service-a", "east", "online")]
+
+
+def test_stream_keeps_one_row_per_datacenter(monkeypatch, east, backend):
+    with FakeConsul() as west:
+        east.register("service-a", "127.0.0.1", backend.port)
+        west.register("service-a", "127.0.0.1", backend.port, service_id="west-a")
+        gw = load_gateway(monkeypatch, f"east={east.url},west={west.url}", DC_DEADLINE="2")
+        stream = ServiceStream(gw.collect_services, interval=0.05)
+        sub = QueueSubscriber(maxsize=100)
+        snapshot = json.loads(stream.subscribe(sub, timeout=5).decode().split("data: ", 1)[1])
+        assert [(s["service"], s["datacenter"]) for s in snapshot] == [("service-a", "east"), ("service-a", "west")]
+
+        west.deregister("west-a")
+        removed, deadline = [], time.monotonic() + 5
+        while not removed and time.monotonic() < deadline:
+            try:
+                event = sub.queue.get(timeout=0.1).decode()
+            except Exception:
+                continue
+            removed = json.loads(event.split("data: ", 1)[1])["removed"]
+        stream.unsubscribe(sub)
+    # Only west's row goes; east's service-a of the same name stays.
+    assert removed == [{"service": "service-a", "datacenter": "west"}]
+
+
+def test_bare_datacenter_names_query_the_local_agent(monkeypatch):
+    gw = load_gateway(monkeypatch, "dc1, dc2=http://consul-west:8500", CONSUL_HOST="agent")
+    assert list(gw.DATACENTERS) == ["dc1", "dc2"]
+    assert gw.DATACENTERS["dc1"].url("/v1/health/service/a?passing=true") == \
+        "http://agent:8500/v1/health/service/a?passing=true&dc=dc1"
+    assert gw.DATACENTERS["dc2"].url("/v1/catalog/services") == "http://consul-west:8500/v1/catalog/services"
+    assert gw.WATCHERS["dc1"].consul.dc == "dc1"
+    assert ConsulClient("http://agent:8500").url("/v1/catalog/services") == "http://agent:8500/v1/catalog/services"
@@ -1,22 +1,9 @@
 from types import SimpleNamespace
 import itertools
+import time
 import pytest
 
-
-def make_resp(status_code=200, payload=None, raise_http=False):
-    class R:
-        def __init__(self):
-            self.status_code = status_code
-            self._payload = payload
-
-        def json(self):
-            return self._payload
-
-        def raise_for_status(self):
-            if raise_http or self.status_code >= 400:
-                raise RuntimeError(f"HTTP {self.status_code}")
-
-    return R()
+from testing.helpers import make_resp
 
 
 def test_get_registered_service_names_success(monkeypatch, gw):
@@ -143,6 +130,130 @@ def test_list_services_offline_when_info_request_fails(monkeypatch, gw, client):
     assert data[0]["status"] == "offline"
 
 
+def test_list_services_probes_concurrently_and_keeps_order(monkeypatch, gw, client):
+    names = [f"service-{i:02d}" for i in range(10)]
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={n: [] for n in reversed(names)})
+        if url.startswith(gw.HEALTH_SERVICE):
+            name = url[len(gw.HEALTH_SERVICE):].split("?")[0]
+            time.sleep(0.2)
+            return make_resp(payload=[{"Service": {"Address": name, "Port": 5000}}])
+        if url.endswith(":5000/info"):
+            name = url.split("//")[1].split(":")[0]
+            time.sleep(0.2)
+            return make_resp(payload={"service": name, "timestamp": "t", "host": "h"})
+        raise AssertionError(f"Unexpected GET {url}")
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    t0 = time.monotonic()
+    resp = client.get("/services")
+    elapsed = time.monotonic() - t0
+
+    data = resp.get_json()
+    # Catalog order is preserved, not completion order.
+    assert [d["service"] for d in data] == list(reversed(names))
+    assert all(d["status"] == "online" for d in data)
+    # Ten services at 0.4s each would take 4s serially.
+    assert elapsed < 1.5
+
+
+def test_list_services_marks_offline_past_deadline(monkeypatch, gw, client):
+    monkeypatch.setattr(gw, "SERVICES_DEADLINE", 0.3)
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={"service-a": [], "service-slow": []})
+        if url == f"{gw.HEALTH_SERVICE}service-slow?passing=true":
+            time.sleep(1.0)
+        if url.startswith(gw.HEALTH_SERVICE):
+            name = url[len(gw.HEALTH_SERVICE):].split("?")[0]
+            return make_resp(payload=[{"Service": {"Address": name, "Port": 5000}}])
+        if url == "http://service-a:5000/info":
+            return make_resp(payload={"service": "service-a", "timestamp": "t", "host": "h"})
+        raise AssertionError(f"Unexpected GET {url}")
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    t0 = time.monotonic()
+    data = client.get("/services").get_json()
+    elapsed = time.monotonic() - t0
+
+    assert [d["status"] for d in data] == ["online", "offline"]
+    assert data[1] == {"service": "service-slow", "status": "offline",
+                       "timestamp": "N/A", "host": "N/A", "responseTime": None}
+    assert elapsed < 0.9
+
+
+def test_list_services_cached_with_etag(monkeypatch, gw, client):
+    calls = {"catalog": 0}
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            calls["catalog"] += 1
+            return make_resp(payload={"service-a": []})
+        if url == f"{gw.HEALTH_SERVICE}service-a?passing=true":
+            return make_resp(payload=[])
+        raise AssertionError(f"Unexpected GET {url}")
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 60)
+
+    first = client.get("/services")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = client.get("/services")
+    assert again.data == first.data and again.headers["ETag"] == etag
+
+    unchanged = client.get("/services", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.data == b""
+
+    assert client.get("/services", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert calls["catalog"] == 1
+    assert client.get("/debug/cache").get_json() == {"hits": 3, "misses": 1, "stale": 0}
+
+
+def test_list_services_negotiates_compression_and_msgpack(monkeypatch, gw, client):
+    import gzip
+    import brotli
+    import msgpack
+    from common.encoding import rows
+
+    names = {f"service-{i:02d}": [] for i in range(20)}
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload=names)
+        return make_resp(payload=[])
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 60)
+
+    plain = client.get("/services")
+    assert "Content-Encoding" not in plain.headers and plain.headers["Vary"] == "Accept, Accept-Encoding"
+    assert len(plain.data) > 1024
+
+    gz = client.get("/services", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip" and gzip.decompress(gz.data) == plain.data
+    br = client.get("/services", headers={"Accept-Encoding": "gzip, br"})
+    assert br.headers["Content-Encoding"] == "br" and brotli.decompress(br.data) == plain.data
+    assert len(br.data) < len(plain.data) / 5
+
+    packed = client.get("/services", headers={"Accept": "application/msgpack"})
+    assert packed.headers["Content-Type"] == "application/msgpack"
+    assert rows(msgpack.unpackb(packed.data)) == plain.get_json()
+
+    # Each representation has its own ETag, and conditional requests still work.
+    tags = {r.headers["ETag"] for r in (plain, gz, br, packed)}
+    assert len(tags) == 4
+    assert client.get("/services", headers={"Accept-Encoding": "gzip",
+                                            "If-None-Match": gz.headers["ETag"]}).status_code == 304
+
+
 def test_proxy_healthz_success(monkeypatch, gw, client):
     def fake_get(url, timeout):
         assert url == "http://healthz:6000/report"
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from gateway.watcher import Snapshot
+from testing.fake_backend import FakeBackend
+from testing.fake_consul import FakeConsul
+from testing.helpers import asgi_get, run
+
+OFFLINE = {"status": "offline", "timestamp": "N/A", "host": "N/A", "responseTime": None}
+
+
+@pytest.fixture()
+def consul(monkeypatch, gw):
+    with FakeConsul() as fake:
+        monkeypatch.setattr(gw, "CATALOG_SERVICES", f"{fake.url}/v1/catalog/services")
+        monkeypatch.setattr(gw, "HEALTH_SERVICE", f"{fake.url}/v1/health/service/")
+        yield fake
+
+
+def test_services_matches_flask_contract(gw, agw, consul):
+    with FakeBackend(name="h1") as ok, FakeBackend(failure_rate=1.0) as broken:
+        consul.register("service-a", "127.0.0.1", ok.port)
+        consul.register("service-b", "127.0.0.1", ok.port, status="critical")
+        consul.register("service-c", "127.0.0.1", broken.port)
+        consul.register("healthz", "127.0.0.1", ok.port)
+
+        status, headers, body = run(agw, asgi_get(agw, "/services"))
+
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    data = gw.app.json.loads(body)
+    assert data[0]["service"] == "h1" and data[0]["status"] == "online"
+    assert isinstance(data[0]["responseTime"], int)
+    assert data[1:] == [dict(OFFLINE, service="service-b"), dict(OFFLINE, service="service-c")]
+    # Same bytes as Flask's jsonify for the same payload.
+    assert body == gw.app.json.response(data).get_data()
+
+
+def test_services_past_deadline_reports_offline(monkeypatch, gw, agw, consul):
+    monkeypatch.setattr(gw, "SERVICES_DEADLINE", 0.2)
+    with FakeBackend(delay=1.0) as slow:
+        consul.register("service-a", "127.0.0.1", slow.port)
+        t0 = time.monotonic()
+        _, _, body = run(agw, asgi_get(agw, "/services"))
+        elapsed = time.monotonic() - t0
+
+    assert elapsed < 0.8
+    assert gw.app.json.loads(body) == [dict(OFFLINE, service="service-a")]
+
+
+def test_services_keeps_thousands_of_probes_in_flight(monkeypatch, gw, agw):
+    monkeypatch.setattr(agw, "ASYNC_MAX_CONNECTIONS", 2000)
+    with FakeBackend(delay=0.3) as backend:
+        names = tuple(f"service-{i:04d}" for i in range(2000))
+        snap = Snapshot(1, names, {name: (("127.0.0.1", backend.port),) for name in names})
+        monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: snap)
+
+        t0 = time.monotonic()
+        _, _, body = run(agw, asgi_get(agw, "/services"))
+        elapsed = time.monotonic() - t0
+
+    data = gw.app.json.loads(body)
+    assert len(data) == 2000
+    assert all(d["status"] == "online" for d in data)
+    # 2000 serial probes would take 600s; on one event loop they overlap.
+    assert elapsed < 4.0
+
+
+def test_healthz_proxy(monkeypatch, gw, agw):
+    report = [{"name": "service-a", "status": "healthy"}]
+    with FakeBackend(payload=report) as healthz:
+        monkeypatch.setattr(gw, "HEALTHZ_REPORT", f"{healthz.url}/report")
+        _, _, body = run(agw, asgi_get(agw, "/healthz"))
+    assert gw.app.json.loads(body) == report
+
+
+def test_healthz_proxy_failure_returns_empty(monkeypatch, gw, agw):
+    with FakeBackend(failure_rate=1.0) as healthz:
+        monkeypatch.setattr(gw, "HEALTHZ_REPORT", f"{healthz.url}/report")
+        _, _, body = run(agw, asgi_get(agw, "/healthz"))
+    assert gw.app.json.loads(body) == []
+
+
+def test_unknown_route_is_404(agw):
+    status, _, _ = run(agw, asgi_get(agw, "/nope"))
+    assert status == 404
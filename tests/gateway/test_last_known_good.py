@@ -0,0 +1,107 @@
+import importlib
+import json
+import sys
+import time
+
+import pytest
+
+from common import snapshot
+from testing.fake_backend import FakeBackend
+from testing.fake_consul import FakeConsul
+from testing.helpers import asgi_get, free_port, run, wait_until
+
+
+@pytest.fixture()
+def backend():
+    b = FakeBackend(name="service-a").start()
+    yield b
+    b.stop()
+
+
+def restart(monkeypatch, path, consul_port, **env):
+    """A fresh gateway process, as far as module state goes."""
+    env = dict(BIND_HOST="127.0.0.1", CONSUL_HOST="127.0.0.1", CONSUL_PORT=consul_port, SNAPSHOT_PATH=path,
+               SNAPSHOT_INTERVAL="0", SERVICES_CACHE_TTL="0", **env)
+    for k, v in env.items():
+        monkeypatch.setenv(k, str(v))
+    sys.modules.pop("gateway.app", None)
+    return importlib.import_module("gateway.app")
+
+
+def test_50k_service_snapshot_loads_instantly(monkeypatch, tmp_path):
+    path = tmp_path / "gateway.snap"
+    entries = {f"service-{i:05d}": [[f"10.0.{i // 256 % 256}.{i % 256}", 5000]] for i in range(50_000)}
+    snapshot.write(path, entries, meta={"kind": "gateway", "version": 42})
+
+    t0 = time.perf_counter()
+    gw = restart(monkeypatch, path, free_port())
+    loaded = gw.load_last_good()
+    assert time.perf_counter() - t0 < 1.0
+    assert loaded.version == 42 and len(loaded.names) == 50_000
+    assert loaded.instances["service-12345"] == (("10.0.48.57", 5000),)
+
+    # The first listing only decodes the entries it probes; no Consul involved.
+    monkeypatch.setattr(gw, "probe_service", lambda name, deadline, snap, consul: {
+        "service": name, "status": "online", "instances": snap.instances[name]})
+    t0 = time.perf_counter()
+    body = gw.app.test_client().get("/services").get_json()
+    assert time.perf_counter() - t0 < 10.0
+    assert len(body) == 50_000
+    assert body[0] == {"service": "service-00000", "status": "online", "instances": [["10.0.0.0", 5000]],
+                       "stale": True}
+
+
+def test_consul_outage_serves_last_known_good(monkeypatch, tmp_path, backend):
+    path = tmp_path / "gateway.snap"
+    consul = FakeConsul().start()
+    consul.register("service-a", "127.0.0.1", backend.port)
+    consul.register("service-b", "127.0.0.1", backend.port, status="critical")
+    consul_port = consul.url.rsplit(":", 1)[1]
+
+    gw = restart(monkeypatch, path, consul_port)
+    assert gw.LAST_GOOD is None
+    gw.WATCHER.start()
+    try:
+        assert wait_until(lambda: gw.WATCHER.snapshot() is not None and gw.SNAPSHOT_STORE.writes)
+        gw.SNAPSHOT_STORE.flush()
+        fresh = gw.app.test_client().get("/services").get_json()
+        assert [(s["service"], s["status"]) for s in fresh] == [("service-a", "online"), ("service-b", "offline")]
+        assert not any("stale" in s for s in fresh)
+    finally:
+        gw.WATCHER.stop()
+        consul.stop()
+
+    # Restarted while Consul is down: the saved catalog is served right away, marked stale.
+    expected = [("service-a", "online", True), ("service-b", "offline", True)]
+    for watch in ("1", "0"):
+        gw = restart(monkeypatch, path, consul_port, CATALOG_WATCH=watch)
+        stale = gw.app.test_client().get("/services").get_json()
+        assert [(s["service"], s["status"], s["stale"]) for s in stale] == expected
+        sys.modules.pop("gateway.asgi", None)
+        agw = importlib.import_module("gateway.asgi")
+        status, _, body = run(agw, asgi_get(agw, "/services"))
+        assert status == 200
+        assert [(s["service"], s["status"], s["stale"]) for s in json.loads(body)] == expected
+
+    # Consul goes quiet after a sync: the watcher's view is kept but marked stale.
+    monkeypatch.setattr(gw, "CATALOG_WATCH", True)
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: gw.Snapshot(1, ("service-a",), {
+        "service-a": (("127.0.0.1", backend.port),)}))
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic())
+    assert "stale" not in gw.app.test_client().get("/services").get_json()[0]
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic() - gw.READY_MAX_SYNC_AGE - 1)
+    assert gw.app.test_client().get("/services").get_json()[0]["stale"] is True
+
+
+def test_watcher_view_is_marked_stale_without_a_snapshot_file(monkeypatch, gw, client, backend):
+    assert gw.LAST_GOOD is None
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: gw.Snapshot(1, ("service-a",), {
+        "service-a": (("127.0.0.1", backend.port),)}))
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic() - gw.READY_MAX_SYNC_AGE - 1)
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    gw.WATCHER.index.sync({"service-a": []})
+    assert client.get("/services").get_json()[0]["stale"] is True
+    assert client.get("/services?prefix=service-").get_json()[0]["stale"] is True
+    # Still ready: this pod can answer, from its last view of the catalog.
+    ready = client.get("/readyz")
+    assert ready.status_code == 200 and ready.get_json()["stale"] is True
@@ -0,0 +1,131 @@
+import json
+import time
+import tracemalloc
+
+import pytest
+
+from gateway.latency import LatencyHistory
+from gateway.watcher import Snapshot
+from testing.fake_backend import FakeBackend
+from testing.helpers import FakeClock, asgi_get, make_resp, run
+
+
+def test_ring_keeps_the_last_samples_inside_the_window():
+    clock = FakeClock(1000.0)
+    history = LatencyHistory(capacity=4, clock=clock)
+    for ms in range(1, 11):
+        history.record("a", ms)
+        clock.now += 1
+    # Only 7..10 are left.
+    assert history.summary(["a"], 60) == {"samples": 4, "ok": 4, "failed": 0, "p50": 8.0, "p90": 10.0, "p99": 10.0}
+    assert history.summary(["a"], 2.5)["samples"] == 2
+    assert history.summary(["b"], 60) == {"samples": 0, "ok": 0, "failed": 0, "p50": None, "p90": None, "p99": None}
+
+
+def test_percentiles_span_instances_and_skip_failures():
+    history = LatencyHistory(capacity=100)
+    for ms in range(1, 51):
+        history.record("a", ms)
+        history.record("b", 50 + ms)
+    history.record("b", 5000.0, ok=False)
+    summary = history.summary(["a", "b"], 60)
+    assert summary == {"samples": 101, "ok": 100, "failed": 1, "p50": 50.0, "p90": 90.0, "p99": 99.0}
+    assert history.summary(["a"], 60)["p99"] == 50.0
+
+
+def test_memory_stays_bounded_with_10k_instances():
+    history = LatencyHistory(capacity=128, max_instances=10_000)
+    tracemalloc.start()
+    try:
+        for i in range(10_000):
+            history.record(f"10.0.{i // 256}.{i % 256}:5000", 1.0)
+        full, _ = tracemalloc.get_traced_memory()
+        # Another 10k instances reuse the buffers of the ones they evict.
+        for i in range(10_000):
+            history.record(f"10.1.{i // 256}.{i % 256}:5000", 1.0)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert history.stats["instances"] == 10_000
+    assert history.stats["bytes"] == 10_000 * 128 * 12
+    assert full < 1.5 * history.stats["bytes"]
+    assert after - full < 1024 * 1024
+    assert history.summary(["10.0.0.1:5000"], 60)["samples"] == 0
+
+
+def test_insert_takes_microseconds():
+    history = LatencyHistory(capacity=128, max_instances=10_000)
+    keys = [f"10.0.{i // 256}.{i % 256}:5000" for i in range(10_000)]
+    for key in keys:
+        history.record(key, 1.0)
+    n = 50_000
+    t0 = time.perf_counter_ns()
+    for i in range(n):
+        history.record(keys[i % 10_000], 2.5)
+    assert (time.perf_counter_ns() - t0) / n / 1000 < 10
+
+
+@pytest.fixture()
+def backends(monkeypatch, gw):
+    instances = (("10.0.0.1", 5000), ("10.0.0.2", 5000))
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: Snapshot(1, ("service-a",), {"service-a": instances}))
+
+    def fake_get(url, timeout):
+        if url == "http://10.0.0.2:5000/info":
+            raise ConnectionError("refused")
+        return make_resp(payload={"service": "service-a", "timestamp": "t", "host": "h"})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+    return instances
+
+
+def test_latency_endpoint_reports_per_window_and_instance(monkeypatch, gw, client, backends):
+    for instance in backends * 3:
+        try:
+            gw.probe_instance(instance, time.monotonic() + 1)
+        except ConnectionError:
+            pass
+    body = client.get("/services/service-a/latency").get_json()
+    assert body["service"] == "service-a"
+    assert [w["window"] for w in body["windows"]] == gw.LATENCY_WINDOWS
+    overall = body["windows"][0]
+    assert (overall["samples"], overall["ok"], overall["failed"]) == (6, 3, 3)
+    assert overall["p99"] is not None
+    assert [(i["address"], i["windows"][0]["failed"]) for i in body["instances"]] == [
+        ("10.0.0.1:5000", 0), ("10.0.0.2:5000", 3)]
+    assert client.get("/services/service-a/latency?window=5").get_json()["windows"][0]["window"] == 5
+    assert client.get("/services/service-a/latency?window=0").status_code == 400
+    assert client.get("/services/service-x/latency").get_json()["instances"] == []
+    # Names outside SERVICE_PREFIX that the watcher doesn't track are never looked up.
+    monkeypatch.setattr(gw, "lookup_instances", lambda *a: pytest.fail("looked up"))
+    assert client.get("/services/anything-else/latency").status_code == 404
+
+
+def test_services_carries_p99_when_enabled(monkeypatch, gw, client, backends):
+    assert "p99" not in client.get("/services").get_json()[0]
+    monkeypatch.setattr(gw, "LATENCY_P99", True)
+    monkeypatch.setattr(gw.SERVICES_CACHE, "ttl", 0)
+    # Round robin: this probe hits the failing instance, but the first one's sample is still in the window.
+    entry = client.get("/services").get_json()[0]
+    assert entry["status"] == "offline" and entry["p99"] >= 0
+
+
+def test_asgi_gateway_records_probes_and_serves_the_history(monkeypatch, gw, agw):
+    with FakeBackend(name="h1") as up:
+        instances = (("127.0.0.1", up.port),)
+        monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: Snapshot(1, ("service-a",), {"service-a": instances}))
+        monkeypatch.setattr(gw, "LATENCY_P99", True)
+
+        async def calls():
+            services = await asgi_get(agw, "/services")
+            return services, [await asgi_get(agw, path) for path in (
+                "/services/service-a/latency?window=5", "/services/service-a/latency?window=0", "/debug/latency")]
+
+        services, (latency, bad, stats) = run(agw, calls())
+    assert json.loads(services[2])[0]["p99"] >= 0
+    assert latency[0] == 200
+    body = json.loads(latency[2])
+    assert [(w["window"], w["ok"]) for w in body["windows"]] == [(5, 1)]
+    assert body["instances"][0]["address"] == f"127.0.0.1:{up.port}"
+    assert bad[0] == 400
+    assert json.loads(stats[2])["instances"] == 1
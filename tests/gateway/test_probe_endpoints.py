@@ -0,0 +1,81 @@
+import asyncio
+import socket
+import time
+
+import pytest
+import requests
+
+from testing.helpers import asgi_get
+
+
+@pytest.fixture()
+def no_network(monkeypatch, gw):
+    """Records (and refuses) every outbound connection attempt, at the socket and the requests layer."""
+    attempts = []
+
+    def refuse(*args, **kwargs):
+        attempts.append(args)
+        raise AssertionError("outbound I/O during a probe")
+
+    monkeypatch.setattr(socket.socket, "connect", refuse)
+    monkeypatch.setattr(socket.socket, "connect_ex", refuse)
+    monkeypatch.setattr(socket, "create_connection", refuse)
+    monkeypatch.setattr(requests.Session, "send", refuse)
+    monkeypatch.setattr(gw.SESSION, "get", refuse)
+    return attempts
+
+
+def test_livez_and_readyz_make_no_outbound_calls(monkeypatch, gw, client, no_network):
+    # Consul is nowhere to be found and nothing has synced: alive, but not ready.
+    live = client.get("/livez")
+    assert live.status_code == 200 and live.data == b"ok\n"
+    not_ready = client.get("/readyz")
+    assert not_ready.status_code == 503
+    assert not_ready.get_json() == {"status": "not ready", "syncAge": None}
+
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic() - 3)
+    ready = client.get("/readyz")
+    assert ready.status_code == 200
+    body = ready.get_json()
+    assert body["status"] == "ready" and 3 <= body["syncAge"] < 4
+
+    # The last sync is too old: Consul has been unreachable for a while, and there is no catalog to fall back on.
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic() - gw.READY_MAX_SYNC_AGE - 1)
+    assert client.get("/readyz").status_code == 503
+    # With one, the pod stays in rotation and says it is serving stale data.
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: gw.Snapshot(1, (), {}))
+    stale = client.get("/readyz")
+    assert stale.status_code == 200 and stale.get_json()["stale"] is True
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: None)
+    # A direct Consul read counts as a sync too.
+    monkeypatch.setattr(gw.CONSUL, "last_success", time.monotonic())
+    assert client.get("/readyz").status_code == 200
+
+    for _ in range(100):
+        client.get("/livez")
+        client.get("/readyz")
+    assert no_network == []
+
+
+def test_probe_handlers_take_microseconds(monkeypatch, gw, no_network):
+    monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic())
+    n = 20_000
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        gw.readiness()
+    assert (time.perf_counter_ns() - t0) / n / 1000 < 20
+    assert no_network == []
+
+
+def test_asgi_probes(monkeypatch, gw, agw, no_network):
+    async def probes():
+        live = await asgi_get(agw, "/livez")
+        not_ready = await asgi_get(agw, "/readyz")
+        monkeypatch.setattr(gw.WATCHER, "last_sync", time.monotonic())
+        ready = await asgi_get(agw, "/readyz")
+        return live, not_ready, ready
+
+    live, not_ready, ready = asyncio.run(probes())
+    assert live[0] == 200 and live[2] == b"ok\n"
+    assert not_ready[0] == 503 and ready[0] == 200
+    assert no_network == []
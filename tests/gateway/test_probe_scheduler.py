@@ -0,0 +1,117 @@
+import importlib
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+from gateway.scheduler import ProbeScheduler
+from gateway.watcher import Snapshot
+from testing.helpers import FakeClock, make_resp
+
+
+def simulate(scheduler, clock, seconds, step=0.01, each_step=None):
+    for _ in range(int(seconds / step)):
+        clock.now += step
+        scheduler.tick()
+        if each_step:
+            each_step()
+
+
+def test_stable_instances_back_off_and_failing_ones_stay_frequent():
+    clock = FakeClock()
+    calls = Counter()
+
+    def probe(instance):
+        calls[instance] += 1
+        if instance == "flaky":
+            raise ConnectionError("down")
+        return {"host": instance}
+
+    scheduler = ProbeScheduler(probe, lambda: {"stable": "stable", "flaky": "flaky"}, min_interval=1.0,
+                               max_interval=20.0, backoff=2.0, jitter=0.2, clock=clock, rng=random.Random(1))
+    simulate(scheduler, clock, 120)
+
+    # 1, 2, 4, 8, 16, then every 20s; the failing one stays at about once a second.
+    assert 8 <= calls["stable"] <= 12
+    assert 100 <= calls["flaky"] <= 140
+    assert scheduler.latest("flaky")[0] is None
+    data, age = scheduler.latest("stable")
+    assert data == {"host": "stable"} and 0 <= age <= 24
+
+
+def test_probes_are_jittered_and_capped_globally():
+    clock = FakeClock()
+    started = []
+    targets = {f"i{n}": f"i{n}" for n in range(1000)}
+    scheduler = ProbeScheduler(lambda instance: started.append((clock.now, instance)) or {}, lambda: targets,
+                               min_interval=1.0, max_interval=1.0, jitter=0.2, max_rate=50.0,
+                               clock=clock, rng=random.Random(2))
+    simulate(scheduler, clock, 20)
+
+    # 1,000 instances due every second would be 20,000 probes; the cap allows 50/s plus one burst.
+    assert 20 * 50 <= len(started) <= 21 * 50
+    per_second = Counter(int(at) for at, _ in started)
+    assert max(per_second.values()) <= 2 * 50
+
+    # Uncapped, intervals land within +/-20% of the target instead of in lockstep.
+    clock, times = FakeClock(), {}
+    scheduler = ProbeScheduler(lambda instance: times.setdefault(instance, []).append(clock.now) or {},
+                               lambda: {n: n for n in range(200)}, min_interval=1.0, max_interval=1.0,
+                               jitter=0.2, max_rate=1000.0, clock=clock, rng=random.Random(3))
+    simulate(scheduler, clock, 10, step=0.001)
+    gaps = [b - a for seen in times.values() for a, b in zip(seen, seen[1:])]
+    assert min(gaps) >= 0.8 - 0.002 and max(gaps) <= 1.2 + 0.002
+    assert len({round(seen[0], 2) for seen in times.values()}) > 50
+
+
+def test_outbound_rate_is_constant_while_inbound_qps_grows(monkeypatch, gw):
+    monkeypatch.setattr(gw, "PROBE_MODE", "scheduled")
+    names = tuple(f"service-{i:02d}" for i in range(20))
+    snap = Snapshot(1, names, {name: ((name, 5000),) for name in names})
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: snap)
+
+    outbound = []
+
+    def fake_get(url, timeout):
+        assert url.endswith("/info"), url
+        outbound.append(url)
+        return make_resp(payload={"service": url.split("//")[1].split(":")[0], "host": "h", "timestamp": "t"})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+
+    rates = {}
+    for qps in (1, 10, 100, 1000):
+        clock = FakeClock()
+        scheduler = ProbeScheduler(gw.scheduled_probe, gw.scheduled_targets, min_interval=2.0, max_interval=30.0,
+                                   max_rate=50.0, clock=clock, rng=random.Random(7))
+        monkeypatch.setattr(gw, "SCHEDULER", scheduler)
+        outbound.clear()
+        inbound = {"due": 0.0, "served": 0}
+        step = 0.01
+
+        def serve_requests():
+            inbound["due"] += qps * step
+            while inbound["due"] >= 1:
+                inbound["due"] -= 1
+                results = gw.collect_services()
+                inbound["served"] += 1
+                if clock.now > 3:
+                    # Every service has been probed by now; requests only read results.
+                    assert all(r["status"] == "online" and r["probeAge"] >= 0 for r in results)
+
+        simulate(scheduler, clock, 20, step=step, each_step=serve_requests)
+        assert inbound["served"] == pytest.approx(qps * 20, abs=1)
+        rates[qps] = len(outbound) / 20
+
+    # Same instances, same schedule: inbound load does not change the probe rate at all.
+    assert len(set(rates.values())) == 1, rates
+    assert 0 < rates[1] <= 50
+
+
+def test_rate_cap_is_split_between_worker_processes(monkeypatch, gw):
+    assert gw.SCHEDULER.max_rate == 50
+    monkeypatch.setattr(importlib.import_module("common.serving"), "WEB_WORKERS", 4)
+    monkeypatch.setenv("PROBE_MAX_RATE", "100")
+    monkeypatch.delitem(sys.modules, "gateway.app")
+    assert importlib.import_module("gateway.app").SCHEDULER.max_rate == 25
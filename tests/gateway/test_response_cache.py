@@ -0,0 +1,86 @@
+import threading
+import time
+
+from gateway.cache import ResponseCache
+
+
+class Counter:
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"body-{self.calls}".encode()
+
+
+def test_hit_within_ttl_then_stale_served_while_refreshing():
+    compute = Counter(delay=0.1)
+    cache = ResponseCache(compute, ttl=0.2, max_stale=10)
+
+    first = cache.get()
+    assert first.body == b"body-1"
+    assert cache.get() is first
+    assert cache.stats == {"hits": 1, "misses": 1, "stale": 0}
+
+    time.sleep(0.25)
+    t0 = time.monotonic()
+    stale = cache.get()
+    assert time.monotonic() - t0 < 0.05
+    assert stale is first
+    assert cache.stats["stale"] == 1
+
+    time.sleep(0.2)
+    fresh = cache.get()
+    assert fresh.body == b"body-2" and fresh.etag != first.etag
+    assert compute.calls == 2
+
+
+def test_concurrent_stale_requests_start_a_single_refresh():
+    compute = Counter(delay=0.2)
+    cache = ResponseCache(compute, ttl=0.05, max_stale=10)
+    cache.get()
+    time.sleep(0.1)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(r.body == b"body-1" for r in results)
+    time.sleep(0.3)
+    assert compute.calls == 2
+
+
+def test_concurrent_misses_share_one_computation():
+    compute = Counter(delay=0.2)
+    cache = ResponseCache(compute, ttl=5, max_stale=10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert compute.calls == 1
+    assert {r.body for r in results} == {b"body-1"}
+    assert cache.stats["misses"] == 20
+
+
+def test_entry_past_max_stale_is_refreshed_inline():
+    compute = Counter()
+    cache = ResponseCache(compute, ttl=0.05, max_stale=0.05)
+    cache.get()
+    time.sleep(0.15)
+    assert cache.get().body == b"body-2"
+    assert cache.stats == {"hits": 0, "misses": 2, "stale": 0}
+
+
+def test_zero_ttl_disables_caching():
+    compute = Counter()
+    cache = ResponseCache(compute, ttl=0, max_stale=10)
+    assert [cache.get().body for _ in range(3)] == [b"body-1", b"body-2", b"body-3"]
@@ -0,0 +1,123 @@
+import os
+import tracemalloc
+import zlib
+
+import pytest
+
+from gateway.proxy import ReverseProxy
+from gateway.watcher import Snapshot
+from testing.fake_upstream import PATTERN, FakeUpstream
+
+
+@pytest.fixture()
+def upstreams():
+    with FakeUpstream(name="a1", slow_delay=1.0) as a1, FakeUpstream(name="a2", slow_delay=1.0) as a2:
+        yield a1, a2
+
+
+@pytest.fixture()
+def routed(monkeypatch, gw, upstreams):
+    snap = Snapshot(1, ("service-a",), {"service-a": tuple(u.instance for u in upstreams)})
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: snap)
+    return gw
+
+
+def test_forwards_path_query_and_headers(routed, client):
+    resp = client.get("/svc/service-a/echo/deep?x=1&y=2",
+                      headers={"X-Request-Id": "r1", "Connection": "keep-alive, X-Secret", "X-Secret": "s",
+                               "X-Forwarded-For": "10.1.1.1"})
+    assert resp.status_code == 200 and resp.headers["X-Upstream"] in ("a1", "a2")
+    seen = resp.get_json()
+    assert seen["method"] == "GET" and seen["target"] == "/echo/deep?x=1&y=2"
+    headers = seen["headers"]
+    assert headers["x-request-id"] == "r1" and headers["x-forwarded-for"] == "10.1.1.1, 127.0.0.1"
+    assert headers["x-forwarded-host"] == "localhost" and headers["x-forwarded-proto"] == "http"
+    # Hop-by-hop headers, and those named by Connection, stay on the client's hop.
+    assert "x-secret" not in headers and headers.get("connection") != "keep-alive, X-Secret"
+    assert client.get("/svc/service-a/").get_json()["target"] == "/"
+
+
+def test_balances_over_instances_and_reuses_connections(routed, client, upstreams):
+    served = [client.get("/svc/service-a/echo").headers["X-Upstream"] for _ in range(20)]
+    assert served.count("a1") == served.count("a2") == 10
+    assert all(u.connections == 1 for u in upstreams)
+
+
+def test_streams_request_bodies(routed, client):
+    body = os.urandom(3 * 1024 * 1024)
+    seen = client.post("/svc/service-a/echo", data=body).get_json()
+    assert seen["method"] == "POST" and seen["bodyLength"] == len(body) and seen["bodyCrc"] == zlib.crc32(body)
+
+    # No Content-Length: forwarded chunked, piece by piece.
+    pieces = [os.urandom(100_000) for _ in range(5)]
+    chunked = ReverseProxy(chunk_size=64 * 1024)
+
+    class Source:
+        def __init__(self):
+            self.pieces = list(pieces)
+
+        def read(self, size):
+            return self.pieces.pop(0) if self.pieces else b""
+
+    upstream = chunked.open("PUT", routed.WATCHER.snapshot().instances["service-a"][0], "/echo", {}, Source())
+    seen = b"".join(chunked.stream(upstream))
+    assert b'"bodyLength": 500000' in seen and f'"bodyCrc": {zlib.crc32(b"".join(pieces))}'.encode() in seen
+
+
+def test_failures(monkeypatch, routed, client, upstreams):
+    snap = routed.WATCHER.snapshot()
+    monkeypatch.setattr(routed.WATCHER, "snapshot",
+                        lambda: Snapshot(2, snap.names + ("service-x",), dict(snap.instances, **{"service-x": ()})))
+    assert client.get("/svc/service-x/echo").status_code == 503
+
+    # A dead instance: GETs move on to the next one.
+    upstreams[0].stop()
+    assert all(client.get("/svc/service-a/echo").headers["X-Upstream"] == "a2" for _ in range(4))
+
+    upstreams[1].stop()
+    resp = client.get("/svc/service-a/echo")
+    assert resp.status_code == 502 and resp.get_json() == {"error": "service-a is unreachable"}
+
+
+def test_routes_only_service_names_and_caches_misses(monkeypatch, gw, client):
+    lookups = []
+    monkeypatch.setattr(gw, "lookup_instances", lambda name, deadline: lookups.append(name) or ())
+    # Not a service the gateway lists: never looked up.
+    assert client.get("/svc/consul/v1/kv/").status_code == 404
+    assert lookups == []
+
+    for _ in range(3):
+        assert client.get("/svc/service-gone/echo").get_json() == {"error": "no passing instance of service-gone"}
+    assert lookups == ["service-gone"]
+    monkeypatch.setitem(gw.PROXY_MISSES, "service-gone", 0)
+    assert client.get("/svc/service-gone/echo").status_code == 503
+    assert lookups == ["service-gone"] * 2
+
+
+def test_slow_upstream_times_out(monkeypatch, routed, client):
+    monkeypatch.setattr(routed, "PROXY", ReverseProxy(read_timeout=0.2))
+    monkeypatch.setattr(routed, "IDEMPOTENT", frozenset())
+    resp = client.post("/svc/service-a/slow")
+    assert resp.status_code == 504
+
+
+def test_streams_1gb_response_in_constant_memory(routed, client):
+    size = 1 << 30
+    tracemalloc.start()
+    try:
+        resp = client.get("/svc/service-a/bytes/%d" % size, buffered=False)
+        assert resp.status_code == 200 and int(resp.headers["Content-Length"]) == size
+        received = 0
+        first = None
+        for chunk in resp.response:
+            if first is None:
+                first = chunk
+            received += len(chunk)
+        resp.close()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert received == size
+    assert first == PATTERN[:len(first)]
+    # A few 64 KiB chunks in flight, nowhere near the 1 GiB that went through.
+    assert peak < 8 * 1024 * 1024, peak
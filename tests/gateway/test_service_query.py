@@ -0,0 +1,185 @@
+import json
+
+import pytest
+
+from gateway.index import FilterUnavailable, ServiceIndex
+from gateway.watcher import CatalogWatcher, Snapshot
+from testing.fake_consul import FakeConsul
+from testing.helpers import asgi_get, make_resp, run, wait_until
+
+CATALOG = {
+    "service-api": ["web", "team-a"],
+    "service-auth": ["team-a"],
+    "service-billing": ["team-b", "web"],
+    "service-cache": [],
+    "service-queue": ["team-b"],
+}
+
+
+@pytest.fixture()
+def index():
+    idx = ServiceIndex.from_catalog(CATALOG, meta=True)
+    idx.set_meta("service-api", {("env", "prod"), ("owner", "alice")})
+    idx.set_meta("service-billing", {("env", "prod")})
+    idx.set_meta("service-queue", {("env", "dev")})
+    return idx
+
+
+def test_prefix_and_cursor_ranges(index):
+    assert index.select() == sorted(CATALOG)
+    assert index.select("service-a") == ["service-api", "service-auth"]
+    assert index.select("service-b") == ["service-billing"]
+    assert index.select("service-z") == []
+    assert index.select(limit=2) == ["service-api", "service-auth"]
+    assert index.select(after="service-auth", limit=2) == ["service-billing", "service-cache"]
+    assert index.select("service-a", after="service-api") == ["service-auth"]
+    assert index.select(after="service-queue") == []
+
+
+def test_tag_and_meta_filters_intersect(index):
+    assert index.select(tags=["web"]) == ["service-api", "service-billing"]
+    assert index.select(tags=["web", "team-b"]) == ["service-billing"]
+    assert index.select(tags=["nope"]) == []
+    assert index.select(meta=[("env", "prod")]) == ["service-api", "service-billing"]
+    assert index.select(tags=["team-a"], meta=[("env", "prod")]) == ["service-api"]
+    assert index.select("service-b", tags=["web"]) == ["service-billing"]
+    assert index.select(tags=["web"], after="service-api") == ["service-billing"]
+    assert index.select(meta=[("env", "prod")], limit=1) == ["service-api"]
+
+
+def test_large_sets_are_walked_in_order_up_to_the_limit():
+    catalog = {f"service-{i:05d}": ["common"] + (["odd"] if i % 2 else []) for i in range(20_000)}
+    idx = ServiceIndex.from_catalog(catalog)
+    assert idx.select(tags=["odd"], limit=3) == ["service-00001", "service-00003", "service-00005"]
+    assert idx.select(tags=["common", "odd"], after="service-10000", limit=2) == ["service-10001", "service-10003"]
+    assert len(idx.select(tags=["odd"])) == 10_000
+
+
+def test_sync_follows_catalog_changes(index):
+    index.sync({"service-api": ["team-b"], "service-new": ["web"]})
+    assert len(index) == 2
+    assert index.select() == ["service-api", "service-new"]
+    assert index.select(tags=["web"]) == ["service-new"]
+    assert index.select(tags=["team-b"]) == ["service-api"]
+    # Removed services take their meta with them.
+    assert index.select(meta=[("env", "prod")]) == ["service-api"]
+    index.set_meta("service-api", ())
+    assert index.select(meta=[("env", "prod")]) == []
+
+
+def test_filters_without_data_are_refused():
+    with pytest.raises(FilterUnavailable):
+        ServiceIndex(["service-a"], tags=False).select(tags=["web"])
+    with pytest.raises(FilterUnavailable):
+        ServiceIndex.from_catalog(CATALOG).select(meta=[("env", "prod")])
+
+
+def test_watcher_keeps_the_index_current():
+    with FakeConsul() as consul:
+        consul.register("service-a", "10.0.0.1", 5000, tags=["web"], meta={"env": "prod"})
+        consul.register("service-b", "10.0.0.2", 5000, tags=["batch"])
+        watcher = CatalogWatcher(consul.url, wait="5s").start()
+        try:
+            assert wait_until(lambda: watcher.index.select(meta=[("env", "prod")]) == ["service-a"])
+            assert watcher.index.select(tags=["batch"]) == ["service-b"]
+            consul.register("service-c", "10.0.0.3", 5000, tags=["web"], meta={"env": "prod"})
+            assert wait_until(lambda: watcher.index.select(tags=["web"], meta=[("env", "prod")])
+                              == ["service-a", "service-c"])
+            consul.deregister("service-a")
+            assert wait_until(lambda: watcher.index.select(tags=["web"]) == ["service-c"])
+        finally:
+            watcher.stop()
+
+
+@pytest.fixture()
+def probed(monkeypatch, gw, index):
+    names = sorted(CATALOG)
+    monkeypatch.setattr(gw.WATCHER, "index", index)
+    monkeypatch.setattr(gw.WATCHER, "snapshot", lambda: Snapshot(1, tuple(names), {n: () for n in names}))
+    calls = []
+
+    def probe_service(name, deadline, snap=None, consul=None):
+        calls.append(name)
+        up = name != "service-auth"
+        return {"service": name, "status": "online" if up else "offline", "host": "h", "responseTime": 1.0}
+
+    monkeypatch.setattr(gw, "probe_service", probe_service)
+    return calls
+
+
+def test_filtered_listing_probes_only_the_selected_services(client, probed):
+    data = client.get("/services?tag=web&meta=env:prod").get_json()
+    assert [d["service"] for d in data] == ["service-api", "service-billing"]
+    assert sorted(probed) == ["service-api", "service-billing"]
+
+    probed.clear()
+    data = client.get("/services?prefix=service-a&fields=service,status").get_json()
+    assert data == [{"service": "service-api", "status": "online"}, {"service": "service-auth", "status": "offline"}]
+    assert sorted(probed) == ["service-api", "service-auth"]
+
+    assert client.get("/services?prefix=service-a&status=offline").get_json()[0]["service"] == "service-auth"
+
+
+def test_cursor_pagination_walks_every_service_once(client, probed):
+    seen, after = [], None
+    while True:
+        resp = client.get("/services?limit=2" + (f"&after={after}" if after else ""))
+        page = [d["service"] for d in resp.get_json()]
+        assert len(page) <= 2
+        seen += page
+        after = resp.headers.get("X-Next-After")
+        if after is None:
+            break
+        assert after == page[-1]
+    assert seen == sorted(CATALOG)
+    # Each page probes only its own services.
+    assert sorted(probed) == sorted(CATALOG)
+
+    probed.clear()
+    resp = client.get("/services?status=online&limit=2")
+    assert [d["service"] for d in resp.get_json()] == ["service-api", "service-billing"]
+    assert resp.headers["X-Next-After"] == "service-billing"
+
+
+def test_bad_queries(monkeypatch, gw, client, probed):
+    assert client.get("/services?limit=0").status_code == 400
+    assert client.get("/services?limit=x").status_code == 400
+    assert client.get("/services?meta=env").status_code == 400
+    monkeypatch.setattr(gw.WATCHER, "index", ServiceIndex(sorted(CATALOG), meta=False))
+    resp = client.get("/services?meta=env:prod")
+    assert resp.status_code == 503 and "meta" in resp.get_json()["error"]
+    assert probed == []
+
+
+def test_unsynced_gateway_indexes_the_catalog_directly(monkeypatch, gw, client):
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload=dict(CATALOG, consul=[]))
+        if url.startswith(gw.HEALTH_SERVICE):
+            return make_resp(payload=[])
+        raise AssertionError(f"Unexpected GET {url}")
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+    data = client.get("/services?tag=team-b").get_json()
+    assert [(d["service"], d["status"]) for d in data] == [("service-billing", "offline"), ("service-queue", "offline")]
+    assert client.get("/services?meta=env:prod").status_code == 503
+
+
+def test_asgi_gateway_applies_the_same_filters(monkeypatch, gw, agw, probed):
+    async def probe_service(name, deadline, snap=None, consul=None):
+        return gw.probe_service(name, deadline, snap, consul)
+
+    monkeypatch.setattr(agw, "probe_service", probe_service)
+
+    async def calls():
+        return [await asgi_get(agw, path) for path in (
+            "/services?tag=web&meta=env:prod", "/services?prefix=service-a&fields=service,status",
+            "/services?limit=2", "/services?fields=service", "/services?limit=0", "/services?dc=east")]
+
+    tagged, prefixed, page, projected, bad, unknown_dc = run(agw, calls())
+    assert [d["service"] for d in json.loads(tagged[2])] == ["service-api", "service-billing"]
+    assert json.loads(prefixed[2]) == [{"service": "service-api", "status": "online"},
+                                       {"service": "service-auth", "status": "offline"}]
+    assert len(json.loads(page[2])) == 2 and page[1][b"x-next-after"] == b"service-auth"
+    assert json.loads(projected[2]) == [{"service": name} for name in sorted(CATALOG)]
+    assert (bad[0], unknown_dc[0]) == (400, 400)
@@ -0,0 +1,221 @@
+import asyncio
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+import pytest
+
+from gateway.stream import QueueSubscriber, ServiceStream, diff_services
+from testing.fake_consul import FakeConsul
+from testing.helpers import free_port, make_resp
+
+
+def parse_event(chunk):
+    event, data = chunk.decode().strip().split("\n")
+    return event.split(": ", 1)[1], json.loads(data.split(": ", 1)[1])
+
+
+def fake_consul_and_backends(monkeypatch, gw, names):
+    """Serve ``names`` from fake Consul/backends; service-b's host flips on every probe."""
+    probes = Counter()
+    lock = threading.Lock()
+
+    def fake_get(url, timeout):
+        if url == gw.CATALOG_SERVICES:
+            return make_resp(payload={name: [] for name in names})
+        if url.startswith(gw.HEALTH_SERVICE):
+            name = url[len(gw.HEALTH_SERVICE):].split("?")[0]
+            return make_resp(payload=[{"Service": {"Address": name, "Port": 80}}])
+        name = url.split("/")[2].split(":")[0]
+        with lock:
+            probes[name] += 1
+            n = probes[name]
+        host = f"h{n % 2}" if name == "service-b" else "h"
+        return make_resp(payload={"service": name, "timestamp": "2024-01-01 00:00:00.000", "host": host})
+
+    monkeypatch.setattr(gw.SESSION, "get", fake_get)
+    return probes
+
+
+def test_diff_services_reports_watched_fields_and_removals():
+    old = [{"service": "a", "status": "online", "host": "h1", "responseTime": 3, "timestamp": "t1"},
+           {"service": "b", "status": "online", "host": "h1", "responseTime": 3, "timestamp": "t1"},
+           {"service": "c", "status": "offline", "host": "N/A", "responseTime": None, "timestamp": "N/A"}]
+    new = [dict(old[0], timestamp="t2"),
+           dict(old[1], responseTime=9),
+           {"service": "d", "status": "online", "host": "h2", "responseTime": 1, "timestamp": "t2"}]
+
+    assert diff_services(old, new) == {"changed": [new[1], new[2]], "removed": [{"service": "c"}]}
+    assert diff_services(new, [dict(s) for s in new]) is None
+
+
+def test_diff_services_keys_rows_by_datacenter_and_service():
+    east = {"service": "a", "datacenter": "east", "status": "online", "host": "h1", "responseTime": 3}
+    west = dict(east, datacenter="west", host="h2", responseTime=8)
+    assert diff_services([east, west], [dict(east), dict(west)]) is None
+    assert diff_services([east, west], [east, dict(west, status="offline")]) == {
+        "changed": [dict(west, status="offline")], "removed": []}
+    assert diff_services([east, west], [east]) == {"changed": [], "removed": [{"service": "a", "datacenter": "west"}]}
+
+
+def test_500_subscribers_share_one_refresh_per_interval(monkeypatch, gw):
+    names = ["service-a", "service-b", "service-c"]
+    probes = fake_consul_and_backends(monkeypatch, gw, names)
+    stream = ServiceStream(gw.collect_services, interval=0.2)
+
+    subs = [QueueSubscriber(maxsize=100) for _ in range(500)]
+    started = time.monotonic()
+    snapshots = {stream.subscribe(sub) for sub in subs}
+    time.sleep(1.0)
+    elapsed = time.monotonic() - started
+    for sub in subs:
+        stream.unsubscribe(sub)
+
+    refreshes = stream.refreshes
+    assert 1 <= refreshes <= elapsed / 0.2 + 1
+    # Every backend is probed once per refresh, however many subscribers there are.
+    assert all(probes[name] in (refreshes, refreshes + 1) for name in names)
+
+    (snapshot,) = snapshots
+    event, data = parse_event(snapshot)
+    assert event == "snapshot" and [s["service"] for s in data] == names
+
+    # Only service-b changes between refreshes, and every subscriber sees the same diffs.
+    events = [list(sub.queue.queue) for sub in subs]
+    assert events[0] and all(e == events[0] for e in events)
+    for chunk in events[0]:
+        event, diff = parse_event(chunk)
+        assert event == "diff"
+        assert [s["service"] for s in diff["changed"]] == ["service-b"] and diff["removed"] == []
+
+
+def test_stream_stops_without_subscribers_and_drops_slow_ones():
+    calls = Counter()
+
+    def collect():
+        calls["n"] += 1
+        return [{"service": "a", "status": "online", "host": f"h{calls['n']}", "responseTime": 1}]
+
+    stream = ServiceStream(collect, interval=0.02)
+    slow = QueueSubscriber(maxsize=1)
+    stream.subscribe(slow)
+    deadline = time.monotonic() + 2
+    while not slow.closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert slow.closed and stream.subscribers == 0
+
+    time.sleep(0.1)
+    seen = calls["n"]
+    time.sleep(0.1)
+    assert calls["n"] == seen
+
+
+def test_flask_stream_sends_snapshot_then_diffs(monkeypatch, gw, client):
+    fake_consul_and_backends(monkeypatch, gw, ["service-a", "service-b"])
+    monkeypatch.setattr(gw, "STREAM", ServiceStream(gw.collect_services, interval=0.05))
+
+    resp = client.get("/services/stream", buffered=False)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/event-stream"
+    assert resp.headers["Cache-Control"] == "no-cache"
+    chunks = iter(resp.response)
+    event, data = parse_event(next(chunks))
+    assert event == "snapshot" and [s["service"] for s in data] == ["service-a", "service-b"]
+    event, diff = parse_event(next(chunks))
+    assert event == "diff" and [s["service"] for s in diff["changed"]] == ["service-b"]
+
+    resp.close()
+    assert gw.STREAM.subscribers == 0
+
+
+def test_asgi_stream_sends_snapshot_and_stops_on_disconnect(monkeypatch, gw, agw):
+    fake_consul_and_backends(monkeypatch, gw, ["service-a", "service-b"])
+    monkeypatch.setattr(gw, "STREAM", ServiceStream(gw.collect_services, interval=0.05))
+
+    async def main():
+        sent = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if len(sent) == 3:
+                disconnected.set()
+
+        await asyncio.wait_for(
+            agw.app({"type": "http", "method": "GET", "path": "/services/stream", "headers": []}, receive, send), 5)
+        return sent
+
+    sent = asyncio.run(main())
+    assert dict(sent[0]["headers"])[b"content-type"].startswith(b"text/event-stream")
+    assert parse_event(sent[1]["body"])[0] == "snapshot"
+    assert parse_event(sent[2]["body"])[0] == "diff"
+    assert sent[-1] == {"type": "http.response.body", "body": b""}
+    assert gw.STREAM.subscribers == 0
+
+
+def test_flask_streams_are_capped_and_release_their_slot(monkeypatch, gw, client):
+    fake_consul_and_backends(monkeypatch, gw, ["service-a"])
+    monkeypatch.setattr(gw, "STREAM", ServiceStream(gw.collect_services, interval=0.05))
+    monkeypatch.setattr(gw, "STREAM_SLOTS", threading.BoundedSemaphore(1))
+
+    first = client.get("/services/stream", buffered=False)
+    assert first.status_code == 200
+    refused = client.get("/services/stream")
+    assert refused.status_code == 503 and refused.headers["Retry-After"]
+    first.close()
+    assert gw.STREAM.subscribers == 0
+    second = client.get("/services/stream", buffered=False)
+    assert second.status_code == 200
+    second.close()
+
+
+def test_probes_answer_while_streams_hold_gunicorn_threads():
+    port = free_port()
+    with FakeConsul() as consul:
+        host, consul_port = consul.url.rsplit("//", 1)[1].split(":")
+        env = dict(os.environ, SERVE_MODE="prod", WEB_WORKERS="1", WEB_THREADS="2", CONSUL_HOST=host,
+                   CONSUL_PORT=consul_port, STREAM_INTERVAL="0.5", STREAM_KEEPALIVE="0.5", DRAIN_TIMEOUT="1")
+        script = ("import gateway.app as gw; from common.serving import serve; "
+                  f"serve(gw.app, '127.0.0.1', {port}, workers=1, threads=gw.GATEWAY_THREADS)")
+        proc = subprocess.Popen([sys.executable, "-c", script], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        streams = []
+        try:
+            deadline = time.monotonic() + 15
+            while True:
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}/livez", timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        pytest.fail("gateway never came up")
+                    time.sleep(0.1)
+
+            # Two dashboards with two threads: the second stream is turned away, not queued.
+            statuses = []
+            for _ in range(2):
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                conn.request("GET", "/services/stream")
+                statuses.append(conn.getresponse().status)
+                streams.append(conn)
+            assert statuses == [200, 503]
+            for path in ("/livez", "/readyz", "/services"):
+                try:
+                    urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=2).close()
+                except urllib.error.HTTPError:
+                    pass  # /readyz may be 503; it answered.
+        finally:
+            for conn in streams:
+                conn.close()
+            proc.terminate()
+            proc.wait(timeout=10)
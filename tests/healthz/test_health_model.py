@@ -0,0 +1,153 @@
+import tracemalloc
+
+import pytest
+
+from common.consul import ConsulClient
+from healthz.model import HEALTHY, UNHEALTHY, HealthModel
+from testing.fake_consul import FakeConsul
+from testing.helpers import wait_until
+
+
+@pytest.fixture()
+def consul():
+    with FakeConsul() as fake:
+        yield fake
+
+
+@pytest.fixture()
+def model(consul):
+    m = HealthModel(ConsulClient(consul.url), wait="5s")
+    yield m
+    m.stop()
+
+
+def test_model_follows_consul_and_serves_deltas(consul, model):
+    consul.register("service-a", "10.0.0.1", 5000, service_id="a1")
+    consul.register("service-b", "10.0.0.2", 5000, service_id="b1", status="critical")
+    consul.register("consul", "10.0.0.9", 8300)
+    model.start()
+    assert wait_until(lambda: model.ready and model.version)
+
+    first, results = model.report()
+    assert results == [{"name": "service-a", "status": HEALTHY}, {"name": "service-b", "status": UNHEALTHY}]
+    assert model.delta(0)["changed"] == results
+    assert model.delta(first) == {"version": first, "changed": [], "removed": []}
+
+    consul.set_status("a1", "critical")
+    assert wait_until(lambda: model.version > first)
+    second = model.version
+    assert model.delta(first) == {"version": second, "changed": [{"name": "service-a", "status": UNHEALTHY}],
+                                  "removed": []}
+
+    consul.set_status("a1", "passing")
+    consul.deregister("b1")
+    assert wait_until(lambda: model.report()[1] == [{"name": "service-a", "status": HEALTHY}])
+    delta = model.delta(second)
+    assert delta["changed"] == [{"name": "service-a", "status": HEALTHY}] and delta["removed"] == ["service-b"]
+    # A version from the future (another process, a restart) gets everything again.
+    assert model.delta(delta["version"] + 1000)["changed"] == [{"name": "service-a", "status": HEALTHY}]
+
+    flips = [(e["name"], e["from"], e["to"]) for e in model.events()]
+    assert flips == [("service-a", HEALTHY, UNHEALTHY), ("service-a", UNHEALTHY, HEALTHY)]
+    assert model.events(since=second) == model.events()[1:]
+    assert model.events(limit=1) == model.events()[-1:]
+
+
+def test_report_and_events_endpoints(monkeypatch, consul, model, hz, client):
+    monkeypatch.setattr(hz, "MODEL", model)
+    consul.register("service-a", "10.0.0.1", 5000, service_id="a1")
+    consul.register("service-b", "10.0.0.2", 5000, service_id="b1")
+    # Before the first sync /report still answers, by polling Consul.
+    monkeypatch.setattr(hz, "CONSUL", ConsulClient(consul.url))
+    assert client.get("/report?since=0").get_json()["version"] == 0
+
+    model.start()
+    assert wait_until(lambda: model.ready and model.version)
+    resp = client.get("/report")
+    version = int(resp.headers["X-Health-Version"])
+    assert resp.get_json() == [{"name": "service-a", "status": "healthy"}, {"name": "service-b", "status": "healthy"}]
+
+    consul.set_status("b1", "critical")
+    assert wait_until(lambda: model.version > version)
+    assert client.get(f"/report?since={version}").get_json() == {
+        "version": model.version, "changed": [{"name": "service-b", "status": "unhealthy"}], "removed": []}
+    events = client.get("/events").get_json()
+    assert events["version"] == model.version
+    assert [(e["name"], e["from"], e["to"]) for e in events["events"]] == [("service-b", "healthy", "unhealthy")]
+    assert client.get(f"/events?since={model.version}").get_json()["events"] == []
+
+
+def test_report_negotiates_compression_and_msgpack(monkeypatch, consul, model, hz, client):
+    import gzip
+    import msgpack
+    from common.encoding import rows
+
+    monkeypatch.setattr(hz, "MODEL", model)
+    for i in range(100):
+        consul.register(f"service-{i:03d}", "10.0.0.1", 5000 + i, service_id=f"s{i}")
+    model.start()
+    assert wait_until(lambda: model.ready and len(model.report()[1]) == 100)
+
+    plain = client.get("/report")
+    gz = client.get("/report", headers={"Accept-Encoding": "gzip"})
+    assert gz.headers["Content-Encoding"] == "gzip" and gzip.decompress(gz.data) == plain.data
+    assert gz.headers["X-Health-Version"] == plain.headers["X-Health-Version"]
+    packed = client.get("/report", headers={"Accept": "application/msgpack"})
+    assert rows(msgpack.unpackb(packed.data)) == plain.get_json()
+    # Deltas are not rows, so they stay JSON.
+    delta = client.get("/report?since=0", headers={"Accept": "application/msgpack"})
+    assert delta.headers["Content-Type"] == "application/json" and len(delta.get_json()["changed"]) == 100
+
+
+def test_removed_names_are_forgotten_and_old_clients_told_to_resync():
+    model = HealthModel(consul=None, max_events=2, max_removed=2)
+    model.update({f"service-{i}": HEALTHY for i in range(5)})
+    start = model.version
+    for i in range(4, 0, -1):
+        model.update({f"service-{j}": HEALTHY for j in range(i)})
+
+    assert len(model._changed) == 1 + 2
+    assert model.delta(model.version - 2) == {"version": model.version, "changed": [],
+                                              "removed": ["service-1", "service-2"]}
+    full = model.delta(start)
+    assert full["resync"] is True and full["removed"] == ["service-1", "service-2"]
+    assert full["changed"] == [{"name": "service-0", "status": HEALTHY}]
+
+    for status in (UNHEALTHY, HEALTHY, UNHEALTHY):
+        model.update({"service-0": status})
+    assert not model.missed(model.version - 2) and model.missed(model.version - 3)
+
+
+def test_events_endpoint_flags_transitions_that_left_the_log(monkeypatch, hz, client):
+    monkeypatch.setattr(hz, "MODEL", HealthModel(consul=None, max_events=2))
+    for status in (HEALTHY, UNHEALTHY, HEALTHY):
+        hz.MODEL.update({"service-a": status})
+    assert "resync" not in client.get("/events").get_json()
+    hz.MODEL.update({"service-a": UNHEALTHY})
+    assert client.get("/events").get_json()["resync"] is True
+    assert "resync" not in client.get(f"/events?since={hz.MODEL.version - 2}").get_json()
+
+
+def test_memory_stays_bounded_with_10k_services_and_1m_transitions():
+    names = [f"service-{i:05d}" for i in range(10_000)]
+    up = dict.fromkeys(names, HEALTHY)
+    down = dict.fromkeys(names, UNHEALTHY)
+
+    tracemalloc.start()
+    try:
+        model = HealthModel(consul=None, max_events=10_000)
+        model.update(up)
+        # One round of flips fills the ring buffer; the next hundred only replace its contents.
+        model.update(down)
+        full = tracemalloc.get_traced_memory()[0]
+        for round_ in range(100):
+            model.update(up if round_ % 2 == 0 else down)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    assert model.version == 102 and len(model._events) == 10_000
+    assert len(model.events(since=model.version - 1)) == 10_000
+    assert model.delta(model.version - 1)["changed"][0] == {"name": "service-00000", "status": UNHEALTHY}
+    assert after - full < 64 * 1024, after - full
+    assert after < 4 * 1024 * 1024, after
@@ -1,6 +1,7 @@
 from types import SimpleNamespace
 import json
 import pytest
+import requests
 
 
 def test_health_endpoint_ok(client):
@@ -10,6 +11,7 @@ def test_health_endpoint_ok(client):
 
 
 def test_report_filters_consul_and_sets_statuses(monkeypatch, hz, client):
+    monkeypatch.setattr(hz, "REPORT_MODE", "per-service")
     # Build fake responses for Consul endpoints
     CATALOG_URL = hz.CATALOG_SERVICES
 
@@ -69,6 +71,7 @@ def test_report_filters_consul_and_sets_statuses(monkeypatch, hz, client):
 
 
 def test_report_marks_unhealthy_on_exception(monkeypatch, hz, client):
+    monkeypatch.setattr(hz, "REPORT_MODE", "per-service")
     # CATALOG returns two services; health endpoint for one raises
     def fake_get(url, timeout):
         if url == hz.CATALOG_SERVICES:
@@ -104,17 +107,82 @@ def test_report_handles_catalog_failure(monkeypatch, hz, client):
     assert resp.get_json() == []
 
 
+def test_report_bulk_uses_single_health_call(monkeypatch, hz, client):
+    calls = []
+
+    def fake_get(url, timeout):
+        calls.append(url)
+        if url == hz.CATALOG_SERVICES:
+            return SimpleNamespace(
+                json=lambda: {"consul": [], "service-a": [], "service-b": [], "service-c": [], "service-d": []},
+                raise_for_status=lambda: None,
+            )
+        if url == hz.HEALTH_STATE_ANY:
+            checks = [
+                {"Node": "n1", "CheckID": "serfHealth", "Status": "passing", "ServiceID": "", "ServiceName": ""},
+                {"Node": "n2", "CheckID": "serfHealth", "Status": "passing", "ServiceID": "", "ServiceName": ""},
+                {"Node": "n2", "CheckID": "node-disk", "Status": "critical", "ServiceID": "", "ServiceName": ""},
+                # service-a: one failing and one passing instance -> healthy
+                {"Node": "n1", "CheckID": "service:a1", "Status": "critical", "ServiceID": "a1", "ServiceName": "service-a"},
+                {"Node": "n1", "CheckID": "service:a2", "Status": "passing", "ServiceID": "a2", "ServiceName": "service-a"},
+                # service-b: passing service check on a node with a failing node check -> unhealthy
+                {"Node": "n2", "CheckID": "service:b", "Status": "passing", "ServiceID": "b", "ServiceName": "service-b"},
+                # service-c: warning is not passing
+                {"Node": "n1", "CheckID": "service:c", "Status": "warning", "ServiceID": "c", "ServiceName": "service-c"},
+                # service-d has no checks at all
+            ]
+            return SimpleNamespace(json=lambda: checks, raise_for_status=lambda: None)
+        raise AssertionError(f"Unexpected GET {url}")
+
+    monkeypatch.setattr(hz.SESSION, "get", fake_get)
+
+    resp = client.get("/report")
+    assert resp.get_json() == [
+        {"name": "service-a", "status": "healthy"},
+        {"name": "service-b", "status": "unhealthy"},
+        {"name": "service-c", "status": "unhealthy"},
+        {"name": "service-d", "status": "unhealthy"},
+    ]
+    assert calls == [hz.CATALOG_SERVICES, hz.HEALTH_STATE_ANY]
+
+
+def test_report_is_cached_within_ttl(monkeypatch, hz, client):
+    calls = []
+
+    def fake_get(url, timeout):
+        calls.append(url)
+        if url == hz.CATALOG_SERVICES:
+            return SimpleNamespace(json=lambda: {"service-a": []}, raise_for_status=lambda: None)
+        return SimpleNamespace(json=lambda: [], raise_for_status=lambda: None)
+
+    monkeypatch.setattr(hz.SESSION, "get", fake_get)
+    monkeypatch.setattr(hz, "REPORT_CACHE_TTL", 60.0)
+
+    first = client.get("/report").get_json()
+    for _ in range(5):
+        assert client.get("/report").get_json() == first
+    assert len(calls) == 2
+
+    monkeypatch.setattr(hz, "REPORT_CACHE_TTL", 0.0)
+    client.get("/report")
+    assert len(calls) == 4
+
+
 def test_register_with_consul_sends_expected_payload(monkeypatch, hz):
     captured = {}
 
-    def fake_put(url, json=None, timeout=None):
+    def fake_put(session, url, json=None, timeout=None):
         captured["url"] = url
         captured["json"] = json
         captured["timeout"] = timeout
         # Simulate success (even though register ignores response)
         return SimpleNamespace(status_code=200, text="OK")
 
-    monkeypatch.setattr(hz.SESSION, "put", fake_put)
+    def shared_put(*args, **kwargs):
+        raise AssertionError("registration must not use the workers' session")
+
+    monkeypatch.setattr(requests.Session, "put", fake_put)
+    monkeypatch.setattr(hz.SESSION, "put", shared_put)
 
     hz.register_with_consul()
 
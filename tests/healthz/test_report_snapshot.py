@@ -0,0 +1,88 @@
+import importlib
+import sys
+import time
+
+import pytest
+
+from testing.fake_consul import FakeConsul
+from testing.helpers import free_port
+
+
+def restart(monkeypatch, path, consul_port, **env):
+    """A fresh healthz process, as far as module state goes."""
+    env = dict(BIND_HOST="127.0.0.1", CONSUL_HOST="127.0.0.1", CONSUL_PORT=consul_port, SNAPSHOT_PATH=path,
+               SNAPSHOT_INTERVAL="0", REPORT_CACHE_TTL="0", **env)
+    for k, v in env.items():
+        monkeypatch.setenv(k, str(v))
+    sys.modules.pop("healthz.app", None)
+    return importlib.import_module("healthz.app")
+
+
+@pytest.fixture()
+def consul():
+    with FakeConsul() as fake:
+        fake.register("service-a", "10.0.0.1", 5000)
+        fake.register("service-b", "10.0.0.2", 5000, status="critical")
+        yield fake
+
+
+def test_consul_outage_serves_last_known_good(monkeypatch, tmp_path, consul):
+    path = tmp_path / "healthz.snap"
+    hz = restart(monkeypatch, path, consul.url.rsplit(":", 1)[1])
+    assert hz.LAST_GOOD is None
+    hz.MODEL.start()
+    try:
+        client = hz.app.test_client()
+        deadline = time.monotonic() + 3
+        while not hz.SNAPSHOT_STORE.writes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        hz.SNAPSHOT_STORE.flush()
+        assert client.get("/report").get_json() == [{"name": "service-a", "status": "healthy"},
+                                                    {"name": "service-b", "status": "unhealthy"}]
+    finally:
+        hz.MODEL.stop()
+
+    # Restarted while Consul is unreachable, with or without the watches.
+    dead_port = free_port()
+    expected = [{"name": "service-a", "status": "healthy", "stale": True},
+                {"name": "service-b", "status": "unhealthy", "stale": True}]
+    for watch in ("1", "0"):
+        hz = restart(monkeypatch, path, dead_port, HEALTH_WATCH=watch)
+        client = hz.app.test_client()
+        assert client.get("/report").get_json() == expected
+        delta = client.get("/report?since=0").get_json()
+        assert delta == {"version": 0, "changed": expected, "removed": [], "stale": True}
+
+
+def test_synced_model_is_marked_stale_when_consul_goes_quiet(monkeypatch, tmp_path):
+    path = tmp_path / "healthz.snap"
+    hz = restart(monkeypatch, path, free_port(), HEALTH_WATCH="0")
+    hz.MODEL.update({"service-a": "healthy"}, version=5)
+    hz.SNAPSHOT_STORE.flush()
+
+    hz = restart(monkeypatch, path, free_port())
+    assert dict(hz.LAST_GOOD) == {"service-a": "healthy"} and hz.LAST_GOOD.meta["version"] == 5
+    monkeypatch.setattr(hz.MODEL, "_names", ["service-a"])
+    monkeypatch.setattr(hz.MODEL, "_healthy", {"service-a"})
+    hz.MODEL.update({"service-a": "healthy"}, version=6)
+    client = hz.app.test_client()
+
+    monkeypatch.setattr(hz.MODEL, "last_sync", time.monotonic())
+    assert client.get("/report").get_json() == [{"name": "service-a", "status": "healthy"}]
+    monkeypatch.setattr(hz.MODEL, "last_sync", time.monotonic() - hz.SNAPSHOT_STALE_AFTER - 1)
+    resp = client.get("/report")
+    assert resp.get_json() == [{"name": "service-a", "status": "healthy", "stale": True}]
+    assert resp.headers["X-Health-Version"] == "6"
+    assert client.get("/report?since=0").get_json() == {
+        "version": 6, "changed": [{"name": "service-a", "status": "healthy", "stale": True}], "removed": [],
+        "stale": True}
+
+
+def test_model_is_marked_stale_without_a_snapshot_file(monkeypatch):
+    hz = restart(monkeypatch, "", free_port())
+    assert hz.LAST_GOOD is None
+    monkeypatch.setattr(hz.MODEL, "_names", ["service-a"])
+    monkeypatch.setattr(hz.MODEL, "_healthy", {"service-a"})
+    hz.MODEL.update({"service-a": "healthy"})
+    monkeypatch.setattr(hz.MODEL, "last_sync", time.monotonic() - hz.SNAPSHOT_STALE_AFTER - 1)
+    assert hz.app.test_client().get("/report").get_json() == [{"name": "service-a", "status": "healthy", "stale": True}]
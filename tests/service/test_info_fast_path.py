@@ -0,0 +1,41 @@
+import importlib
+import socket
+import sys
+from datetime import datetime
+
+from flask import jsonify
+
+
+def legacy_info(svc, ms):
+    """The original jsonify handler, evaluated at ``ms`` milliseconds past the epoch."""
+    now = datetime.fromtimestamp(ms // 1000).replace(microsecond=ms % 1000 * 1000)
+    with svc.app.app_context():
+        return jsonify({
+            "service": svc.SERVICE_NAME,
+            "timestamp": now.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            "host": svc.socket.gethostname()
+        }).get_data()
+
+
+def info_at(svc, client, monkeypatch, ms):
+    monkeypatch.setattr(svc.time, "time_ns", lambda: ms * 1_000_000 + 456_789)
+    return client.get("/info")
+
+
+def test_info_bytes_match_jsonify_across_ticks(svc, client, monkeypatch):
+    base = 1_700_000_000_998
+    # Same millisecond, next millisecond, a new second, and a jump back (clock step).
+    for ms in (base, base, base + 1, base + 2, base + 1003, base - 60_000):
+        resp = info_at(svc, client, monkeypatch, ms)
+        assert resp.get_data() == legacy_info(svc, ms)
+        assert resp.mimetype == "application/json"
+
+
+def test_info_escapes_like_jsonify(monkeypatch):
+    monkeypatch.setattr(socket, "gethostname", lambda: "pod-\u00fc")
+    monkeypatch.setenv("SERVICE_NAME", 'svc-\u00e9"\\')
+    sys.modules.pop("service.app", None)
+    svc = importlib.import_module("service.app")
+    resp = info_at(svc, svc.app.test_client(), monkeypatch, 1_700_000_000_042)
+    assert resp.get_data() == legacy_info(svc, 1_700_000_000_042)
+    assert b'"host":"pod-\\u00fc","service":"svc-\\u00e9\\"\\\\"' in resp.get_data()
@@ -0,0 +1,119 @@
+import importlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from testing.fake_consul import FakeConsul
+from testing.helpers import free_port, wait_until
+
+
+@pytest.fixture()
+def consul():
+    # Instances only pass once their /info answers, as with a real agent.
+    with FakeConsul(http_checks=True) as fake:
+        yield fake
+
+
+@pytest.fixture()
+def gw(monkeypatch, consul):
+    host, port = consul.url.rsplit("//", 1)[1].split(":")
+    for k, v in {"BIND_HOST": "127.0.0.1", "CONSUL_HOST": host, "CONSUL_PORT": port,
+                 "CATALOG_WATCH_WAIT": "5s"}.items():
+        monkeypatch.setenv(k, v)
+    sys.modules.pop("gateway.app", None)
+    gw = importlib.import_module("gateway.app")
+    gw.WATCHER.start()
+    yield gw
+    gw.WATCHER.stop()
+
+
+def start_pod(consul, n):
+    """One replica of service-a, as a Kubernetes pod would run it.
+
+    gunicorn waits out DRAIN_TIMEOUT while the gateway holds an idle keep-alive
+    connection, so it is kept short here.
+    """
+    host, consul_port = consul.url.rsplit("//", 1)[1].split(":")
+    port = free_port()
+    env = dict(os.environ, SERVE_MODE="prod", WEB_WORKERS="1", SERVICE_NAME="service-a",
+               SERVICE_ID=f"service-a-{n}", SERVICE_ADDRESS="127.0.0.1", SERVICE_PORT=str(port),
+               BIND_HOST="127.0.0.1", CONSUL_HOST=host, CONSUL_PORT=consul_port,
+               DRAIN_DELAY="0.3", DRAIN_TIMEOUT="1")
+    proc = subprocess.Popen([sys.executable, "-m", "service.app"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc, port
+
+
+def test_rolling_restart_never_probes_deregistered_instances(monkeypatch, consul, gw):
+    # When each instance left Consul, by port.
+    deregistered = {}
+    ports = {}
+    deregister = consul.deregister
+
+    def recording_deregister(service_id):
+        deregistered[ports[service_id]] = time.monotonic()
+        return deregister(service_id)
+
+    monkeypatch.setattr(consul, "deregister", recording_deregister)
+
+    probes = []
+    get = gw.SESSION.get
+
+    def recording_get(url, timeout):
+        if url.endswith("/info"):
+            probes.append((time.monotonic(), int(url.rsplit(":", 1)[1].split("/")[0])))
+        return get(url, timeout=timeout)
+
+    monkeypatch.setattr(gw.SESSION, "get", recording_get)
+
+    def instances():
+        snap = gw.WATCHER.snapshot()
+        return {port for _, port in (snap.instances.get("service-a") or ())} if snap else set()
+
+    pods = []
+    try:
+        for n in (1, 2):
+            proc, port = start_pod(consul, n)
+            ports[f"service-a-{n}"] = port
+            pods.append((proc, port))
+        assert wait_until(lambda: instances() == {port for _, port in pods}, timeout=15)
+
+        results, done = [], threading.Event()
+
+        def load():
+            while not done.is_set():
+                results.extend(gw.collect_services())
+                time.sleep(0.01)
+
+        loader = threading.Thread(target=load, daemon=True)
+        loader.start()
+
+        # Replace each replica: start the new one, wait until it is in rotation, stop the old one.
+        for n in (3, 4):
+            proc, port = start_pod(consul, n)
+            ports[f"service-a-{n}"] = port
+            assert wait_until(lambda: port in instances(), timeout=15)
+            old, old_port = pods.pop(0)
+            pods.append((proc, port))
+            old.send_signal(signal.SIGTERM)
+            assert old.wait(timeout=15) == 0
+            assert old_port in deregistered and old_port not in instances()
+        time.sleep(0.2)
+        done.set()
+        loader.join(5)
+    finally:
+        for proc, _ in pods:
+            proc.kill()
+            proc.wait()
+
+    assert len(deregistered) == 2 and consul.requests["/v1/agent/service/maintenance/service-a-1"] == 1
+    late = [(t, port) for t, port in probes if port in deregistered and t >= deregistered[port]]
+    assert probes and not late
+    # Draining instances kept answering until they were out of rotation.
+    assert results and all(r["status"] == "online" for r in results)
+    assert {r["responseTime"] is not None for r in results} == {True}
@@ -91,6 +91,8 @@ def test_ensure_registration_exponential_backoff(monkeypatch, svc):
 
     monkeypatch.setattr(svc.SESSION, "put", fake_put)
     monkeypatch.setattr(svc.time, "sleep", fake_sleep)
+    # Take the top of each jittered range.
+    monkeypatch.setattr(svc.random, "uniform", lambda low, high: high)
 
     svc.ensure_registration()
 
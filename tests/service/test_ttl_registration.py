@@ -0,0 +1,129 @@
+import importlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from testing.fake_consul import FakeConsul
+from testing.helpers import free_port, wait_until
+
+
+def load_service(monkeypatch, consul, **env):
+    host, port = consul.url.rsplit("//", 1)[1].split(":")
+    env = {"SERVICE_NAME": "service-a", "SERVICE_PORT": "5000", "BIND_HOST": "127.0.0.1",
+           "CONSUL_HOST": host, "CONSUL_PORT": port, "REGISTRATION_MODE": "ttl", **env}
+    for k, v in env.items():
+        monkeypatch.setenv(k, v)
+    sys.modules.pop("service.app", None)
+    return importlib.import_module("service.app")
+
+
+def passing(consul, name="service-a"):
+    return bool(requests.get(f"{consul.url}/v1/health/service/{name}?passing", timeout=2).json())
+
+
+@pytest.fixture()
+def consul():
+    with FakeConsul() as fake:
+        yield fake
+
+
+def test_ttl_payload_replaces_http_check(monkeypatch, consul):
+    svc = load_service(monkeypatch, consul, CHECK_TTL="20s")
+    assert svc.build_payload()["Check"] == {
+        "CheckID": "service:service-a", "TTL": "20s", "Status": "passing", "DeregisterCriticalServiceAfter": "10s"}
+    assert svc.CHECK_PASS_URL == f"{consul.url}/v1/agent/check/pass/service:service-a"
+
+
+def test_heartbeats_keep_ttl_check_passing_at_interval(monkeypatch, consul):
+    svc = load_service(monkeypatch, consul, HEARTBEAT_INTERVAL="0.1", CHECK_TTL="1s")
+    stop = threading.Event()
+    worker = threading.Thread(target=svc.heartbeat_forever, args=(stop,), daemon=True)
+    worker.start()
+    try:
+        assert wait_until(lambda: len(consul.heartbeats) >= 6, timeout=5)
+    finally:
+        stop.set()
+        worker.join(2)
+
+    assert consul.requests["/v1/agent/service/register"] == 1
+    assert passing(consul)
+    times = [t for _, t in consul.heartbeats]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert all(0.08 <= gap <= 0.3 for gap in gaps), gaps
+    # Nothing polls /info in this mode; the check goes critical once heartbeats stop.
+    consul._services["service-a"]["ExpiresAt"] = time.monotonic()
+    assert not passing(consul)
+
+
+def test_reregisters_after_agent_restart(monkeypatch, consul):
+    svc = load_service(monkeypatch, consul, HEARTBEAT_INTERVAL="0.05")
+    # Keep the backoff short; the jittered range is covered below.
+    delays = []
+    monkeypatch.setattr(svc.random, "uniform", lambda low, high: delays.append((low, high)) or 0.05)
+    stop = threading.Event()
+    worker = threading.Thread(target=svc.heartbeat_forever, args=(stop,), daemon=True)
+    worker.start()
+    try:
+        assert wait_until(lambda: len(consul.heartbeats) >= 2, timeout=5)
+        port = int(consul.url.rsplit(":", 1)[1])
+        consul.stop()
+        # The agent is down for a while, then comes back empty.
+        time.sleep(0.3)
+        with FakeConsul(port=port) as restarted:
+            assert wait_until(lambda: len(restarted.heartbeats) >= 2, timeout=5)
+            assert restarted.requests["/v1/agent/service/register"] == 1
+            assert passing(restarted)
+    finally:
+        stop.set()
+        worker.join(2)
+
+    assert delays and delays[0] == (2 * (1 - svc.REGISTER_JITTER), 2)
+    assert all(high <= 30 for _, high in delays)
+
+
+def test_unknown_check_triggers_reregistration(monkeypatch, consul):
+    svc = load_service(monkeypatch, consul, HEARTBEAT_INTERVAL="0.05")
+    stop = threading.Event()
+    worker = threading.Thread(target=svc.heartbeat_forever, args=(stop,), daemon=True)
+    worker.start()
+    try:
+        assert wait_until(lambda: len(consul.heartbeats) >= 1, timeout=5)
+        # The agent forgot the service (e.g. anti-entropy after a restart with lost state).
+        consul.deregister("service-a")
+        assert wait_until(lambda: consul.requests["/v1/agent/service/register"] == 2, timeout=5)
+        assert wait_until(lambda: passing(consul), timeout=5)
+    finally:
+        stop.set()
+        worker.join(2)
+
+
+@pytest.mark.parametrize("mode", ["dev", "prod"])
+def test_sigterm_deregisters(consul, mode):
+    host, consul_port = consul.url.rsplit("//", 1)[1].split(":")
+    env = dict(os.environ, SERVE_MODE=mode, WEB_WORKERS="2", SERVICE_NAME="service-a",
+               SERVICE_PORT=str(free_port()), BIND_HOST="127.0.0.1", CONSUL_HOST=host, CONSUL_PORT=consul_port,
+               REGISTRATION_MODE="ttl", HEARTBEAT_INTERVAL="0.1", DRAIN_DELAY="1")
+    proc = subprocess.Popen([sys.executable, "-m", "service.app"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        assert wait_until(lambda: len(consul.heartbeats) >= 2, timeout=15)
+        # Let the server finish starting so SIGTERM hits its handler, not the import.
+        time.sleep(0.5)
+        proc.send_signal(signal.SIGTERM)
+        assert wait_until(lambda: consul.requests["/v1/agent/service/maintenance/service-a"] == 1, timeout=5)
+        # Still answering while it waits out DRAIN_DELAY for watchers to drop it.
+        assert requests.get(f"http://127.0.0.1:{env['SERVICE_PORT']}/info", timeout=2).status_code == 200
+        assert proc.poll() is None
+        proc.wait(timeout=15)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+    assert consul.requests["/v1/agent/service/maintenance/service-a"] == 1
+    assert consul.requests["/v1/agent/service/deregister/service-a"] == 1
+    assert consul.catalog_services() == {}